@@ -0,0 +1,24 @@
+-- Gerado por src/data/rules.py a partir da regra 'cid_dicionario': CIDs codificados no Enum do CID-10 (fora do dicionário → nulo)
+-- O teste passa se esta consulta retornar 0 linhas.
+
+SELECT "N_AIH", 'DIAG_PRINC' AS coluna
+FROM {{ source('public', 'internacoes') }}
+WHERE "DIAG_PRINC" IS NOT NULL AND "DIAG_PRINC" NOT IN (SELECT "CID" FROM {{ source('public', 'cid10') }})
+
+UNION ALL
+
+SELECT "N_AIH", 'DIAG_SECUN' AS coluna
+FROM {{ source('public', 'diagnosticos') }}
+WHERE "DIAG_SECUN" IS NOT NULL AND "DIAG_SECUN" NOT IN (SELECT "CID" FROM {{ source('public', 'cid10') }})
+
+UNION ALL
+
+SELECT "N_AIH", 'CID_NOTIF' AS coluna
+FROM {{ source('public', 'notificacoes') }}
+WHERE "CID_NOTIF" IS NOT NULL AND "CID_NOTIF" NOT IN (SELECT "CID" FROM {{ source('public', 'cid10') }})
+
+UNION ALL
+
+SELECT "N_AIH", 'CID_MORTE' AS coluna
+FROM {{ source('public', 'mortes') }}
+WHERE "CID_MORTE" IS NOT NULL AND "CID_MORTE" NOT IN (SELECT "CID" FROM {{ source('public', 'cid10') }})
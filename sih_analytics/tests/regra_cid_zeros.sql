@@ -0,0 +1,24 @@
+-- Gerado por src/data/rules.py a partir da regra 'cid_zeros': CIDs em maiúsculas; vazio, nulo ou só zeros → '0'
+-- O teste passa se esta consulta retornar 0 linhas.
+
+SELECT "N_AIH", 'DIAG_PRINC' AS coluna
+FROM {{ source('public', 'internacoes') }}
+WHERE "DIAG_PRINC" <> UPPER(TRIM("DIAG_PRINC")) OR ("DIAG_PRINC" ~ '^0+$' AND "DIAG_PRINC" <> '0')
+
+UNION ALL
+
+SELECT "N_AIH", 'DIAG_SECUN' AS coluna
+FROM {{ source('public', 'diagnosticos') }}
+WHERE "DIAG_SECUN" <> UPPER(TRIM("DIAG_SECUN")) OR ("DIAG_SECUN" ~ '^0+$' AND "DIAG_SECUN" <> '0')
+
+UNION ALL
+
+SELECT "N_AIH", 'CID_NOTIF' AS coluna
+FROM {{ source('public', 'notificacoes') }}
+WHERE "CID_NOTIF" <> UPPER(TRIM("CID_NOTIF")) OR ("CID_NOTIF" ~ '^0+$' AND "CID_NOTIF" <> '0')
+
+UNION ALL
+
+SELECT "N_AIH", 'CID_MORTE' AS coluna
+FROM {{ source('public', 'mortes') }}
+WHERE "CID_MORTE" <> UPPER(TRIM("CID_MORTE")) OR ("CID_MORTE" ~ '^0+$' AND "CID_MORTE" <> '0')
@@ -0,0 +1,6 @@
+-- Gerado por src/data/rules.py a partir da regra 'dias_perm': DIAS_PERM = DT_SAIDA - DT_INTER
+-- O teste passa se esta consulta retornar 0 linhas.
+
+SELECT "N_AIH", 'DIAS_PERM' AS coluna
+FROM {{ source('public', 'internacoes') }}
+WHERE "DT_INTER" IS NOT NULL AND "DT_SAIDA" IS NOT NULL AND "DIAS_PERM" <> ("DT_SAIDA" - "DT_INTER")
@@ -0,0 +1,6 @@
+-- Gerado por src/data/rules.py a partir da regra 'etnia_limites': ETNIA em [0, 264]
+-- O teste passa se esta consulta retornar 0 linhas.
+
+SELECT "N_AIH", 'ETNIA' AS coluna
+FROM {{ source('public', 'etnia') }}
+WHERE "ETNIA" < 0 OR "ETNIA" > 264
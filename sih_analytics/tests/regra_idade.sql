@@ -0,0 +1,14 @@
+-- Gerado por src/data/rules.py a partir da regra 'idade': IDADE recalculada de NASC e DT_INTER, em [0, 150]
+-- O teste passa se esta consulta retornar 0 linhas.
+
+SELECT "N_AIH", 'IDADE' AS coluna
+FROM {{ source('public', 'internacoes') }}
+WHERE "DT_INTER" IS NOT NULL AND "NASC" IS NOT NULL AND "DT_INTER" > "NASC"
+    AND "IDADE" <> LEAST(GREATEST(
+        EXTRACT(YEAR FROM "DT_INTER") - EXTRACT(YEAR FROM "NASC") -
+        CASE
+            WHEN EXTRACT(MONTH FROM "DT_INTER") < EXTRACT(MONTH FROM "NASC") OR
+                 (EXTRACT(MONTH FROM "DT_INTER") = EXTRACT(MONTH FROM "NASC") AND
+                  EXTRACT(DAY FROM "DT_INTER") < EXTRACT(DAY FROM "NASC"))
+            THEN 1 ELSE 0
+        END, 0), 150)
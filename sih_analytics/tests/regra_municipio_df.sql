@@ -0,0 +1,12 @@
+-- Gerado por src/data/rules.py a partir da regra 'municipio_df': Municípios com 6 dígitos; DF colapsado em 530010
+-- O teste passa se esta consulta retornar 0 linhas.
+
+SELECT "N_AIH", 'MUNIC_RES' AS coluna
+FROM {{ source('public', 'internacoes') }}
+WHERE "MUNIC_RES" BETWEEN 530000 AND 539999 AND "MUNIC_RES" <> 530010
+
+UNION ALL
+
+SELECT "N_AIH", 'MUNIC_MOV' AS coluna
+FROM {{ source('public', 'internacoes') }}
+WHERE "MUNIC_MOV" BETWEEN 530000 AND 539999 AND "MUNIC_MOV" <> 530010
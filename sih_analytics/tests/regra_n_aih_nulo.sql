@@ -0,0 +1,6 @@
+-- Gerado por src/data/rules.py a partir da regra 'n_aih_nulo': Descarta registros sem N_AIH
+-- O teste passa se esta consulta retornar 0 linhas.
+
+SELECT "N_AIH", 'N_AIH' AS coluna
+FROM {{ source('public', 'internacoes') }}
+WHERE "N_AIH" IS NULL
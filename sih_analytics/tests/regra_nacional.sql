@@ -0,0 +1,6 @@
+-- Gerado por src/data/rules.py a partir da regra 'nacional': NACIONAL 0 → 10 (Brasil), limitado a [0, 350]
+-- O teste passa se esta consulta retornar 0 linhas.
+
+SELECT "N_AIH", 'NACIONAL' AS coluna
+FROM {{ source('public', 'internacoes') }}
+WHERE "NACIONAL" < 0 OR "NACIONAL" > 350
@@ -0,0 +1,6 @@
+-- Gerado por src/data/rules.py a partir da regra 'raca_etnia': RACA_COR = 5 (indígena) quando ETNIA é válida
+-- O teste passa se esta consulta retornar 0 linhas.
+
+SELECT "N_AIH", 'RACA_COR' AS coluna
+FROM {{ source('public', 'internacoes') }}
+WHERE "RACA_COR" <> 5 AND "N_AIH" IN (SELECT "N_AIH" FROM {{ source('public', 'etnia') }} WHERE "ETNIA" <> 0)
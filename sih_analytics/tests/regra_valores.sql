@@ -0,0 +1,24 @@
+-- Gerado por src/data/rules.py a partir da regra 'valores': Valores em texto → float não negativo (vírgula decimal)
+-- O teste passa se esta consulta retornar 0 linhas.
+
+SELECT "N_AIH", 'VAL_SH' AS coluna
+FROM {{ source('public', 'internacoes') }}
+WHERE "VAL_SH" < 0
+
+UNION ALL
+
+SELECT "N_AIH", 'VAL_SP' AS coluna
+FROM {{ source('public', 'internacoes') }}
+WHERE "VAL_SP" < 0
+
+UNION ALL
+
+SELECT "N_AIH", 'VAL_TOT' AS coluna
+FROM {{ source('public', 'internacoes') }}
+WHERE "VAL_TOT" < 0
+
+UNION ALL
+
+SELECT "N_AIH", 'VAL_UTI' AS coluna
+FROM {{ source('public', 'uti_detalhes') }}
+WHERE "VAL_UTI" < 0
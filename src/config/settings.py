@@ -3,7 +3,7 @@
 
 import os
 from pathlib import Path
-from typing import List, Tuple
+from typing import List, Optional, Tuple
 
 
 class Settings:
@@ -21,12 +21,28 @@ class Settings:
     PROCESSED_DIR = DATA_DIR / "processed"  
     SUPPORT_FILES_DIR = DATA_DIR / "support"        
     BACKUPS_DIR = DATA_DIR / "backups"      
+    DBC_DIR = DATA_DIR / "dbc"                      # Arquivos .dbc originais do FTP
       
 
 
     # === CONFIGURAÇÕES DO DATASUS ===
     # Estados de interesse
     UF_DEFAULT = ["RS"]
+
+    # Todas as UFs disponíveis no SIH (use UF_DEFAULT = UFS_BRASIL para a base nacional)
+    UFS_BRASIL = [
+        "AC", "AL", "AM", "AP", "BA", "CE", "DF", "ES", "GO", "MA", "MG", "MS", "MT", "PA",
+        "PB", "PE", "PI", "PR", "RJ", "RN", "RO", "RR", "RS", "SC", "SE", "SP", "TO",
+    ]
+
+    # Código IBGE de cada UF (também são os 2 primeiros dígitos do N_AIH)
+    CODIGOS_UF = {
+        "RO": 11, "AC": 12, "AM": 13, "RR": 14, "PA": 15, "AP": 16, "TO": 17,
+        "MA": 21, "PI": 22, "CE": 23, "RN": 24, "PB": 25, "PE": 26, "AL": 27, "SE": 28, "BA": 29,
+        "MG": 31, "ES": 32, "RJ": 33, "SP": 35,
+        "PR": 41, "SC": 42, "RS": 43,
+        "MS": 50, "MT": 51, "GO": 52, "DF": 53,
+    }
     
     # Período de dados
     ANOS_INICIO = 2008
@@ -35,6 +51,14 @@ class Settings:
     
     # Tipo de arquivo SIH
     TIPO_ARQUIVO = "RD"  # RD = Dados reduzidos
+
+    # === CONFIGURAÇÕES DE DOWNLOAD ===
+    DATASUS_FTP_HOST = "ftp.datasus.gov.br"
+    DOWNLOAD_WORKERS = 4          # Conexões FTP simultâneas
+    DOWNLOAD_TENTATIVAS = 4       # Tentativas por arquivo
+    DOWNLOAD_BACKOFF_SEG = 2.0    # Espera base entre tentativas (dobra a cada falha)
+    DOWNLOAD_MANIFEST_FILENAME = "download_manifest.json"
+    CONVERSAO_WORKERS = None      # Processos de conversão DBC → parquet (None = todos os núcleos)
     
     # === CONFIGURAÇÕES DE PROCESSAMENTO ===
     # Configurações do Polars
@@ -45,6 +69,41 @@ class Settings:
     
     # Tamanho de chunk para processamento em lotes
     CHUNK_SIZE = 1000
+
+    # Linhas por row group nos parquets gravados pelo pipeline
+    PARQUET_ROW_GROUP_SIZE = 100_000
+
+    # === PRÉ-PROCESSAMENTO ===
+    PREPROCESS_STREAMING = True   # Plano lazy único gravado com sink_parquet (sem chunks temporários)
+    PREPROCESS_MEMORIA_MB = 2048  # Orçamento dos chunks em voo (modo em chunks); com mais de uma thread, entradas maiores que ele não usam o streaming
+    PREPROCESS_PERFIS = ["tratado", "variavel_tipo"]  # Saídas gravadas a partir de uma única leitura
+    PREPROCESS_WORKERS = 1        # Processos do modo em chunks (PREPROCESS_STREAMING = False); 1 = sequencial
+    PREPROCESS_RETOMAR = True     # Modo em chunks: reaproveita os chunks já gravados por uma execução interrompida
+    PREPROCESS_ORDENAR = False    # Grava as saídas ordenadas por N_AIH (declarado nos metadados; habilita a contração sequencial)
+    PREPROCESS_QUARENTENA = False # Grava, na mesma passada, as linhas alteradas/descartadas pelas regras (sih_quarentena.parquet); custa uma projeção por regra (+27% de tempo em 3M linhas)
+    PREPROCESS_FUNDIR = False     # Contrai o perfil 'tratado' na mesma passada: grava sih_contraido + projeção, sem sih_tratado.parquet
+    PREPROCESS_PROJECAO_COLUNAS = ["N_AIH", "PROC_REA", "ID_FONTE", "COMPETENCIA", "ETNIA"]  # Lidas do tratado fora da contração (split_atendimentos, verificar_etnia)
+
+    # === CONTRAÇÃO POR N_AIH ===
+    CONTRACT_BUCKETS = 0          # Partições por hash de N_AIH (0 = automático pelo orçamento; 1 = tudo em memória)
+    CONTRACT_BUCKETS_MAX = 512    # Limite do modo automático (cada partição vira um arquivo aberto na passada de partição)
+    CONTRACT_ORDENADO = True      # Entrada ordenada por N_AIH (metadados): uma passada sequencial, memória constante
+    CONTRACT_CHUNK_SIZE = 1_000_000  # Linhas por chunk da contração sequencial
+    CONTRACT_INCREMENTAL = True   # Só contrai as competências novas e as combina com a contração existente
+    CONTRACT_MANIFEST_FILENAME = "_manifesto.json"  # Competências já contraídas (contraido/uf=XX)
+    CONTRACT_CONFLITOS_FILENAME = "conflitos.csv"   # AIHs com valores divergentes por coluna de first() (contraido/uf=XX)
+    CONTRACT_CONFLITOS_SEM_ORDEM = True   # Entrada não ordenada: ordena por N_AIH para calcular CONFLITOS (~1,6x tempo); False deixa a coluna nula
+    CONTRACT_WORKERS = 1          # Processos que contraem as partições em paralelo
+    CONTRACT_MEMORIA_MB = 4096    # Orçamento de memória da contração (define as partições no modo automático)
+
+    # === EXECUÇÃO PARALELA POR UF ===
+    MEMORIA_MAX_GB = 24           # Orçamento global de memória para as UFs em execução
+    WORKERS_UF = None             # Máximo de UFs simultâneas (None = todos os núcleos)
+    BYTES_POR_REGISTRO = 1_000    # Pico estimado de memória por registro em uma etapa
+
+    # === GOVERNADOR DE MEMÓRIA (data/memoria.py) ===
+    MEMORIA_FRACAO_ALVO = 0.75    # Fração da RAM da máquina que os chunks/lotes adaptativos procuram não ultrapassar
+    METRICAS_DIR = DATA_DIR / "metricas"  # Decisões do governador (memoria_<etapa>.parquet)
     
     # === CONFIGURAÇÕES DE BANCO ===
     DB_CONFIG = {
@@ -64,13 +123,38 @@ class Settings:
 
 
     # =========== FILENAME ===========
-    PARQUET_TREATED_FILENAME = "sih_rs_tratado.parquet"
+    # Datasets intermediários particionados por UF (ver get_*_dir/get_*_path)
+    UNIFIED_DIRNAME = "unificado"        # unificado/uf=XX/ano=AAAA/mes=MM/*.parquet
+    TREATED_DIRNAME = "tratado"          # tratado/uf=XX/sih_tratado.parquet
+    CONTRACT_DIRNAME = "contraido"       # contraido/uf=XX/sih_contraido.parquet
+    PREPROCESS_WORK_DIRNAME = "preprocess_chunks"  # preprocess_chunks/uf=XX/<perfil>/chunk_NNNNN.parquet
+    CONTRACT_WORK_DIRNAME = "contracao_buckets"    # contracao_buckets/uf=XX/bucket_NNNNN.parquet
+
+    PARQUET_TREATED_FILENAME = "sih_tratado.parquet"
+    PARQUET_TYPED_FILENAME = "sih_variavel_tipo.parquet"
+    PARQUET_QUARANTINE_FILENAME = "sih_quarentena.parquet"
+    PARQUET_PROJECTION_FILENAME = "sih_tratado_projecao.parquet"
 
     
-    PARQUET_CONTRACT_FILENAME = "sih_rs_contraido.parquet"
+    PARQUET_CONTRACT_FILENAME = "sih_contraido.parquet"
+
+    # Unificação em lotes, dentro de cada competência: arquivos raw por part file (lote_size do
+    # SIHUnifier) ou, se definido, total de bytes raw por part file. No layout nativo há um
+    # arquivo raw por UF e competência, então os lotes só mudam algo em partições com vários
+    # arquivos (ex.: layout do pysus, uma pasta com várias partes por competência)
+    UNIFY_LOTE_BYTES = None
+
+    # Manifesto da unificação incremental (dentro de unificado/uf=XX)
+    UNIFY_MANIFEST_FILENAME = "_manifesto.json"
 
+    # Manifesto dos chunks do pré-processamento (dentro de preprocess_chunks/uf=XX)
+    PREPROCESS_MANIFEST_FILENAME = "_manifesto.json"
 
-    PARQUET_UNIFIED_FILENAME = "sih_rs.parquet"
+    # Planos de harmonização de schema por fingerprint (em interim/unificado)
+    HARMONIZACAO_CACHE_FILENAME = "_planos_harmonizacao.json"
+
+    # Índice dos arquivos raw (em DATA_DIR), preenchido a partir dos rodapés parquet
+    CATALOGO_RAW_FILENAME = "catalogo_raw.parquet"
 
     INTERNACOES_FILENAME = "internacoes.parquet"
     UTI_DETALHES_FILENAME = "uti_detalhes.parquet"
@@ -110,6 +194,67 @@ class Settings:
                 periodo.append((ano, mes))
         return periodo
     
+    @classmethod
+    def get_particao(cls, base: Path, uf: str, ano: Optional[int] = None, mes: Optional[int] = None) -> Path:
+        """Retorna o diretório hive de uma partição (base/uf=XX[/ano=AAAA[/mes=MM]])"""
+        caminho = base / f"uf={uf.upper()}"
+        if ano is not None:
+            caminho = caminho / f"ano={int(ano)}"
+        if mes is not None:
+            caminho = caminho / f"mes={int(mes):02d}"
+        return caminho
+
+    @classmethod
+    def get_unificado_dir(cls, uf: str) -> Path:
+        """Dataset unificado de uma UF (particionado por ano/mês)"""
+        return cls.get_particao(cls.INTERIM_DIR / cls.UNIFIED_DIRNAME, uf)
+
+    @classmethod
+    def get_tratado_path(cls, uf: str) -> Path:
+        """Arquivo pré-processado de uma UF"""
+        return cls.get_particao(cls.INTERIM_DIR / cls.TREATED_DIRNAME, uf) / cls.PARQUET_TREATED_FILENAME
+
+    @classmethod
+    def get_variavel_tipo_path(cls, uf: str) -> Path:
+        """Arquivo com a tipagem das variáveis (preprocess_type) de uma UF"""
+        return cls.get_particao(cls.INTERIM_DIR / cls.TREATED_DIRNAME, uf) / cls.PARQUET_TYPED_FILENAME
+
+    @classmethod
+    def get_quarentena_path(cls, uf: str) -> Path:
+        """Linhas alteradas ou descartadas pelas regras de limpeza de uma UF (ver data/rules.py)"""
+        return cls.get_particao(cls.INTERIM_DIR / cls.TREATED_DIRNAME, uf) / cls.PARQUET_QUARANTINE_FILENAME
+
+    @classmethod
+    def get_projecao_path(cls, uf: str) -> Path:
+        """Colunas do tratado lidas fora da contração, gravadas no lugar dele com PREPROCESS_FUNDIR"""
+        return cls.get_particao(cls.INTERIM_DIR / cls.TREATED_DIRNAME, uf) / cls.PARQUET_PROJECTION_FILENAME
+
+    @classmethod
+    def get_linhas_tratadas_path(cls, uf: str) -> Path:
+        """Linhas tratadas de uma UF: o tratado completo ou, se ele não foi gravado (PREPROCESS_FUNDIR), a projeção"""
+        tratado = cls.get_tratado_path(uf)
+        return tratado if tratado.exists() else cls.get_projecao_path(uf)
+
+    @classmethod
+    def get_preprocess_trabalho_dir(cls, uf: str) -> Path:
+        """Chunks do pré-processamento de uma UF (mantidos até a unificação final, para retomada)"""
+        return cls.get_particao(cls.INTERIM_DIR / cls.PREPROCESS_WORK_DIRNAME, uf)
+
+    @classmethod
+    def get_contracao_trabalho_dir(cls, uf: str) -> Path:
+        """Partições por hash de N_AIH da contração fora da memória de uma UF"""
+        return cls.get_particao(cls.INTERIM_DIR / cls.CONTRACT_WORK_DIRNAME, uf)
+
+    @classmethod
+    def get_contraido_path(cls, uf: str) -> Path:
+        """Arquivo contraído por N_AIH de uma UF"""
+        return cls.get_particao(cls.INTERIM_DIR / cls.CONTRACT_DIRNAME, uf) / cls.PARQUET_CONTRACT_FILENAME
+
+    @classmethod
+    def get_processado_dir(cls, uf: str) -> Path:
+        """Tabelas finais de uma UF (as tabelas de apoio ficam na raiz de PROCESSED_DIR)"""
+        return cls.get_particao(cls.PROCESSED_DIR, uf)
+
     @classmethod
     def criar_diretorios(cls) -> None:
         """Cria todos os diretórios necessários"""
@@ -121,7 +266,7 @@ class Settings:
             cls.PROCESSED_DIR,
             cls.SUPPORT_FILES_DIR,
             cls.BACKUPS_DIR,
-            
+            cls.DBC_DIR,
         ]
         
         for dir_path in diretorios:
@@ -146,5 +291,6 @@ class Settings:
         print(f"INTERIM_DIR:          {cls.INTERIM_DIR}")
         print(f"PROCESSED_DIR:        {cls.PROCESSED_DIR}")
         print(f"SUPPORT_FILES_DIR:    {cls.SUPPORT_FILES_DIR}") 
+        print(f"DBC_DIR:              {cls.DBC_DIR}")
         print("===================")
 
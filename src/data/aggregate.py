@@ -1,26 +1,272 @@
 import polars as pl
+import os
 import sys
 from pathlib import Path
 import logging
+import math
 import time
 import tempfile
 import gc
+import json
+import shutil
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+import pyarrow.parquet as pq
 
 # Garante que o script pode importar de src/
 SRC_DIR = Path(__file__).parent.parent
 sys.path.insert(0, str(SRC_DIR))
 from config.settings import Settings
+from data.chunks import (
+    concatenar_partes, contar_linhas, iterar_chunks, ler_chunk, mesclar_ordenado, metadados_ordenacao, ordenado_por,
+    resolver_entrada, row_groups_com_chaves,
+)
+from data.memoria import MB, orcamento_maquina
+from data.parallel import executar_por_uf
+from data.rules import obter_regra
+from data.unify import hash_arquivo
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# --- Estratégia de agregação ---
+# Colunas a serem somadas
+COLUNAS_SOMA = ['VAL_SH', 'VAL_SP', 'VAL_UTI'] # VAL_TOT será recalculado
+
+# Colunas a serem agregadas com a média
+COLUNAS_MEDIA = ['UTI_MES_TO', 'UTI_INT_TO', 'DIAR_ACOM']
+
+# Linhagem: a AIH contraída depende de todas as competências em que apareceu;
+# guarda a mais recente (o ID_FONTE cresce com a competência dentro da UF)
+COLUNAS_MAX = ['ID_FONTE', 'COMPETENCIA']
+
+# Derivações do registro de regras (data/rules.py) recalculadas DEPOIS da agregação
+REGRAS_RECALCULADAS = ['idade', 'dias_perm', 'val_tot']
+COLUNAS_RECALCULADAS = [col for nome in REGRAS_RECALCULADAS for col in obter_regra(nome).colunas]
+
+# As médias também são guardadas como soma e contagem (não nulos): é o que permite
+# combinar a contração de meses novos com a já existente (contração incremental)
+SUFIXO_SOMA = "_SOMA"
+SUFIXO_CONTAGEM = "_N"
+
+# Conflitos das colunas de primeiro valor: bit i ligado se a AIH tem mais de um valor
+# (n_unique > 1, nulo conta como valor) na i-ésima coluna de colunas_primeiro()
+COLUNA_CONFLITOS = "CONFLITOS"
+_CONFLITOS_LINHA = "_CONFLITOS_LINHA"
+
+# Coluna auxiliar da partição por hash de N_AIH (não é gravada nas partições)
+COLUNA_BUCKET = "_BUCKET"
+
+# Mudanças na estratégia de agregação (ou nas derivações recalculadas) invalidam a contração incremental
+ARQUIVO_CONTRACAO = Path(__file__)
+ARQUIVO_REGRAS = SRC_DIR / "data" / "rules.py"
+
+
+def colunas_primeiro(schema_cols: List[str]) -> List[str]:
+    """Colunas agregadas com first(), na ordem dos bits de COLUNA_CONFLITOS"""
+    auxiliares = {'N_AIH', COLUNA_CONFLITOS, *COLUNAS_SOMA, *COLUNAS_MEDIA, *COLUNAS_MAX, *COLUNAS_RECALCULADAS}
+    return [
+        col for col in schema_cols
+        if col not in auxiliares and not col.endswith((SUFIXO_SOMA, SUFIXO_CONTAGEM))
+    ]
+
+
+def expressao_bucket(buckets: int) -> pl.Expr:
+    """Partição de cada linha por hash de N_AIH (a mesma em todo particionamento)"""
+    return (pl.col("N_AIH").hash(seed=0) % buckets).alias(COLUNA_BUCKET)
+
+
+def nome_bucket(bucket: int) -> str:
+    return f"bucket_{bucket:05d}.parquet"
+
+
+def mascara_conflitos_linha(colunas: List[str]) -> pl.Expr:
+    """
+    Bits das colunas em que a linha difere da anterior da mesma AIH (entrada ordenada
+    por N_AIH). O OU dos bits das linhas de uma AIH equivale a n_unique() > 1 por coluna,
+    com custo de uma comparação por linha em vez de uma contagem de distintos por grupo.
+    """
+    if len(colunas) > 63:
+        raise ValueError("A máscara de conflitos comporta no máximo 63 colunas")
+    mesma_aih = pl.col("N_AIH") == pl.col("N_AIH").shift()
+    return pl.sum_horizontal(
+        (pl.col(col).ne_missing(pl.col(col).shift()) & mesma_aih).cast(pl.Int64) * (1 << bit)
+        for bit, col in enumerate(colunas)
+    ) if colunas else pl.lit(0, dtype=pl.Int64)
+
+
+def agregacoes(schema_cols: List[str]) -> List[pl.Expr]:
+    """Agregação de cada coluna por N_AIH"""
+    aggregations = []
+    for col in schema_cols:
+        # Ignora a chave de agrupamento e as colunas que serão recalculadas
+        if col == 'N_AIH' or col in COLUNAS_RECALCULADAS:
+            continue
+
+        if col in COLUNAS_SOMA:
+            aggregations.append(pl.col(col).sum().alias(col))
+        elif col in COLUNAS_MEDIA:
+            aggregations.append(pl.col(col).mean().alias(col))
+            aggregations.append(pl.col(col).sum().alias(col + SUFIXO_SOMA))
+            aggregations.append(pl.col(col).count().alias(col + SUFIXO_CONTAGEM))
+        elif col in COLUNAS_MAX:
+            aggregations.append(pl.col(col).max().alias(col))
+        else:
+            # Para todas as outras colunas (DT_INTER, NASC, etc.), pega o primeiro valor
+            aggregations.append(pl.col(col).first().alias(col))
+    return aggregations
+
+
+def recalcular_derivadas(df_contraido_lazy: pl.LazyFrame) -> pl.LazyFrame:
+    """Recalcula IDADE, DIAS_PERM e VAL_TOT com as derivações do registro de regras"""
+    derivadas = []
+    for nome in REGRAS_RECALCULADAS:
+        regra = obter_regra(nome)
+        for col in regra.colunas:
+            derivadas.append(regra.transformar(pl.col(col)).alias(col))
+    return df_contraido_lazy.with_columns(derivadas)
+
+
+def plano_contracao(df_lazy: pl.LazyFrame, ordenado: bool = False, conflitos: Optional[bool] = None) -> pl.LazyFrame:
+    """
+    Plano completo da contração: agregação por N_AIH, máscara de conflitos das colunas
+    de primeiro valor e colunas derivadas.
+
+    Com a entrada ordenada, a agregação usa o caminho de chave ordenada do polars e os
+    conflitos saem de comparações entre linhas vizinhas; só as linhas com algum conflito
+    passam pelo OU bit a bit por AIH, unido ao resultado pela chave.
+
+    Numa entrada não ordenada, a máscara exige ordená-la antes por N_AIH (ordenação
+    estável: o first() não muda), o que custa mais que a própria agregação (2M linhas:
+    3,3 s contra 1,8 s com uma thread; até 4x com mais threads, e cerca do dobro do pico).
+    A máscara é calculada por padrão (CONTRACT_CONFLITOS_SEM_ORDEM); só com `conflitos`
+    desligado explicitamente a entrada não ordenada passa apenas pela agregação por hash e
+    COLUNA_CONFLITOS fica nula (não calculada). Alternativas sem ordenação (n_unique,
+    min/max ou hash por coluna) mediram de 4,3 s a mais de 9 s.
+    """
+    schema_cols = df_lazy.collect_schema().names()
+    if conflitos is None:
+        conflitos = Settings.CONTRACT_CONFLITOS_SEM_ORDEM
+    if not ordenado and not conflitos:
+        contraido = df_lazy.group_by("N_AIH").agg(agregacoes(schema_cols)).with_columns(
+            pl.lit(None, dtype=pl.Int64).alias(COLUNA_CONFLITOS)
+        )
+        return recalcular_derivadas(contraido)
+    if not ordenado:
+        df_lazy = df_lazy.sort("N_AIH", maintain_order=True)
+    linhas = df_lazy.set_sorted("N_AIH").with_columns(
+        mascara_conflitos_linha(colunas_primeiro(schema_cols)).alias(_CONFLITOS_LINHA)
+    )
+    contraido = linhas.group_by("N_AIH").agg(agregacoes(schema_cols))
+    mascaras = (
+        linhas.filter(pl.col(_CONFLITOS_LINHA) != 0)
+        .group_by("N_AIH").agg(pl.col(_CONFLITOS_LINHA).bitwise_or().alias(COLUNA_CONFLITOS))
+    )
+    contraido = contraido.join(mascaras, on="N_AIH", how="left", maintain_order="left").with_columns(
+        pl.col(COLUNA_CONFLITOS).fill_null(0)
+    )
+    return recalcular_derivadas(contraido)
+
+
+def resumo_conflitos(contraido: pl.LazyFrame) -> pl.DataFrame:
+    """AIHs com conflito por coluna de primeiro valor (decodificando COLUNA_CONFLITOS)"""
+    colunas = colunas_primeiro(contraido.collect_schema().names())
+    mascara = pl.col(COLUNA_CONFLITOS)
+    contagens = contraido.select(
+        [pl.len().alias("_total")]
+        + [((mascara & (1 << bit)) != 0).sum().alias(col) for bit, col in enumerate(colunas)]
+    ).collect()
+    total = contagens["_total"][0]
+    return pl.DataFrame({
+        "coluna": colunas,
+        "bit": list(range(len(colunas))),
+        "aihs": [contagens[col][0] for col in colunas],
+    }, schema={"coluna": pl.String, "bit": pl.Int64, "aihs": pl.Int64}).filter(pl.col("aihs") > 0).with_columns(
+        (100.0 * pl.col("aihs") / total if total else pl.lit(0.0)).alias("pct_aihs")
+    ).sort("aihs", descending=True)
+
+
+def combinar_contraidos(anteriores: pl.LazyFrame, novos: pl.LazyFrame) -> pl.LazyFrame:
+    """
+    Combina AIHs já contraídas com a contração de competências posteriores: somas
+    (e as somas/contagens das médias) se somam, máximos se combinam, e as colunas de
+    primeiro valor ficam com o da contração anterior (as competências dela vêm antes).
+
+    Cada AIH tem no máximo duas linhas (uma de cada contração), então o OU das máscaras
+    de conflito é min | max, e os primeiros valores que divergem entre as duas saem da
+    comparação com a linha vizinha (mascara_conflitos_linha). Se uma das máscaras não
+    foi calculada (nula, ver plano_contracao), a combinada também fica nula.
+    """
+    colunas = anteriores.collect_schema().names()
+    combinacao = [
+        pl.col(COLUNA_CONFLITOS).min().alias("_conflitos_min"),
+        pl.col(COLUNA_CONFLITOS).max().alias("_conflitos_max"),
+        pl.col(COLUNA_CONFLITOS).null_count().alias("_conflitos_nulos"),
+        pl.col(_CONFLITOS_LINHA).sum().alias(_CONFLITOS_LINHA),
+    ]
+    for col in colunas:
+        if col in ('N_AIH', COLUNA_CONFLITOS) or col in COLUNAS_RECALCULADAS or col in COLUNAS_MEDIA:
+            continue
+        if col in COLUNAS_SOMA or col.endswith((SUFIXO_SOMA, SUFIXO_CONTAGEM)):
+            combinacao.append(pl.col(col).sum().alias(col))
+        elif col in COLUNAS_MAX:
+            combinacao.append(pl.col(col).max().alias(col))
+        else:
+            combinacao.append(pl.col(col).first().alias(col))
+    medias = [
+        pl.when(pl.col(col + SUFIXO_CONTAGEM) > 0)
+        .then(pl.col(col + SUFIXO_SOMA) / pl.col(col + SUFIXO_CONTAGEM))
+        .alias(col)
+        for col in COLUNAS_MEDIA if col in colunas
+    ]
+    conflitos = pl.when(pl.col("_conflitos_nulos") == 0).then(
+        pl.col("_conflitos_min") | pl.col("_conflitos_max") | pl.col(_CONFLITOS_LINHA)
+    )
+    # Mesmas colunas, ordem e tipos da contração completa
+    esquema = anteriores.collect_schema()
+    linhas = (
+        pl.concat([anteriores, novos.select(colunas)], how="vertical_relaxed")
+        .sort("N_AIH", maintain_order=True)
+        .with_columns(mascara_conflitos_linha(colunas_primeiro(colunas)).alias(_CONFLITOS_LINHA))
+    )
+    return recalcular_derivadas(
+        linhas.group_by("N_AIH").agg(combinacao)
+        .with_columns(medias + [conflitos.alias(COLUNA_CONFLITOS)])
+    ).select(pl.col(col).cast(tipo) for col, tipo in esquema.items())
+
 
 class SIHContractor:
-    """Contrai os dados do SIH/SUS agregando por N_AIH"""
+    """
+    Contrai os dados do SIH/SUS agregando por N_AIH.
+
+    Se a entrada declara ordenação por N_AIH (PREPROCESS_ORDENAR), a contração é uma
+    única passada sequencial por sequências de chaves iguais, com memória constante.
+    Senão, se ela não cabe no orçamento de memória, é particionada por hash de
+    N_AIH (interim/contracao_buckets/uf=XX) e cada partição é contraída isoladamente.
+
+    No modo incremental, um manifesto guarda as competências já contraídas; quando só
+    chegam competências posteriores, apenas elas são contraídas e combinadas com as
+    AIHs já existentes que reaparecem nelas (combinar_contraidos).
+    """
 
-    def __init__(self, arquivo_entrada=None, arquivo_saida=None):
-        self.entrada = arquivo_entrada or Settings.INTERIM_DIR / "sih_rs_tratado.parquet"
-        self.saida = arquivo_saida or Settings.INTERIM_DIR / "sih_rs_contraido.parquet"
+    def __init__(self, arquivo_entrada=None, arquivo_saida=None, uf=None, buckets=None, workers=None,
+                 memoria_mb=None, ordenado=None, chunk_size=None, incremental=None, conflitos=None):
+        # N_AIH começa pelo código da UF: a contração de cada UF é independente
+        self.uf = (uf or Settings.UF_DEFAULT[0]).upper()
+        self.entrada = arquivo_entrada or Settings.get_tratado_path(self.uf)
+        self.saida = arquivo_saida or Settings.get_contraido_path(self.uf)
+        self.buckets = Settings.CONTRACT_BUCKETS if buckets is None else buckets
+        self.workers = workers or Settings.CONTRACT_WORKERS or 1
+        self.memoria_mb = memoria_mb or Settings.CONTRACT_MEMORIA_MB
+        self.ordenado = Settings.CONTRACT_ORDENADO if ordenado is None else ordenado
+        self.chunk_size = chunk_size or Settings.CONTRACT_CHUNK_SIZE
+        self.trabalho_dir = Settings.get_contracao_trabalho_dir(self.uf)
+        self.incremental = Settings.CONTRACT_INCREMENTAL if incremental is None else incremental
+        self.conflitos = Settings.CONTRACT_CONFLITOS_SEM_ORDEM if conflitos is None else conflitos
+        self.arquivo_manifesto = self.saida.with_name(Settings.CONTRACT_MANIFEST_FILENAME)
+        self.arquivo_conflitos = self.saida.with_name(Settings.CONTRACT_CONFLITOS_FILENAME)
         Settings.criar_diretorios()
         logger.info(f"Processamento de agregação iniciado. Entrada: {self.entrada}")
 
@@ -33,80 +279,24 @@ class SIHContractor:
         inicio = time.time()
         
         try:
-            logger.info("Lendo arquivo de entrada de forma lazy...")
-            df_lazy = pl.scan_parquet(self.entrada)
-            
-            # Usar collect_schema() para obter nomes de colunas de forma eficiente
-            schema_cols = df_lazy.collect_schema().names()
-
-            # --- PASSO 1: Definir a estratégia de agregação ---
-            # Colunas a serem somadas
-            colunas_soma = ['VAL_SH', 'VAL_SP', 'VAL_UTI'] # VAL_TOT será recalculado
-            
-            # Colunas a serem agregadas com a média
-            colunas_media = ['UTI_MES_TO', 'UTI_INT_TO', 'DIAR_ACOM']
-            
-            # Colunas que serão recalculadas DEPOIS da agregação
-            colunas_recalculadas = ['IDADE', 'DIAS_PERM', 'VAL_TOT']
-
-            aggregations = []
-            for col in schema_cols:
-                # Ignora a chave de agrupamento e as colunas que serão recalculadas
-                if col == 'N_AIH' or col in colunas_recalculadas:
-                    continue
-                
-                if col in colunas_soma:
-                    aggregations.append(pl.col(col).sum().alias(col))
-                elif col in colunas_media:
-                    aggregations.append(pl.col(col).mean().alias(col))
+            competencias = self.contar_competencias()
+            registros_finais = self.contrair_incremental(competencias) if self.incremental else None
+            if registros_finais is None:
+                if self.entrada_ordenada():
+                    registros_finais = self.contrair_ordenado()
+                elif (buckets := self.definir_buckets()) > 1:
+                    registros_finais = self.contrair_por_buckets(buckets)
                 else:
-                    # Para todas as outras colunas (DT_INTER, NASC, etc.), pega o primeiro valor
-                    aggregations.append(pl.col(col).first().alias(col))
-
-            # --- PASSO 2: Executar a agregação principal ---
-            logger.info("Executando agregação principal...")
-            df_contraido_lazy = df_lazy.group_by("N_AIH").agg(aggregations)
-
-            # --- PASSO 3: Recalcular colunas derivadas para garantir consistência ---
-            logger.info("Recalculando VAL_TOT, DIAS_PERM e IDADE para garantir consistência...")
-            df_final_lazy = df_contraido_lazy.with_columns(
-                # Recalcula VAL_TOT
-                (pl.col("VAL_SH") + pl.col("VAL_SP") + pl.col("VAL_UTI")).alias("VAL_TOT"),
-                
-                # Recalcula DIAS_PERM
-                (pl.col("DT_SAIDA") - pl.col("DT_INTER")).dt.total_days().cast(pl.Int16, strict=False).fill_null(0).alias("DIAS_PERM"),
-                
-                # Recalcula IDADE
-                (
-                    pl.col("DT_INTER").dt.year() - pl.col("NASC").dt.year() -
-                    pl.when(
-                        (pl.col("DT_INTER").dt.month() < pl.col("NASC").dt.month()) |
-                        ((pl.col("DT_INTER").dt.month() == pl.col("NASC").dt.month()) &
-                         (pl.col("DT_INTER").dt.day() < pl.col("NASC").dt.day()))
-                    )
-                    .then(1)
-                    .otherwise(0)
-                )
-                .clip(0, 150)
-                .cast(pl.Int16)
-                .alias("IDADE")
-            )
-
-            # --- PASSO 4: Coletar e salvar o resultado final ---
-            logger.info("Coletando resultados e salvando arquivo final...")
-            df_final = df_final_lazy.collect()
-            
-            registros_finais = len(df_final)
-            
-            logger.info(f"Salvando arquivo final: {self.saida}")
-            df_final.write_parquet(self.saida, compression="snappy")
+                    registros_finais = self.contrair_em_memoria()
+            self._salvar_manifesto(competencias, registros_finais)
+            self.registrar_conflitos()
             
             # --- Relatório Final ---
             tempo_total = time.time() - inicio
             tamanho_final_mb = self.saida.stat().st_size / (1024 * 1024)
             
             logger.info("="*60)
-            logger.info("AGREGAÇÃO CONCLUÍDA!")
+            logger.info(f"AGREGAÇÃO CONCLUÍDA! (UF {self.uf})")
             logger.info("="*60)
             logger.info(f"Registros contraídos: {registros_finais:,}")
             logger.info(f"Tamanho final: {tamanho_final_mb:.1f} MB")
@@ -118,13 +308,353 @@ class SIHContractor:
             logger.error(f"Erro na contração: {e}", exc_info=True) # Adicionado exc_info=True para mais detalhes
             raise
 
+    def registrar_conflitos(self):
+        """Grava o relatório de conflitos das colunas de primeiro valor (lê só a máscara)"""
+        contraido = pl.scan_parquet(self.saida)
+        resumo = resumo_conflitos(contraido)
+        resumo.write_csv(self.arquivo_conflitos)
+        sem_mascara = contraido.select(pl.col(COLUNA_CONFLITOS).null_count()).collect().item()
+        if sem_mascara:
+            logger.info(
+                f"Conflitos não calculados para {sem_mascara:,} AIHs (entrada não ordenada por N_AIH; "
+                "CONTRACT_CONFLITOS_SEM_ORDEM desligado)"
+            )
+        if resumo.height:
+            colunas = ", ".join(f"{c}={n:,}" for c, n in resumo.select("coluna", "aihs").head(10).iter_rows())
+            logger.info(f"AIHs com valores divergentes (first()): {colunas} → {self.arquivo_conflitos.name}")
+        else:
+            logger.info("Nenhum conflito nas colunas de primeiro valor")
+
+    # === CONTRAÇÃO INCREMENTAL ===
+
+    def assinatura(self) -> dict:
+        """Colunas da entrada e código da contração: se mudarem, a contração é refeita por inteiro"""
+        esquema = pl.scan_parquet(self.entrada).collect_schema()
+        return {
+            "colunas": {col: str(tipo) for col, tipo in esquema.items()},
+            "contracao_sha1": hash_arquivo(ARQUIVO_CONTRACAO),
+            "regras_sha1": hash_arquivo(ARQUIVO_REGRAS),
+        }
+
+    def assinatura_saida(self) -> dict:
+        """Arquivo contraído a que o manifesto se refere (nome, tamanho e mtime)"""
+        stat = self.saida.stat()
+        return {"arquivo": self.saida.name, "tamanho": stat.st_size, "mtime": stat.st_mtime}
+
+    def contar_competencias(self) -> Dict[str, int]:
+        """Linhas da entrada por competência (só a coluna COMPETENCIA é lida)"""
+        if "COMPETENCIA" not in pl.scan_parquet(self.entrada).collect_schema().names():
+            return {}
+        contagens = (
+            pl.scan_parquet(self.entrada).group_by("COMPETENCIA").len().collect(engine="streaming")
+        )
+        return {str(c): n for c, n in contagens.iter_rows() if c is not None}
+
+    def carregar_manifesto(self) -> dict:
+        """Manifesto da contração (vazio se não existir ou estiver corrompido)"""
+        if not self.arquivo_manifesto.exists():
+            return {}
+        try:
+            with open(self.arquivo_manifesto, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (json.JSONDecodeError, OSError) as e:
+            logger.warning(f"Manifesto da contração ilegível ({e}); a contração será completa")
+            return {}
+
+    def _salvar_manifesto(self, competencias: Dict[str, int], registros: int):
+        """Grava o manifesto (assinatura, competências contraídas e total) de forma atômica"""
+        manifesto = {
+            "assinatura": self.assinatura(),
+            "saida": self.assinatura_saida(),
+            "competencias": competencias,
+            "linhas": registros,
+        }
+        temp = self.arquivo_manifesto.with_suffix(".json.tmp")
+        with open(temp, "w", encoding="utf-8") as f:
+            json.dump(manifesto, f, indent=2, sort_keys=True)
+        os.replace(temp, self.arquivo_manifesto)
+
+    def contrair_incremental(self, competencias: Dict[str, int]) -> Optional[int]:
+        """
+        Contrai só as competências novas e as combina com a contração existente.
+        Retorna None quando a contração precisa ser completa: sem manifesto, arquivo
+        contraído ou assinatura diferentes, competência já contraída com outra contagem de linhas ou competência
+        nova anterior à última contraída (o primeiro valor de cada AIH mudaria).
+
+        A agregação e a memória acompanham as competências novas: as AIHs já contraídas que
+        reaparecem são localizadas pelo rodapé (contração ordenada por N_AIH) ou por uma
+        varredura streaming que só guarda as delas. O arquivo contraído, porém, é regravado
+        inteiro (cópia streaming das demais AIHs): a escrita ainda acompanha o histórico.
+        """
+        manifesto = self.carregar_manifesto()
+        anteriores = manifesto.get("competencias", {})
+        motivo = None
+        if not competencias:
+            motivo = "entrada sem COMPETENCIA"
+        elif not manifesto or not self.saida.exists():
+            motivo = "sem contração anterior"
+        elif manifesto.get("saida") != self.assinatura_saida():
+            motivo = "arquivo contraído diferente do registrado no manifesto"
+        elif manifesto.get("assinatura") != self.assinatura():
+            motivo = "colunas da entrada ou estratégia de agregação mudaram"
+        elif any(competencias.get(c) != n for c, n in anteriores.items()):
+            motivo = "competências já contraídas mudaram"
+        novas = sorted(set(competencias) - set(anteriores))
+        if motivo is None and novas and anteriores and novas[0] < max(anteriores):
+            motivo = f"competência {novas[0]} anterior à última contraída"
+        if motivo is not None:
+            logger.info(f"Contração completa: {motivo}")
+            return None
+        if not novas:
+            logger.info("Contração incremental: nenhuma competência nova")
+            return manifesto["linhas"]
+
+        logger.info(f"=== Contração incremental: {len(novas)} competência(s) nova(s) ({', '.join(novas)}) ===")
+        filtro = pl.col("COMPETENCIA").cast(pl.String).is_in(novas)
+        novos = plano_contracao(
+            pl.scan_parquet(self.entrada).filter(filtro), self.entrada_ordenada(), self.conflitos
+        ).collect()
+        chaves = novos["N_AIH"]
+
+        ordenado = ordenado_por([self.saida]) == "N_AIH"
+        if ordenado:
+            # Só os row groups cujo intervalo de N_AIH contém chaves novas são lidos (com a
+            # contração ordenada por N_AIH, as estatísticas do rodapé são um índice das chaves)
+            grupos = row_groups_com_chaves(self.saida, "N_AIH", chaves)
+            existentes = ler_chunk(self.saida, grupos).filter(pl.col("N_AIH").is_in(chaves.implode())) if grupos else None
+            leitura = f"{len(grupos)} row groups lidos"
+        else:
+            # Fora de ordem, os intervalos dos row groups se sobrepõem e quase todos seriam lidos
+            # inteiros: a varredura streaming retém só as linhas das chaves novas
+            existentes = pl.scan_parquet(self.saida).filter(
+                pl.col("N_AIH").is_in(chaves.implode())
+            ).collect(engine="streaming")
+            leitura = "varredura streaming"
+        reaparecem = existentes.height if existentes is not None else 0
+        if reaparecem:
+            combinados = combinar_contraidos(existentes.lazy(), novos.lazy()).collect()
+        else:
+            combinados = novos.select(pl.scan_parquet(self.saida).collect_schema().names())
+        logger.info(f"{novos.height:,} AIHs nas competências novas, {reaparecem:,} já contraídas ({leitura})")
+
+        # As demais AIHs são copiadas sem reagregação
+        mantidas = pl.scan_parquet(self.saida).filter(~pl.col("N_AIH").is_in(chaves.implode()))
+        if ordenado:
+            plano = mesclar_ordenado([mantidas, combinados.sort("N_AIH").lazy()], "N_AIH")
+        else:
+            plano = pl.concat([mantidas, combinados.lazy()])
+        temp = self.saida.with_name(self.saida.name + ".tmp")
+        plano.sink_parquet(
+            temp,
+            compression="snappy",
+            row_group_size=Settings.PARQUET_ROW_GROUP_SIZE,
+            metadata=metadados_ordenacao("N_AIH") if ordenado else None,
+        )
+        os.replace(temp, self.saida)
+        return manifesto["linhas"] - reaparecem + combinados.height
+
+    def entrada_ordenada(self) -> bool:
+        """A entrada declara ordenação por N_AIH nos metadados (e o modo está habilitado)"""
+        return self.ordenado and ordenado_por(resolver_entrada(self.entrada)) == "N_AIH"
+
+    def definir_buckets(self, linhas: Optional[int] = None) -> int:
+        """
+        Número de partições por hash de N_AIH. No modo automático (0), a entrada é
+        particionada quando a estimativa de memória (linhas x BYTES_POR_REGISTRO) não
+        cabe no orçamento (até CONTRACT_BUCKETS_MAX); cada worker contrai uma partição por vez.
+        `linhas` substitui a contagem da entrada (pré-processamento fundido, sem tratado gravado).
+        """
+        if self.buckets:
+            return self.buckets
+        if linhas is None:
+            linhas = contar_linhas(resolver_entrada(self.entrada))
+        orcamento = orcamento_maquina(self.memoria_mb * MB)
+        estimativa = linhas * Settings.BYTES_POR_REGISTRO
+        buckets = min(math.ceil(estimativa * self.workers / orcamento), Settings.CONTRACT_BUCKETS_MAX)
+        if buckets > 1:
+            logger.info(
+                f"Estimativa {estimativa / MB:,.0f} MB para {linhas:,} linhas (orçamento {orcamento / MB:,.0f} MB, "
+                f"{self.workers} processos) → {buckets} partições por hash de N_AIH"
+            )
+        return max(1, buckets)
+
+    def contrair_em_memoria(self) -> int:
+        """Agregação única sobre a entrada inteira (tabela hash e resultado em memória)"""
+        logger.info("Lendo arquivo de entrada de forma lazy...")
+        df_lazy = pl.scan_parquet(self.entrada)
+
+        logger.info("Executando agregação principal e recalculando VAL_TOT, DIAS_PERM e IDADE...")
+        df_final_lazy = plano_contracao(df_lazy, conflitos=self.conflitos)
+
+        logger.info("Coletando resultados e salvando arquivo final...")
+        df_final = df_final_lazy.collect()
+        
+        registros_finais = len(df_final)
+        
+        logger.info(f"Salvando arquivo final: {self.saida}")
+        self.saida.parent.mkdir(parents=True, exist_ok=True)
+        df_final.write_parquet(self.saida, compression="snappy")
+        return registros_finais
+
+    def plano_particoes(self, buckets: int, plano: Optional[pl.LazyFrame] = None) -> pl.LazyFrame:
+        """
+        Sink lazy que grava cada linha de `plano` (padrão: a entrada) na partição
+        hash(N_AIH) % buckets do diretório de trabalho. Todas as linhas de uma AIH caem na
+        mesma partição, na ordem do plano (o first() de cada AIH não muda).
+        """
+        if self.trabalho_dir.exists():
+            shutil.rmtree(self.trabalho_dir)
+        self.trabalho_dir.mkdir(parents=True, exist_ok=True)
+        plano = pl.scan_parquet(self.entrada) if plano is None else plano
+        return plano.sink_parquet(
+            pl.PartitionByKey(
+                self.trabalho_dir,
+                by=expressao_bucket(buckets),
+                include_key=False,
+                file_path=lambda ctx: nome_bucket(ctx.keys[0].raw_value),
+            ),
+            compression="snappy",
+            row_group_size=Settings.PARQUET_ROW_GROUP_SIZE,
+            mkdir=True,
+            lazy=True,
+        )
+
+    def particoes(self) -> List[Path]:
+        """Partições gravadas por plano_particoes (partições vazias não geram arquivo)"""
+        return sorted(self.trabalho_dir.glob("bucket_*.parquet"))
+
+    def particionar(self, buckets: int) -> List[Path]:
+        """Uma passada streaming pela entrada gravando as partições por hash de N_AIH"""
+        self.plano_particoes(buckets).collect(engine="streaming")
+        return self.particoes()
+
+    def contrair_por_buckets(self, buckets: int) -> int:
+        """
+        Contração fora da memória: particiona a entrada por hash de N_AIH e contrai cada
+        partição isoladamente (em paralelo com `workers`). O pico de memória acompanha o
+        tamanho da partição, não o do dataset.
+        """
+        logger.info(f"=== Contração por partições ({buckets} partições, {self.workers} processos) ===")
+        arquivos = self.particionar(buckets)
+        logger.info(f"Entrada particionada em {len(arquivos)} arquivos: {self.trabalho_dir}")
+        return self.contrair_particoes([[arquivo] for arquivo in arquivos])
+
+    def contrair_particoes(self, particoes: List[List[Path]]) -> int:
+        """
+        Contrai cada partição (uma lista de arquivos, na ordem das linhas) e concatena os
+        resultados na saída. As partições vêm de particionar ou, no pré-processamento
+        fundido, das linhas tratadas gravadas direto nelas.
+        """
+        partes_dir = self.trabalho_dir / "contraido"
+        partes_dir.mkdir(parents=True, exist_ok=True)
+        destinos = [partes_dir / arquivos[0].name for arquivos in particoes]
+
+        if self.workers > 1:
+            # Threads do polars divididas entre os workers (lido na importação, no spawn)
+            threads_anterior = os.environ.get("POLARS_MAX_THREADS")
+            os.environ["POLARS_MAX_THREADS"] = str(max(1, (os.cpu_count() or 1) // self.workers))
+            try:
+                contexto = multiprocessing.get_context("spawn")
+                with ProcessPoolExecutor(max_workers=self.workers, mp_context=contexto) as executor:
+                    linhas = list(executor.map(
+                        contrair_bucket_worker, particoes, destinos, [self.conflitos] * len(particoes)
+                    ))
+            finally:
+                if threads_anterior is None:
+                    os.environ.pop("POLARS_MAX_THREADS", None)
+                else:
+                    os.environ["POLARS_MAX_THREADS"] = threads_anterior
+        else:
+            linhas = []
+            for n, (arquivos, destino) in enumerate(zip(particoes, destinos), start=1):
+                linhas.append(contrair_bucket_worker(arquivos, destino, self.conflitos))
+                if n % 10 == 0 or n == 1:
+                    logger.info(f"Partições contraídas: {n}/{len(particoes)}")
+
+        logger.info(f"Concatenando {len(destinos)} partições contraídas: {self.saida}")
+        self.saida.parent.mkdir(parents=True, exist_ok=True)
+        temp = self.saida.with_name(self.saida.name + ".tmp")
+        concatenar_partes(destinos, temp)
+        os.replace(temp, self.saida)
+        shutil.rmtree(self.trabalho_dir, ignore_errors=True)
+        return sum(linhas)
+
+    def contrair_ordenado(self) -> int:
+        """
+        Contração sequencial de uma entrada ordenada por N_AIH: cada chunk é agregado com o
+        caminho de chave ordenada do polars (grupos são fatias contíguas, sem tabela hash) e
+        gravado em seguida. As linhas da última AIH de um chunk podem continuar no próximo,
+        então ficam retidas e entram no chunk seguinte. Memória constante (um chunk).
+        Entrada sem linhas gera a saída vazia com o esquema da contração, como os demais modos.
+        """
+        logger.info(f"=== Contração sequencial (entrada ordenada por N_AIH, chunks de {self.chunk_size:,}) ===")
+        self.saida.parent.mkdir(parents=True, exist_ok=True)
+        temp = self.saida.with_name(self.saida.name + ".tmp")
+        escritor: Optional[pq.ParquetWriter] = None
+        retidas = None
+        registros = 0
+        try:
+            for chunk, arquivo, _ in iterar_chunks(resolver_entrada(self.entrada), self.chunk_size):
+                if retidas is not None:
+                    chunk = pl.concat([retidas, chunk])
+                if chunk.is_empty():
+                    continue
+                chaves = chunk["N_AIH"]
+                if not chaves.is_sorted():
+                    raise ValueError(f"Entrada declarada ordenada por N_AIH fora de ordem: {arquivo}")
+                corte = chaves.search_sorted(chaves[-1], side="left")
+                retidas = chunk.slice(corte)
+                if corte:
+                    escritor, linhas = gravar_contraido(chunk.slice(0, corte), escritor, temp)
+                    registros += linhas
+            if retidas is not None and retidas.height:
+                escritor, linhas = gravar_contraido(retidas, escritor, temp)
+                registros += linhas
+            if escritor is None:
+                vazia = pl.scan_parquet(resolver_entrada(self.entrada)).head(0).collect()
+                escritor, _ = gravar_contraido(vazia, escritor, temp)
+        finally:
+            if escritor is not None:
+                escritor.close()
+        os.replace(temp, self.saida)
+        return registros
+
+
+def gravar_contraido(
+    df: pl.DataFrame, escritor: Optional[pq.ParquetWriter], destino: Path
+) -> Tuple[pq.ParquetWriter, int]:
+    """Contrai uma fatia ordenada por N_AIH e a acrescenta ao parquet de saída"""
+    tabela = plano_contracao(df.lazy(), ordenado=True).collect().to_arrow()
+    if escritor is None:
+        # A saída continua ordenada por N_AIH
+        esquema = tabela.schema.with_metadata(metadados_ordenacao("N_AIH"))
+        escritor = pq.ParquetWriter(destino, esquema, compression="snappy")
+    escritor.write_table(tabela.cast(escritor.schema), row_group_size=Settings.PARQUET_ROW_GROUP_SIZE)
+    return escritor, tabela.num_rows
+
+
+def contrair_bucket_worker(arquivos: List[Path], destino: Path, conflitos: bool) -> int:
+    """Contrai uma partição (arquivos na ordem das linhas) e grava o resultado (executada em processo worker)"""
+    df = plano_contracao(pl.scan_parquet(arquivos), conflitos=conflitos).collect()
+    df.write_parquet(destino, compression="snappy")
+    return df.height
+
+
+def contrair_uf(uf: str) -> int:
+    """Contrai uma UF (executada em processo worker por executar_por_uf)"""
+    contraido = Settings.get_contraido_path(uf)
+    if Settings.PREPROCESS_FUNDIR and not Settings.get_tratado_path(uf).exists() and contraido.exists():
+        logger.info(f"UF {uf}: contração gravada pelo pré-processamento (PREPROCESS_FUNDIR) → {contraido}")
+        return contar_linhas([contraido])
+    return SIHContractor(uf=uf).contrair()
+
 
 def main():
     """Execução principal"""
     try:
-        contractor = SIHContractor()
-        resultado = contractor.contrair()
-        print(f"\nSUCESSO! {resultado:,} registros contraídos.")
+        resultados = executar_por_uf(contrair_uf, Settings.UF_DEFAULT)
+        resultado = sum(resultados.values())
+        print(f"\nSUCESSO! {resultado:,} registros contraídos ({len(resultados)} UFs).")
     except Exception as e:
         print(f"\nERRO: {e}")
         raise
@@ -0,0 +1,236 @@
+"""
+Catálogo dos arquivos raw
+Localização: projeto_sih/src/data/catalog.py
+Função: Mantém um índice persistente dos parquets em RAW_DIR construído apenas com os
+metadados do rodapé (contagem exata de linhas, colunas, fingerprint do schema, faixa de DT_INTER)
+"""
+import os
+import sys
+import hashlib
+import logging
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+import polars as pl
+import pyarrow.parquet as pq
+
+SRC_DIR = Path(__file__).parent.parent
+sys.path.insert(0, str(SRC_DIR))
+from config.settings import Settings
+from data.convert import parse_nome_arquivo
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+SCHEMA_CATALOGO = {
+    "caminho": pl.String,          # Relativo à pasta raw
+    "nome": pl.String,             # Nome DATASUS (ex.: RDRS0801)
+    "uf": pl.String,
+    "ano": pl.Int16,
+    "mes": pl.Int8,
+    "linhas": pl.Int64,
+    "row_groups": pl.Int32,
+    "colunas": pl.List(pl.String),
+    "schema_hash": pl.String,
+    "dt_inter_min": pl.String,     # AAAAMMDD
+    "dt_inter_max": pl.String,
+    "tamanho_bytes": pl.Int64,
+    "mtime": pl.Float64,
+    "ilegivel": pl.Boolean,        # Rodapé ilegível na última atualização (a linha é a da leitura anterior)
+}
+
+
+def fingerprint_schema(schema) -> str:
+    """Hash estável (independe da ordem das colunas) de um schema pyarrow"""
+    assinatura = "|".join(sorted(f"{campo.name}:{campo.type}" for campo in schema))
+    return hashlib.sha1(assinatura.encode("utf-8")).hexdigest()[:16]
+
+
+def competencia_do_caminho(caminho: Path) -> Tuple[Optional[str], Optional[int], Optional[int], Optional[str]]:
+    """
+    Identifica (uf, ano, mês, nome) de um arquivo raw, tanto no layout particionado
+    (uf=RS/ano=2008/mes=01/RDRS0801.parquet) quanto no layout do pysus (RDRS0801.parquet/<parte>.parquet).
+    """
+    for parte in (caminho.name, caminho.parent.name):
+        try:
+            uf, ano, mes = parse_nome_arquivo(parte)
+            return uf, ano, mes, parte.split(".")[0].upper()
+        except ValueError:
+            continue
+    return None, None, None, None
+
+
+def id_fonte(uf: str, ano: int, mes: int) -> int:
+    """
+    Identificador inteiro e estável de um arquivo DATASUS: código IBGE da UF + AAAAMM
+    (ex.: RDRS0801 → 43200801). Cabe em Int32 e cresce com a competência dentro da UF.
+    """
+    return Settings.CODIGOS_UF[uf.upper()] * 1_000_000 + int(ano) * 100 + int(mes)
+
+
+def decodificar_id_fonte(identificador: int) -> Tuple[str, int, int]:
+    """Inverso de id_fonte: (uf, ano, mês)"""
+    codigo, aaaamm = divmod(int(identificador), 1_000_000)
+    ufs = {v: k for k, v in Settings.CODIGOS_UF.items()}
+    return ufs[codigo], aaaamm // 100, aaaamm % 100
+
+
+def _normalizar_data(valor) -> Optional[str]:
+    if valor is None:
+        return None
+    if hasattr(valor, "strftime"):
+        return valor.strftime("%Y%m%d")
+    if isinstance(valor, bytes):
+        valor = valor.decode("latin-1")
+    return str(valor).strip() or None
+
+
+class CatalogoRaw:
+    """Índice dos arquivos raw atualizado incrementalmente a partir dos rodapés parquet"""
+
+    def __init__(self, pasta_raw: Optional[Path] = None, arquivo_catalogo: Optional[Path] = None):
+        self.pasta_raw = Path(pasta_raw or Settings.RAW_DIR)
+        if arquivo_catalogo is None:
+            # Pastas raw alternativas (ex.: fixtures) guardam o próprio catálogo
+            arquivo_catalogo = (
+                Settings.DATA_DIR / Settings.CATALOGO_RAW_FILENAME
+                if self.pasta_raw == Settings.RAW_DIR
+                else self.pasta_raw / f"_{Settings.CATALOGO_RAW_FILENAME}"
+            )
+        self.arquivo_catalogo = Path(arquivo_catalogo)
+
+    def carregar(self) -> pl.DataFrame:
+        """Lê o catálogo persistido, sem tocar nos arquivos raw"""
+        if not self.arquivo_catalogo.exists():
+            return pl.DataFrame(schema=SCHEMA_CATALOGO)
+        catalogo = pl.read_parquet(self.arquivo_catalogo)
+        if "ilegivel" not in catalogo.columns:
+            # Catálogos gravados antes da coluna
+            catalogo = catalogo.with_columns(pl.lit(False).alias("ilegivel"))
+        return catalogo
+
+    def listar_arquivos(self) -> List[Path]:
+        """Lista os parquets da pasta raw (temporários e arquivos de controle '_*' são ignorados)"""
+        if not self.pasta_raw.exists():
+            return []
+        return sorted(
+            p for p in self.pasta_raw.rglob("*.parquet")
+            if p.is_file() and not p.name.startswith("_")
+        )
+
+    def ler_rodape(self, caminho: Path, stat: os.stat_result) -> dict:
+        """Extrai as estatísticas de um arquivo lendo somente o rodapé"""
+        metadados = pq.read_metadata(caminho)
+        schema = metadados.schema.to_arrow_schema()
+        uf, ano, mes, nome = competencia_do_caminho(caminho)
+
+        dt_min = dt_max = None
+        if "DT_INTER" in schema.names:
+            indice = schema.get_field_index("DT_INTER")
+            for rg in range(metadados.num_row_groups):
+                stats = metadados.row_group(rg).column(indice).statistics
+                if stats is None or not stats.has_min_max:
+                    continue
+                minimo, maximo = _normalizar_data(stats.min), _normalizar_data(stats.max)
+                if minimo and (dt_min is None or minimo < dt_min):
+                    dt_min = minimo
+                if maximo and (dt_max is None or maximo > dt_max):
+                    dt_max = maximo
+
+        return {
+            "caminho": caminho.relative_to(self.pasta_raw).as_posix(),
+            "nome": nome,
+            "uf": uf,
+            "ano": ano,
+            "mes": mes,
+            "linhas": metadados.num_rows,
+            "row_groups": metadados.num_row_groups,
+            "colunas": list(schema.names),
+            "schema_hash": fingerprint_schema(schema),
+            "dt_inter_min": dt_min,
+            "dt_inter_max": dt_max,
+            "tamanho_bytes": stat.st_size,
+            "mtime": stat.st_mtime,
+            "ilegivel": False,
+        }
+
+    def atualizar(self) -> pl.DataFrame:
+        """
+        Sincroniza o catálogo com a pasta raw. Apenas arquivos novos ou com tamanho/mtime
+        alterados têm o rodapé relido; arquivos removidos saem do catálogo. Um arquivo já
+        catalogado cujo rodapé fica ilegível (ex.: erro transitório de leitura) mantém a
+        linha anterior, marcada como `ilegivel`, e é relido na próxima atualização.
+        """
+        atual = self.carregar()
+        conhecidos = {
+            linha["caminho"]: linha for linha in atual.iter_rows(named=True)
+        }
+
+        linhas, novos, alterados, com_erro = [], 0, 0, 0
+        for caminho in self.listar_arquivos():
+            chave = caminho.relative_to(self.pasta_raw).as_posix()
+            stat = caminho.stat()
+            anterior = conhecidos.get(chave)
+            if anterior and anterior["tamanho_bytes"] == stat.st_size and anterior["mtime"] == stat.st_mtime:
+                linhas.append(anterior)
+                continue
+            try:
+                linhas.append(self.ler_rodape(caminho, stat))
+            except Exception as e:
+                com_erro += 1
+                if anterior:
+                    # Tamanho/mtime continuam os da leitura anterior: o rodapé é relido na próxima vez
+                    linhas.append({**anterior, "ilegivel": True})
+                    logger.warning(f"Rodapé ilegível em {chave} (mantida a linha anterior): {e}")
+                else:
+                    logger.warning(f"Rodapé ilegível em {chave}: {e}")
+                continue
+            if anterior:
+                alterados += 1
+            else:
+                novos += 1
+
+        removidos = len(set(conhecidos) - {linha["caminho"] for linha in linhas})
+        catalogo = pl.DataFrame(linhas, schema=SCHEMA_CATALOGO) if linhas else pl.DataFrame(schema=SCHEMA_CATALOGO)
+
+        if novos or alterados or removidos or com_erro or not self.arquivo_catalogo.exists():
+            self.arquivo_catalogo.parent.mkdir(parents=True, exist_ok=True)
+            temp = self.arquivo_catalogo.with_name(self.arquivo_catalogo.name + ".tmp")
+            catalogo.write_parquet(temp, compression="snappy")
+            os.replace(temp, self.arquivo_catalogo)
+
+        logger.info(
+            f"Catálogo raw: {catalogo.height} arquivos ({novos} novos, {alterados} alterados, "
+            f"{removidos} removidos, {com_erro} ilegíveis)"
+        )
+        return catalogo
+
+    def resumo(self, catalogo: Optional[pl.DataFrame] = None) -> pl.DataFrame:
+        """Totais por UF e ano"""
+        catalogo = self.carregar() if catalogo is None else catalogo
+        return (
+            catalogo.group_by(["uf", "ano"])
+            .agg(
+                pl.len().alias("arquivos"),
+                pl.col("linhas").sum(),
+                pl.col("tamanho_bytes").sum(),
+                pl.col("schema_hash").n_unique().alias("schemas"),
+                pl.col("dt_inter_min").min(),
+                pl.col("dt_inter_max").max(),
+            )
+            .sort(["uf", "ano"])
+        )
+
+
+def main():
+    """Atualiza o catálogo e exibe o resumo"""
+    catalogo_raw = CatalogoRaw()
+    catalogo = catalogo_raw.atualizar()
+    with pl.Config(tbl_rows=-1):
+        print(catalogo_raw.resumo(catalogo))
+    print(f"\nTotal: {catalogo.height} arquivos | {catalogo['linhas'].sum():,} registros")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""
+Codificação inteira compacta dos códigos CID-10
+Localização: projeto_sih/src/data/cid.py
+Função: Converte CIDs (letra, dois dígitos e subcategoria opcional) em inteiros
+reversíveis e ordenados, para armazenamento compacto e consultas por faixa
+(capítulo/bloco) como BETWEEN sobre inteiros, no polars e no PostgreSQL
+
+Codificação: (letra A=1..Z=26) × 10000 + número × 100 + (subcategoria + 1, ou 0 sem subcategoria)
+    '0' (não preenchido) → 0 | I21 → 92100 | I210 → 92101 | I219 → 92110
+A ordem dos inteiros é a ordem dos códigos, e uma categoria (I21) precede as suas subcategorias.
+"""
+import string
+from typing import Optional, Tuple
+
+import polars as pl
+
+LETRAS = list(string.ascii_uppercase)
+PADRAO_CID = r"^[A-Z][0-9]{2}[0-9]?$"
+SUFIXO_COLUNA = "_COD"
+
+
+# === Python (escalares) ===
+
+def codigo_cid(cid: Optional[str]) -> Optional[int]:
+    """CID → inteiro (None se o código não tem o formato do CID-10)"""
+    if cid is None:
+        return None
+    cid = cid.strip().upper()
+    if cid == "0":
+        return 0
+    if not (3 <= len(cid) <= 4 and cid[0] in LETRAS and cid[1:].isdigit()):
+        return None
+    sub = int(cid[3]) + 1 if len(cid) == 4 else 0
+    return (LETRAS.index(cid[0]) + 1) * 10000 + int(cid[1:3]) * 100 + sub
+
+
+def cid_do_codigo(codigo: Optional[int]) -> Optional[str]:
+    """Inteiro → CID"""
+    if codigo is None:
+        return None
+    if codigo == 0:
+        return "0"
+    letra, resto = divmod(codigo, 10000)
+    numero, sub = divmod(resto, 100)
+    return f"{LETRAS[letra - 1]}{numero:02d}{sub - 1 if sub else ''}"
+
+
+def faixa_cid(inicio: str, fim: str) -> Tuple[int, int]:
+    """
+    Limites inteiros (inclusivos) de uma faixa de CIDs, ex.: faixa_cid('I00', 'I99') para o
+    capítulo IX. Um fim sem subcategoria inclui todas as subcategorias dele.
+    """
+    baixo, alto = codigo_cid(inicio), codigo_cid(fim)
+    if baixo is None or alto is None:
+        raise ValueError(f"Faixa de CID inválida: {inicio}–{fim}")
+    if len(fim.strip()) == 3:
+        alto += 10
+    return baixo, alto
+
+
+# === Polars ===
+
+def codificar_cid(e: pl.Expr, dtype: Optional[pl.DataType] = None) -> pl.Expr:
+    """
+    Expressão CID → Int32. Com `dtype` Enum (ver rules.dicionario_cid10) o código de cada
+    categoria é calculado uma vez e cada linha é só um gather pelo índice físico.
+    """
+    if isinstance(dtype, pl.Enum):
+        categorias = dtype.categories
+        codigos = pl.Series([codigo_cid(c) for c in categorias], dtype=pl.Int32)
+        return pl.lit(codigos).gather(e.to_physical())
+
+    s = e.cast(pl.String).str.strip_chars().str.to_uppercase()
+    letra = s.str.slice(0, 1).replace_strict(LETRAS, list(range(1, 27)), default=None, return_dtype=pl.Int32)
+    numero = s.str.slice(1, 2).cast(pl.Int32, strict=False)
+    sub = (s.str.slice(3, 1).cast(pl.Int32, strict=False) + 1).fill_null(0)
+    return (
+        pl.when(s == "0").then(pl.lit(0, dtype=pl.Int32))
+        .when(s.str.contains(PADRAO_CID)).then(letra * 10000 + numero * 100 + sub)
+        .otherwise(None)
+        .cast(pl.Int32)
+    )
+
+
+def decodificar_cid(e: pl.Expr) -> pl.Expr:
+    """Expressão Int32 → CID (String)"""
+    letra = (e // 10000).replace_strict(list(range(1, 27)), LETRAS, default=None, return_dtype=pl.String)
+    numero = ((e // 100) % 100).cast(pl.String).str.zfill(2)
+    sub = e % 100
+    subcategoria = pl.when(sub > 0).then((sub - 1).cast(pl.String)).otherwise(pl.lit(""))
+    return pl.when(e == 0).then(pl.lit("0")).otherwise(pl.concat_str([letra, numero, subcategoria]))
+
+
+def coluna_codificada(df: pl.DataFrame, coluna: str) -> pl.DataFrame:
+    """Acrescenta `<coluna>_COD` ao DataFrame"""
+    return df.with_columns(codificar_cid(pl.col(coluna), df.schema[coluna]).alias(coluna + SUFIXO_COLUNA))
+
+
+# === PostgreSQL ===
+
+# Funções IMMUTABLE: podem ser usadas em índices de expressão e nos testes do dbt
+SQL_FUNCOES_CID = """
+CREATE OR REPLACE FUNCTION cid_codificar(cid TEXT) RETURNS INTEGER AS $$
+    SELECT CASE
+        WHEN TRIM(cid) = '0' THEN 0
+        WHEN UPPER(TRIM(cid)) ~ '^[A-Z][0-9]{2}[0-9]?$' THEN
+            (ASCII(UPPER(SUBSTR(TRIM(cid), 1, 1))) - 64) * 10000
+            + SUBSTR(TRIM(cid), 2, 2)::INTEGER * 100
+            + COALESCE(NULLIF(SUBSTR(TRIM(cid), 4, 1), '')::INTEGER + 1, 0)
+    END
+$$ LANGUAGE SQL IMMUTABLE STRICT;
+
+CREATE OR REPLACE FUNCTION cid_decodificar(codigo INTEGER) RETURNS TEXT AS $$
+    SELECT CASE
+        WHEN codigo = 0 THEN '0'
+        ELSE CHR(64 + codigo / 10000)
+             || LPAD(((codigo / 100) % 100)::TEXT, 2, '0')
+             || CASE WHEN codigo % 100 > 0 THEN ((codigo % 100) - 1)::TEXT ELSE '' END
+    END
+$$ LANGUAGE SQL IMMUTABLE STRICT;
+"""
@@ -0,0 +1,178 @@
+"""
+Conversor nativo DBC → Parquet
+Localização: projeto_sih/src/data/convert.py
+Função: EXTRACT - Descomprime .dbc (PKWare DCL, via pyreaddbc), lê o DBF e grava um parquet
+tipado por competência em RAW_DIR/uf=XX/ano=AAAA/mes=MM/, usando um pool de processos
+"""
+import os
+import re
+import sys
+import struct
+import logging
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Iterable, List, Optional, Tuple
+
+import numpy as np
+import polars as pl
+from pyreaddbc import dbc2dbf
+from tqdm import tqdm
+
+SRC_DIR = Path(__file__).parent.parent
+sys.path.insert(0, str(SRC_DIR))
+from config.settings import Settings
+from data.rules import decodificar_datas
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+# === DESCOMPRESSÃO ===
+
+def dbc_para_dbf(caminho_dbc: Path, pasta_temp: Path) -> bytes:
+    """
+    Descomprime um .dbc (PKWare DCL) com o decodificador em C do pyreaddbc (dependência do
+    pysus) e devolve o DBF. O pyreaddbc só trabalha com arquivos: o DBF passa por um .tmp
+    na pasta de destino e é removido em seguida.
+    """
+    temp = pasta_temp / f"{caminho_dbc.stem}.dbf.tmp"
+    try:
+        dbc2dbf(str(caminho_dbc), str(temp))
+        return temp.read_bytes()
+    finally:
+        temp.unlink(missing_ok=True)
+
+
+# === LEITURA DO DBF ===
+
+def ler_dbf(dados: bytes, encoding: str = "latin-1") -> pl.DataFrame:
+    """
+    Lê um DBF (dBase III) de forma vetorizada.
+    Campos N viram Int64 (sem casas decimais) ou Float64, campos D viram Date e os
+    demais permanecem texto sem espaços de preenchimento.
+    """
+    n_registros = struct.unpack_from("<I", dados, 4)[0]
+    tam_header, tam_registro = struct.unpack_from("<HH", dados, 8)
+
+    campos = []
+    pos, offset = 32, 1  # O primeiro byte de cada registro é a flag de exclusão
+    while pos + 32 <= tam_header and dados[pos] != 0x0D:
+        nome = dados[pos:pos + 11].split(b"\x00", 1)[0].decode("ascii").strip()
+        tipo = chr(dados[pos + 11]).upper()
+        tamanho, decimais = dados[pos + 16], dados[pos + 17]
+        campos.append((nome, tipo, offset, tamanho, decimais))
+        offset += tamanho
+        pos += 32
+
+    disponiveis = max(0, (len(dados) - tam_header) // tam_registro)
+    n_registros = min(n_registros, disponiveis)
+    registros = np.frombuffer(
+        dados, dtype=np.uint8, count=n_registros * tam_registro, offset=tam_header
+    ).reshape(n_registros, tam_registro)
+    registros = registros[registros[:, 0] != ord("*")]
+
+    colunas = []
+    for nome, tipo, inicio, tamanho, decimais in campos:
+        bruto = np.ascontiguousarray(registros[:, inicio:inicio + tamanho]).view(f"S{tamanho}").ravel()
+        serie = pl.Series(nome, np.char.decode(bruto, encoding), dtype=pl.String).str.strip_chars()
+
+        if tipo in ("N", "F"):
+            serie = serie.cast(pl.Int64 if decimais == 0 and tipo == "N" else pl.Float64, strict=False)
+        elif tipo == "D":
+            serie = decodificar_datas(serie.to_frame(), [nome]).to_series()
+        colunas.append(serie)
+
+    return pl.DataFrame(colunas)
+
+
+# === CONVERSÃO ===
+
+_PADRAO_NOME = re.compile(r"^([A-Z]{2})([A-Z]{2})(\d{2})(\d{2})$")
+
+
+def parse_nome_arquivo(nome: str) -> Tuple[str, int, int]:
+    """Extrai (UF, ano, mês) de um nome DATASUS como RDRS0801 ou RDRS0801.dbc"""
+    stem = Path(nome).name.split(".")[0].upper()
+    match = _PADRAO_NOME.match(stem)
+    if not match:
+        raise ValueError(f"Nome de arquivo DATASUS não reconhecido: {nome}")
+    _, uf, ano, mes = match.groups()
+    ano = int(ano)
+    ano += 1900 if ano >= 90 else 2000
+    return uf, ano, int(mes)
+
+
+def caminho_saida(caminho_dbc: Path, pasta_saida: Path) -> Path:
+    """Caminho do parquet de uma competência no layout particionado"""
+    uf, ano, mes = parse_nome_arquivo(caminho_dbc.name)
+    return pasta_saida / f"uf={uf}" / f"ano={ano}" / f"mes={mes:02d}" / f"{caminho_dbc.stem.upper()}.parquet"
+
+
+def converter_arquivo(caminho_dbc, pasta_saida, row_group_size: int) -> Tuple[str, int]:
+    """Converte um .dbc em um único parquet tipado (executa em processo worker)"""
+    caminho_dbc = Path(caminho_dbc)
+    destino = caminho_saida(caminho_dbc, Path(pasta_saida))
+    destino.parent.mkdir(parents=True, exist_ok=True)
+
+    df = ler_dbf(dbc_para_dbf(caminho_dbc, destino.parent))
+
+    temp = destino.with_name(destino.name + ".tmp")
+    df.write_parquet(temp, compression="snappy", row_group_size=row_group_size, statistics=True)
+    os.replace(temp, destino)
+    return str(destino), df.height
+
+
+class ConversorDBC:
+    """Converte arquivos .dbc para parquet em paralelo, um processo por arquivo"""
+
+    def __init__(
+        self,
+        pasta_saida: Optional[Path] = None,
+        max_workers: Optional[int] = None,
+        row_group_size: Optional[int] = None,
+    ):
+        self.pasta_saida = Path(pasta_saida or Settings.RAW_DIR)
+        self.max_workers = max_workers or Settings.CONVERSAO_WORKERS or os.cpu_count() or 1
+        self.row_group_size = row_group_size or Settings.PARQUET_ROW_GROUP_SIZE
+
+    def pendentes(self, arquivos_dbc: Iterable[Path]) -> List[Path]:
+        """Arquivos sem parquet de saída ou com parquet mais antigo que o .dbc"""
+        pendentes = []
+        for caminho in arquivos_dbc:
+            caminho = Path(caminho)
+            destino = caminho_saida(caminho, self.pasta_saida)
+            if not destino.exists() or destino.stat().st_mtime < caminho.stat().st_mtime:
+                pendentes.append(caminho)
+        return pendentes
+
+    def converter(self, arquivos_dbc: Iterable[Path]) -> dict:
+        """
+        Converte os arquivos pendentes.
+        Retorna {'convertidos': [(Path, linhas)], 'falhas': [(nome, erro)]}.
+        """
+        a_converter = self.pendentes(arquivos_dbc)
+        resultado = {"convertidos": [], "falhas": []}
+        if not a_converter:
+            logger.info("Nenhum arquivo .dbc pendente de conversão")
+            return resultado
+
+        workers = min(self.max_workers, len(a_converter))
+        logger.info(f"Convertendo {len(a_converter)} arquivos .dbc com {workers} processos...")
+
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futuros = {
+                executor.submit(converter_arquivo, str(c), str(self.pasta_saida), self.row_group_size): c
+                for c in a_converter
+            }
+            for futuro in tqdm(as_completed(futuros), total=len(futuros), desc="Convertendo"):
+                caminho = futuros[futuro]
+                try:
+                    destino, linhas = futuro.result()
+                    resultado["convertidos"].append((Path(destino), linhas))
+                except Exception as e:
+                    logger.error(f"Erro ao converter {caminho.name}: {e}")
+                    resultado["falhas"].append((caminho.name, str(e)))
+
+        total_linhas = sum(linhas for _, linhas in resultado["convertidos"])
+        logger.info(f"Conversão concluída: {len(resultado['convertidos'])} arquivos, {total_linhas:,} registros")
+        return resultado
@@ -1,7 +1,7 @@
 """
 Download DATASUS
 Localização: projeto_sih/src/data/download.py
-Função: EXTRACT - Baixa dados SIH/SUS (.dbc) e converte para .parquet
+Função: EXTRACT - Baixa dados SIH/SUS (.dbc) e converte para .parquet particionado (uf=/ano=/mes=)
 """
 import sys
 from pathlib import Path
@@ -10,22 +10,22 @@ from tqdm import tqdm
 import logging
 import time
 import psutil
+import polars as pl
 
 SRC_DIR = Path(__file__).parent.parent
 sys.path.insert(0, str(SRC_DIR))
 from config.settings import Settings
+from data.download_engine import ArquivoRemoto, DownloadEngine, FonteFTP
+from data.convert import ConversorDBC
+from data.catalog import CatalogoRaw
 
 def verificar_arquivos_existentes():
-    """Conta arquivos já baixados"""
-    pasta = Settings.RAW_DIR
-    
-    if not pasta.exists():
+    """Conta arquivos já baixados a partir do catálogo raw (só relê rodapés de arquivos novos)"""
+    if not Settings.RAW_DIR.exists():
         return 0, set()
     
-    nomes_existentes = {
-        arquivo.stem for arquivo in pasta.glob("*.parquet")
-        if arquivo.stat().st_size > 0
-    }
+    catalogo = CatalogoRaw().atualizar()
+    nomes_existentes = set(catalogo.filter(pl.col("linhas") > 0)["nome"].drop_nulls().to_list())
     
     return len(nomes_existentes), nomes_existentes
 
@@ -100,59 +100,42 @@ def main():
     
     print(f"Baixando {len(arquivos_a_baixar)} arquivos...")
     
-    try:
-        if len(arquivos_a_baixar) > 20:
-            baixados_total = []
-            lote_size = 18
-            
-            for i in range(0, len(arquivos_a_baixar), lote_size):
-                lote = arquivos_a_baixar[i:i + lote_size]
-                lote_num = i // lote_size + 1
-                total_lotes = (len(arquivos_a_baixar) - 1) // lote_size + 1
-                
-                print(f"Lote {lote_num}/{total_lotes} ({len(lote)} arquivos)...")
-                
-                try:
-                    baixados_lote = sih.download(lote, local_dir=Settings.RAW_DIR)
-                    baixados_total.extend(baixados_lote)
-                    
-                    progresso = len(baixados_total) / len(arquivos_a_baixar) * 100
-                    print(f"{len(baixados_total)}/{len(arquivos_a_baixar)} ({progresso:.0f}%)")
-                    
-                except Exception as e:
-                    print(f"Erro lote {lote_num}: {e}")
-                    continue
-            
-            baixados = baixados_total
-        else:
-            baixados = sih.download(arquivos_a_baixar, local_dir=Settings.RAW_DIR)
-        
-        print("CONCLUÍDO!")
-        print(f"{len(baixados)} baixados | Total: {qtd_existentes + len(baixados)} arquivos")
-        
-    except Exception as e:
-        print(f"Erro: {e}")
+    engine = DownloadEngine(FonteFTP(), pasta_destino=Settings.DBC_DIR)
+    resultado = engine.baixar(ArquivoRemoto.de_pysus(a) for a in arquivos_a_baixar)
+    
+    # Arquivos baixados em execuções anteriores mas ainda não convertidos também entram
+    nomes_a_baixar = {Path(str(a)).name for a in arquivos_a_baixar}
+    a_converter = [
+        Settings.DBC_DIR / nome for nome in nomes_a_baixar
+        if (Settings.DBC_DIR / nome).exists()
+    ]
+    
+    conversao = ConversorDBC(pasta_saida=Settings.RAW_DIR).converter(sorted(a_converter))
+    convertidos = len(conversao["convertidos"])
+    for nome, erro in conversao["falhas"]:
+        print(f"Erro ao converter {nome}: {erro}")
+    
+    print("CONCLUÍDO!")
+    print(f"{len(resultado['baixados'])} baixados | {convertidos} convertidos | Total: {qtd_existentes + convertidos} arquivos")
+    if resultado["falhas"]:
+        print(f"{len(resultado['falhas'])} arquivos falharam após {engine.tentativas} tentativas "
+              "(serão retomados na próxima execução):")
+        for nome, erro in resultado["falhas"]:
+            print(f"   {nome}: {erro}")
    
     # --- LOG EXTRA DE DESEMPENHO ---
     process = psutil.Process()
     mem_mb = process.memory_info().rss / 1024 / 1024
 
-    # Conta pastas e arquivos no diretório RAW
-    num_pastas = sum(1 for p in Settings.RAW_DIR.iterdir() if p.is_dir())
-    num_arquivos = sum(1 for p in Settings.RAW_DIR.glob("*.parquet"))
-
-    # Conta registros totais (soma das linhas de cada parquet)
-    total_registros = 0
-    for arquivo in Settings.RAW_DIR.glob("*.parquet"):
-        try:
-            df = pl.read_parquet(arquivo, n_rows=5_000)  # leitura parcial p/ desempenho
-            total_registros += df.height
-        except Exception:
-            continue
+    # Contagens exatas a partir dos rodapés (catálogo), sem ler páginas de dados
+    catalogo = CatalogoRaw().atualizar()
+    num_competencias = catalogo.select(pl.struct("uf", "ano", "mes").n_unique()).item() if catalogo.height else 0
+    num_arquivos = catalogo.height
+    total_registros = catalogo["linhas"].sum() or 0
 
-    logger.info(f" Pastas: {num_pastas} | Arquivos: {num_arquivos} | Registros (amostra): {total_registros:,}")
+    logger.info(f" Competências: {num_competencias} | Arquivos: {num_arquivos} | Registros: {total_registros:,}")
     logger.info(f" Memória utilizada: {mem_mb:.2f} MB")
-    print(f"\n Pastas: {num_pastas} | Arquivos: {num_arquivos} | Registros (amostra): {total_registros:,}")
+    print(f"\n Competências: {num_competencias} | Arquivos: {num_arquivos} | Registros: {total_registros:,}")
     print(f" Memória utilizada: {mem_mb:.2f} MB")
     fim = time.time()
     duracao_min = (fim - inicio) / 60
@@ -0,0 +1,279 @@
+"""
+Motor de download concorrente e retomável do DATASUS
+Localização: projeto_sih/src/data/download_engine.py
+Função: EXTRACT - Baixa arquivos .dbc com pool de workers, retentativas e manifesto de progresso
+"""
+import sys
+import json
+import os
+import time
+import random
+import shutil
+import logging
+import threading
+from ftplib import FTP
+from pathlib import Path
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, Iterable, List, Optional
+
+from tqdm import tqdm
+
+SRC_DIR = Path(__file__).parent.parent
+sys.path.insert(0, str(SRC_DIR))
+from config.settings import Settings
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+class ArquivoRemoto:
+    """Arquivo disponível na fonte (FTP do DATASUS ou diretório local)"""
+
+    def __init__(self, nome: str, caminho: str, tamanho: Optional[int] = None):
+        self.nome = nome
+        self.caminho = caminho
+        self.tamanho = tamanho
+
+    @classmethod
+    def de_pysus(cls, arquivo) -> "ArquivoRemoto":
+        """Converte um `File` do pysus (resultado de `SIH().get_files`)"""
+        info = getattr(arquivo, "__info__", {}) or {}
+        tamanho = info.get("size")
+        return cls(
+            nome=arquivo.basename,
+            caminho=arquivo.path,
+            tamanho=int(tamanho) if tamanho is not None else None,
+        )
+
+    def __repr__(self) -> str:
+        return f"ArquivoRemoto({self.nome})"
+
+
+class FonteFTP:
+    """Fonte FTP (DATASUS ou um servidor local que serve arquivos .dbc de teste)"""
+
+    def __init__(self, host: Optional[str] = None, porta: int = 21, timeout: int = 60):
+        self.host = host or Settings.DATASUS_FTP_HOST
+        self.porta = porta
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _conexao(self) -> FTP:
+        """Uma conexão por thread: o ftplib não é seguro para uso concorrente"""
+        ftp = getattr(self._local, "ftp", None)
+        if ftp is None:
+            ftp = FTP()
+            ftp.connect(self.host, self.porta, timeout=self.timeout)
+            ftp.login()
+            self._local.ftp = ftp
+        return ftp
+
+    def _descartar_conexao(self):
+        ftp = getattr(self._local, "ftp", None)
+        self._local.ftp = None
+        if ftp is not None:
+            try:
+                ftp.close()
+            except Exception:
+                pass
+
+    def listar(self, diretorio: str, prefixo: str = "") -> List[ArquivoRemoto]:
+        """Lista os arquivos .dbc de um diretório remoto"""
+        ftp = self._conexao()
+        arquivos = []
+        for nome in ftp.nlst(diretorio):
+            nome_base = nome.rsplit("/", 1)[-1]
+            if not nome_base.lower().endswith(".dbc") or not nome_base.upper().startswith(prefixo.upper()):
+                continue
+            caminho = f"{diretorio.rstrip('/')}/{nome_base}"
+            try:
+                tamanho = ftp.size(caminho)
+            except Exception:
+                tamanho = None
+            arquivos.append(ArquivoRemoto(nome_base, caminho, tamanho))
+        return arquivos
+
+    def baixar(self, arquivo: ArquivoRemoto, saida, offset: int = 0) -> None:
+        """Escreve o conteúdo remoto em `saida`, retomando a partir de `offset` bytes"""
+        ftp = self._conexao()
+        try:
+            ftp.voidcmd("TYPE I")
+            ftp.retrbinary(f"RETR {arquivo.caminho}", saida.write, rest=offset or None)
+        except Exception:
+            # Conexão em estado desconhecido: a próxima tentativa abre outra
+            self._descartar_conexao()
+            raise
+
+
+class FonteLocal:
+    """Fonte em diretório local, usada para testes e espelhos do FTP"""
+
+    def __init__(self, diretorio: Path):
+        self.diretorio = Path(diretorio)
+
+    def listar(self, prefixo: str = "") -> List[ArquivoRemoto]:
+        """Lista os arquivos .dbc do diretório"""
+        return [
+            ArquivoRemoto(p.name, str(p), p.stat().st_size)
+            for p in sorted(self.diretorio.glob("*"))
+            if p.suffix.lower() == ".dbc" and p.name.upper().startswith(prefixo.upper())
+        ]
+
+    def baixar(self, arquivo: ArquivoRemoto, saida, offset: int = 0) -> None:
+        """Copia o arquivo para `saida`, retomando a partir de `offset` bytes"""
+        with open(arquivo.caminho, "rb") as origem:
+            origem.seek(offset)
+            shutil.copyfileobj(origem, saida)
+
+
+class DownloadEngine:
+    """
+    Baixa arquivos com um pool limitado de workers.
+
+    Cada arquivo é escrito em `<nome>.part` e renomeado atomicamente ao final;
+    o manifesto registra os arquivos completos, de modo que uma execução
+    interrompida retoma apenas os arquivos ausentes ou parciais.
+    """
+
+    def __init__(
+        self,
+        fonte,
+        pasta_destino: Optional[Path] = None,
+        max_workers: Optional[int] = None,
+        tentativas: Optional[int] = None,
+        backoff: Optional[float] = None,
+        arquivo_manifesto: Optional[Path] = None,
+    ):
+        self.fonte = fonte
+        self.pasta_destino = Path(pasta_destino or Settings.DBC_DIR)
+        self.max_workers = max_workers or Settings.DOWNLOAD_WORKERS
+        self.tentativas = tentativas or Settings.DOWNLOAD_TENTATIVAS
+        self.backoff = Settings.DOWNLOAD_BACKOFF_SEG if backoff is None else backoff
+        self.arquivo_manifesto = arquivo_manifesto or self.pasta_destino / Settings.DOWNLOAD_MANIFEST_FILENAME
+        self.pasta_destino.mkdir(parents=True, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self.manifesto = self.carregar_manifesto()
+
+    # === MANIFESTO ===
+
+    def carregar_manifesto(self) -> Dict[str, dict]:
+        """Lê o manifesto de progresso (vazio se não existir ou estiver corrompido)"""
+        if not self.arquivo_manifesto.exists():
+            return {}
+        try:
+            with open(self.arquivo_manifesto, "r", encoding="utf-8") as f:
+                return json.load(f).get("arquivos", {})
+        except (json.JSONDecodeError, OSError) as e:
+            logger.warning(f"Manifesto ilegível ({e}); todos os arquivos serão verificados novamente")
+            return {}
+
+    def _salvar_manifesto(self):
+        """Grava o manifesto de forma atômica (chamar com o lock adquirido)"""
+        temp = self.arquivo_manifesto.with_suffix(".json.tmp")
+        with open(temp, "w", encoding="utf-8") as f:
+            json.dump({"arquivos": self.manifesto}, f, indent=2, sort_keys=True)
+        os.replace(temp, self.arquivo_manifesto)
+
+    def _registrar(self, arquivo: ArquivoRemoto, tamanho: int):
+        with self._lock:
+            self.manifesto[arquivo.nome] = {
+                "origem": arquivo.caminho,
+                "tamanho": tamanho,
+                "concluido_em": datetime.now().isoformat(timespec="seconds"),
+            }
+            self._salvar_manifesto()
+
+    # === SELEÇÃO ===
+
+    def esta_completo(self, arquivo: ArquivoRemoto) -> bool:
+        """Um arquivo está completo se consta no manifesto e o tamanho em disco confere"""
+        registro = self.manifesto.get(arquivo.nome)
+        destino = self.pasta_destino / arquivo.nome
+        if not registro or not destino.exists():
+            return False
+        tamanho_local = destino.stat().st_size
+        if tamanho_local != registro["tamanho"]:
+            return False
+        return arquivo.tamanho is None or tamanho_local == arquivo.tamanho
+
+    def pendentes(self, arquivos: Iterable[ArquivoRemoto]) -> List[ArquivoRemoto]:
+        """Filtra os arquivos que ainda precisam ser baixados"""
+        return [a for a in arquivos if not self.esta_completo(a)]
+
+    # === DOWNLOAD ===
+
+    def _baixar_uma_vez(self, arquivo: ArquivoRemoto) -> Path:
+        destino = self.pasta_destino / arquivo.nome
+        parcial = destino.with_name(destino.name + ".part")
+
+        offset = parcial.stat().st_size if parcial.exists() else 0
+        if arquivo.tamanho is not None and offset >= arquivo.tamanho:
+            # Parcial inconsistente com o tamanho remoto: recomeça do zero
+            offset = 0
+
+        with open(parcial, "ab" if offset else "wb") as saida:
+            self.fonte.baixar(arquivo, saida, offset=offset)
+
+        tamanho = parcial.stat().st_size
+        if arquivo.tamanho is not None and tamanho != arquivo.tamanho:
+            if tamanho > arquivo.tamanho:
+                parcial.unlink()
+            raise IOError(f"{arquivo.nome}: tamanho {tamanho} difere do remoto {arquivo.tamanho}")
+
+        os.replace(parcial, destino)
+        self._registrar(arquivo, tamanho)
+        return destino
+
+    def baixar_arquivo(self, arquivo: ArquivoRemoto) -> Path:
+        """Baixa um arquivo com retentativas e backoff exponencial"""
+        for tentativa in range(1, self.tentativas + 1):
+            try:
+                return self._baixar_uma_vez(arquivo)
+            except Exception as e:
+                if tentativa == self.tentativas:
+                    raise
+                espera = self.backoff * (2 ** (tentativa - 1)) * random.uniform(0.8, 1.2)
+                logger.warning(
+                    f"{arquivo.nome}: tentativa {tentativa}/{self.tentativas} falhou ({e}). "
+                    f"Nova tentativa em {espera:.1f}s"
+                )
+                time.sleep(espera)
+
+    def baixar(self, arquivos: Iterable[ArquivoRemoto]) -> Dict[str, list]:
+        """
+        Baixa os arquivos pendentes em paralelo.
+        Retorna {'baixados': [Path], 'ignorados': [nome], 'falhas': [(nome, erro)]}.
+        """
+        arquivos = list(arquivos)
+        a_baixar = self.pendentes(arquivos)
+        nomes_pendentes = {a.nome for a in a_baixar}
+        resultado = {
+            "baixados": [],
+            "ignorados": [a.nome for a in arquivos if a.nome not in nomes_pendentes],
+            "falhas": [],
+        }
+
+        logger.info(
+            f"Download: {len(a_baixar)} pendentes, {len(resultado['ignorados'])} já completos "
+            f"({self.max_workers} workers)"
+        )
+        if not a_baixar:
+            return resultado
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futuros = {executor.submit(self.baixar_arquivo, a): a for a in a_baixar}
+            for futuro in tqdm(as_completed(futuros), total=len(futuros), desc="Baixando"):
+                arquivo = futuros[futuro]
+                try:
+                    resultado["baixados"].append(futuro.result())
+                except Exception as e:
+                    logger.error(f"Falha definitiva em {arquivo.nome}: {e}")
+                    resultado["falhas"].append((arquivo.nome, str(e)))
+
+        logger.info(
+            f"Download concluído: {len(resultado['baixados'])} baixados, "
+            f"{len(resultado['falhas'])} falhas"
+        )
+        return resultado
@@ -0,0 +1,191 @@
+"""
+Harmonização de schemas dos arquivos raw
+Localização: projeto_sih/src/data/harmonize.py
+Função: TRANSFORM - Projeta cada arquivo raw no schema canônico tipado da unificação,
+com um plano de cast/preenchimento por fingerprint de schema, cacheado em disco
+"""
+import os
+import sys
+import json
+import hashlib
+import logging
+import tempfile
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import polars as pl
+
+SRC_DIR = Path(__file__).parent.parent
+sys.path.insert(0, str(SRC_DIR))
+from config.settings import Settings
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+# Tipos canônicos do dataset unificado. Códigos (N_AIH, CNES, CIDs, municípios...) e datas
+# ficam como texto, como no DATASUS (datas em AAAAMMDD); campos numéricos do DBF ficam numéricos.
+# Colunas não listadas aqui são tratadas como pl.String.
+SCHEMA_CANONICO = {
+    "VAL_SH": pl.Float64,
+    "VAL_SP": pl.Float64,
+    "VAL_TOT": pl.Float64,
+    "VAL_UTI": pl.Float64,
+    "UTI_MES_TO": pl.Int32,
+    "UTI_INT_TO": pl.Int32,
+    "DIAR_ACOM": pl.Int32,
+    "IDADE": pl.Int32,
+    "DIAS_PERM": pl.Int32,
+    "NUM_FILHOS": pl.Int32,
+    "MORTE": pl.Int32,
+}
+
+FORMATO_DATA = "%Y%m%d"
+
+# Ações possíveis de um plano, por coluna
+MANTER = "manter"                 # Já está no tipo canônico
+NULA = "nula"                     # Coluna ausente no arquivo
+DATA_TEXTO = "data_texto"         # Date/Datetime → AAAAMMDD
+TEXTO_NUMERO = "texto_numero"     # Texto → número (remove espaços, vírgula decimal)
+CAST = "cast"                     # Demais conversões (cast não estrito)
+
+
+def tipo_canonico(coluna: str) -> pl.DataType:
+    return SCHEMA_CANONICO.get(coluna, pl.String)
+
+
+def definir_acao(origem: Optional[pl.DataType], alvo: pl.DataType) -> str:
+    """Escolhe como levar uma coluna do tipo de origem ao tipo canônico"""
+    if origem is None or origem == pl.Null:
+        return NULA
+    if origem == alvo:
+        return MANTER
+    if alvo == pl.String and origem.is_temporal():
+        return DATA_TEXTO
+    if origem == pl.String and alvo.is_numeric():
+        return TEXTO_NUMERO
+    return CAST
+
+
+def expressao(coluna: str, acao: str) -> pl.Expr:
+    """Expressão polars que aplica a ação de uma coluna"""
+    alvo = tipo_canonico(coluna)
+    if acao == MANTER:
+        return pl.col(coluna)
+    if acao == NULA:
+        return pl.lit(None, dtype=alvo).alias(coluna)
+    if acao == DATA_TEXTO:
+        return pl.col(coluna).dt.strftime(FORMATO_DATA).alias(coluna)
+    if acao == TEXTO_NUMERO:
+        return (
+            pl.col(coluna)
+            .str.strip_chars()
+            .str.replace_all(",", ".")
+            .cast(alvo, strict=False)
+            .alias(coluna)
+        )
+    return pl.col(coluna).cast(alvo, strict=False).alias(coluna)
+
+
+class HarmonizadorSchema:
+    """
+    Mantém um plano de projeção por fingerprint de schema (ver catalog.fingerprint_schema).
+
+    O schema de um arquivo só é lido quando o seu fingerprint ainda não tem plano;
+    os planos ficam em um JSON junto ao dataset unificado e são invalidados quando
+    as colunas ou os tipos canônicos mudam.
+    """
+
+    def __init__(self, colunas: List[str], arquivo_cache: Optional[Path] = None):
+        self.colunas = list(colunas)
+        self.arquivo_cache = Path(
+            arquivo_cache or Settings.INTERIM_DIR / Settings.UNIFIED_DIRNAME / Settings.HARMONIZACAO_CACHE_FILENAME
+        )
+        self.versao = self._versao()
+        self.planos = self.carregar_cache()
+        self.planos_novos = 0
+
+    @property
+    def schema(self) -> Dict[str, pl.DataType]:
+        """Schema canônico (ordenado) do dataset unificado"""
+        return {col: tipo_canonico(col) for col in self.colunas}
+
+    def schema_serializado(self) -> Dict[str, str]:
+        return {col: str(tipo) for col, tipo in self.schema.items()}
+
+    def _versao(self) -> str:
+        assinatura = json.dumps(self.schema_serializado(), sort_keys=False)
+        return hashlib.sha1(assinatura.encode("utf-8")).hexdigest()[:16]
+
+    def carregar_cache(self) -> Dict[str, dict]:
+        if not self.arquivo_cache.exists():
+            return {}
+        try:
+            with open(self.arquivo_cache, "r", encoding="utf-8") as f:
+                cache = json.load(f)
+        except (json.JSONDecodeError, OSError) as e:
+            logger.warning(f"Cache de harmonização ilegível ({e}); os planos serão recalculados")
+            return {}
+        if cache.get("versao") != self.versao:
+            logger.info("Schema canônico alterado: planos de harmonização descartados")
+            return {}
+        return cache.get("planos", {})
+
+    def salvar_cache(self):
+        """
+        Grava o cache (apenas se algum plano novo foi calculado). O arquivo é compartilhado
+        pelas UFs em execução simultânea: os planos gravados por outro processo são mesclados
+        antes, cada processo usa o seu próprio temporário e uma falha só custa recalcular os
+        planos na próxima execução (o cache é apenas um atalho).
+        """
+        if not self.planos_novos:
+            return
+        self.planos = {**self.carregar_cache(), **self.planos}
+        temp = None
+        try:
+            self.arquivo_cache.parent.mkdir(parents=True, exist_ok=True)
+            with tempfile.NamedTemporaryFile(
+                "w", encoding="utf-8", dir=self.arquivo_cache.parent,
+                prefix=f"{self.arquivo_cache.name}.", suffix=".tmp", delete=False
+            ) as f:
+                temp = Path(f.name)
+                json.dump({"versao": self.versao, "planos": self.planos}, f, indent=2, sort_keys=True)
+            os.replace(temp, self.arquivo_cache)
+        except OSError as e:
+            logger.warning(f"Cache de harmonização não gravado ({e}); os planos novos serão recalculados")
+            if temp is not None:
+                temp.unlink(missing_ok=True)
+        self.planos_novos = 0
+
+    def planejar(self, schema_origem: Dict[str, pl.DataType]) -> dict:
+        """Calcula o plano {coluna: {'acao', 'origem'}} para um schema de origem"""
+        return {
+            col: {
+                "acao": definir_acao(schema_origem.get(col), tipo_canonico(col)),
+                "origem": str(schema_origem[col]) if col in schema_origem else None,
+            }
+            for col in self.colunas
+        }
+
+    def plano(self, arquivo: Path, fingerprint: Optional[str] = None) -> dict:
+        """Plano do arquivo: do cache, se o fingerprint já é conhecido, ou lendo o schema"""
+        if fingerprint and fingerprint in self.planos:
+            return self.planos[fingerprint]
+        plano = self.planejar(dict(pl.read_parquet_schema(arquivo)))
+        if fingerprint:
+            self.planos[fingerprint] = plano
+            self.planos_novos += 1
+            convertidas = sum(1 for p in plano.values() if p["acao"] not in (MANTER, NULA))
+            ausentes = sum(1 for p in plano.values() if p["acao"] == NULA)
+            logger.info(
+                f"Novo plano de harmonização ({fingerprint}): {convertidas} colunas convertidas, "
+                f"{ausentes} ausentes"
+            )
+        return plano
+
+    def projetar(self, arquivo: Path, fingerprint: Optional[str] = None) -> pl.LazyFrame:
+        """LazyFrame do arquivo já no schema canônico"""
+        plano = self.plano(arquivo, fingerprint)
+        return pl.scan_parquet(arquivo).select(
+            [expressao(col, plano[col]["acao"]) for col in self.colunas]
+        )
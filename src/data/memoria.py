@@ -0,0 +1,158 @@
+"""
+Governador de memória
+Localização: projeto_sih/src/data/memoria.py
+Função: Mede a memória durante a execução (RSS do processo e dos workers, memória
+disponível da máquina) e ajusta o tamanho de chunk/lote de uma etapa entre iterações,
+para manter o uso abaixo de uma fração alvo da RAM. As decisões são exportadas como
+métricas (data/metricas/memoria_<etapa>.parquet)
+"""
+import sys
+import math
+import logging
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import polars as pl
+import psutil
+
+SRC_DIR = Path(__file__).parent.parent
+sys.path.insert(0, str(SRC_DIR))
+from config.settings import Settings
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+MB = 1024 * 1024
+
+# Abaixo de FOLGA x alvo o tamanho cresce; acima do alvo cai pela metade
+FOLGA = 0.75
+FATOR_AUMENTO = 1.25
+FATOR_REDUCAO = 0.5
+
+
+def amostrar_memoria() -> Dict[str, int]:
+    """RSS do processo somado ao dos processos filhos, memória disponível e total (bytes)"""
+    processo = psutil.Process()
+    rss = processo.memory_info().rss
+    for filho in processo.children(recursive=True):
+        try:
+            rss += filho.memory_info().rss
+        except (psutil.NoSuchProcess, psutil.AccessDenied):
+            continue
+    sistema = psutil.virtual_memory()
+    return {"rss": rss, "disponivel": sistema.available, "total": sistema.total}
+
+
+def orcamento_maquina(configurado_bytes: int, fracao_alvo: Optional[float] = None) -> int:
+    """O menor entre o orçamento configurado e a fração alvo da RAM desta máquina"""
+    fracao = fracao_alvo or Settings.MEMORIA_FRACAO_ALVO
+    return int(min(configurado_bytes, psutil.virtual_memory().total * fracao))
+
+
+class GovernadorMemoria:
+    """
+    Tamanho adaptativo de chunk/lote de uma etapa.
+
+    A cada `ajustar()` (entre iterações) a memória é amostrada: acima do alvo o tamanho
+    cai pela metade; com folga ele cresce 25%, desde que o acréscimo estimado
+    (`bytes_por_unidade`) caiba no que falta até o alvo. O tamanho fica entre `minimo`
+    e `maximo`. A unidade é a da etapa (linhas, arquivos, bytes).
+    """
+
+    def __init__(
+        self,
+        etapa: str,
+        inicial: int,
+        minimo: int = 1,
+        maximo: Optional[int] = None,
+        bytes_por_unidade: Optional[float] = None,
+        fracao_alvo: Optional[float] = None,
+    ):
+        self.etapa = etapa
+        self.minimo = max(1, minimo)
+        self.maximo = maximo
+        self.bytes_por_unidade = bytes_por_unidade
+        self.fracao_alvo = fracao_alvo or Settings.MEMORIA_FRACAO_ALVO
+        self.iteracao = 0
+        self.decisoes: List[dict] = []
+
+        # O tamanho inicial também precisa caber na folga atual da máquina
+        amostra = amostrar_memoria()
+        tamanho = self.limitar(inicial)
+        if self.bytes_por_unidade:
+            folga = self.alvo(amostra) - self.usado(amostra)
+            tamanho = self.limitar(min(tamanho, int(max(folga, 0) // self.bytes_por_unidade)))
+        self.tamanho = tamanho
+        self.registrar(amostra, inicial, "inicial" if tamanho == inicial else "inicial_limitado")
+
+    def alvo(self, amostra: Dict[str, int]) -> float:
+        return amostra["total"] * self.fracao_alvo
+
+    @staticmethod
+    def usado(amostra: Dict[str, int]) -> int:
+        return amostra["total"] - amostra["disponivel"]
+
+    def limitar(self, tamanho: int) -> int:
+        tamanho = max(self.minimo, tamanho)
+        return min(self.maximo, tamanho) if self.maximo else tamanho
+
+    def ajustar(self) -> int:
+        """Amostra a memória e devolve o tamanho para a próxima iteração"""
+        self.iteracao += 1
+        amostra = amostrar_memoria()
+        usado, alvo = self.usado(amostra), self.alvo(amostra)
+        anterior = self.tamanho
+
+        if usado > alvo:
+            novo, motivo = self.limitar(int(anterior * FATOR_REDUCAO)), "reduzir"
+        elif usado < alvo * FOLGA:
+            novo, motivo = self.limitar(math.ceil(anterior * FATOR_AUMENTO)), "aumentar"
+            if self.bytes_por_unidade and usado + (novo - anterior) * self.bytes_por_unidade > alvo:
+                novo, motivo = anterior, "manter"
+        else:
+            novo, motivo = anterior, "manter"
+        if novo == anterior:
+            motivo = "manter"
+
+        self.tamanho = novo
+        self.registrar(amostra, anterior, motivo)
+        if novo != anterior:
+            # Reduções importam para o operador; aumentos ficam no nível debug (e nas métricas)
+            log = logger.info if novo < anterior else logger.debug
+            log(
+                f"[memória] {self.etapa}: {anterior:,} → {novo:,} "
+                f"(uso {usado / amostra['total']:.0%}, alvo {self.fracao_alvo:.0%}, RSS {amostra['rss'] / MB:,.0f} MB)"
+            )
+        return novo
+
+    def registrar(self, amostra: Dict[str, int], anterior: int, motivo: str):
+        self.decisoes.append({
+            "etapa": self.etapa,
+            "iteracao": self.iteracao,
+            "instante": datetime.now(),
+            "rss_mb": amostra["rss"] / MB,
+            "disponivel_mb": amostra["disponivel"] / MB,
+            "total_mb": amostra["total"] / MB,
+            "uso_pct": 100 * self.usado(amostra) / amostra["total"],
+            "alvo_pct": 100 * self.fracao_alvo,
+            "tamanho_anterior": anterior,
+            "tamanho": self.tamanho,
+            "decisao": motivo,
+        })
+
+    def metricas(self) -> pl.DataFrame:
+        """Uma linha por amostra/decisão"""
+        return pl.DataFrame(self.decisoes)
+
+    def exportar_metricas(self, arquivo: Optional[Path] = None) -> Path:
+        """Grava as decisões em parquet (padrão: METRICAS_DIR/memoria_<etapa>.parquet)"""
+        arquivo = arquivo or Settings.METRICAS_DIR / f"memoria_{self.etapa}.parquet"
+        arquivo.parent.mkdir(parents=True, exist_ok=True)
+        self.metricas().write_parquet(arquivo)
+        pico = max(d["rss_mb"] for d in self.decisoes)
+        logger.info(
+            f"[memória] {self.etapa}: {len(self.decisoes)} amostras, RSS máximo {pico:,.0f} MB, "
+            f"tamanho final {self.tamanho:,} → {arquivo.name}"
+        )
+        return arquivo
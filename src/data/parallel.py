@@ -0,0 +1,96 @@
+"""
+Execução paralela por UF
+Localização: projeto_sih/src/data/parallel.py
+Função: Executa uma etapa do pipeline para várias UFs em processos separados,
+admitindo novas UFs apenas enquanto a memória estimada cabe no orçamento global
+"""
+import os
+import sys
+import logging
+import multiprocessing
+from pathlib import Path
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from typing import Any, Callable, Dict, List, Optional
+
+import polars as pl
+
+SRC_DIR = Path(__file__).parent.parent
+sys.path.insert(0, str(SRC_DIR))
+from config.settings import Settings
+from data.catalog import CatalogoRaw
+from data.memoria import orcamento_maquina
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+def estimar_memoria_ufs(ufs: List[str]) -> Dict[str, int]:
+    """Estimativa de pico de memória (bytes) por UF a partir das contagens do catálogo raw"""
+    catalogo = CatalogoRaw().carregar()
+    linhas = dict(
+        catalogo.group_by("uf").agg(pl.col("linhas").sum()).iter_rows()
+    ) if catalogo.height else {}
+    return {uf: int(linhas.get(uf, 0) or 0) * Settings.BYTES_POR_REGISTRO for uf in ufs}
+
+
+def executar_por_uf(
+    funcao: Callable[[str], Any],
+    ufs: Optional[List[str]] = None,
+    max_workers: Optional[int] = None,
+    orcamento_bytes: Optional[int] = None,
+    estimativas: Optional[Dict[str, int]] = None,
+    argumentos: Optional[Dict[str, tuple]] = None,
+) -> Dict[str, Any]:
+    """
+    Executa `funcao(uf, *argumentos[uf])` para cada UF e retorna {uf: resultado}.
+    `argumentos` leva a cada worker só o que é da sua UF (ex.: linhas do catálogo raw).
+
+    `funcao` precisa ser uma função de módulo (os workers usam 'spawn'). As UFs maiores
+    são iniciadas primeiro; uma UF só entra em execução se a soma das estimativas das
+    UFs em andamento couber no orçamento (uma UF maior que o orçamento roda sozinha).
+    """
+    ufs = [uf.upper() for uf in (ufs or Settings.UF_DEFAULT)]
+    max_workers = max_workers or Settings.WORKERS_UF or os.cpu_count() or 1
+    # O orçamento configurado nunca passa da fração alvo da RAM desta máquina
+    orcamento = orcamento_bytes or orcamento_maquina(int(Settings.MEMORIA_MAX_GB * 1024 ** 3))
+    estimativas = estimativas if estimativas is not None else estimar_memoria_ufs(ufs)
+    argumentos = argumentos or {}
+
+    if len(ufs) == 1 or max_workers == 1:
+        # Sem paralelismo possível: executa no próprio processo (logs e tracebacks diretos)
+        return {uf: funcao(uf, *argumentos.get(uf, ())) for uf in ufs}
+
+    pendentes = sorted(ufs, key=lambda uf: estimativas.get(uf, 0), reverse=True)
+    resultados, erros = {}, {}
+    em_execucao = {}
+
+    contexto = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=min(max_workers, len(ufs)), mp_context=contexto) as executor:
+        while pendentes or em_execucao:
+            memoria_em_uso = sum(estimativas.get(uf, 0) for uf in em_execucao.values())
+            for uf in list(pendentes):
+                if len(em_execucao) >= max_workers:
+                    break
+                cabe = memoria_em_uso + estimativas.get(uf, 0) <= orcamento
+                if cabe or not em_execucao:
+                    pendentes.remove(uf)
+                    em_execucao[executor.submit(funcao, uf, *argumentos.get(uf, ()))] = uf
+                    memoria_em_uso += estimativas.get(uf, 0)
+                    logger.info(
+                        f"UF {uf} iniciada (estimativa {estimativas.get(uf, 0) / 1024 ** 3:.1f} GB, "
+                        f"em uso {memoria_em_uso / 1024 ** 3:.1f}/{orcamento / 1024 ** 3:.1f} GB)"
+                    )
+
+            concluidos, _ = wait(list(em_execucao), return_when=FIRST_COMPLETED)
+            for futuro in concluidos:
+                uf = em_execucao.pop(futuro)
+                try:
+                    resultados[uf] = futuro.result()
+                    logger.info(f"UF {uf} concluída")
+                except Exception as e:
+                    erros[uf] = e
+                    logger.error(f"UF {uf} falhou: {e}")
+
+    if erros:
+        raise RuntimeError(f"Falha nas UFs: {', '.join(sorted(erros))}")
+    return resultados
@@ -1,352 +1,732 @@
 import polars as pl
+import os
 import sys
 from pathlib import Path
 import logging
 import time
 import gc
-import tempfile
+import json
+import hashlib
+import shutil
+import multiprocessing
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from dataclasses import dataclass
 from datetime import datetime
+from typing import Dict, List, Optional, Tuple
 
 # Garante que o script pode importar de src/
 SRC_DIR = Path(__file__).parent.parent
 sys.path.insert(0, str(SRC_DIR))
 from config.settings import Settings
+from data.aggregate import COLUNA_BUCKET, SIHContractor, expressao_bucket, nome_bucket
+from data.chunks import (
+    concatenar_partes, contar_linhas, ler_chunk, mesclar_ordenado, metadados_ordenacao, planejar_chunks, resolver_entrada,
+)
+from data.memoria import MB, GovernadorMemoria, orcamento_maquina
+from data.parallel import executar_por_uf
+from data.unify import hash_arquivo
+from data.rules import (
+    REGRAS, REGRAS_TIPO, RegraLimpeza, aplicar, aplicar_com_quarentena, contagem_valores_invalidos,
+    resumo_quarentena,
+)
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# O código das regras entra na assinatura do checkpoint: alterar uma regra invalida os chunks gravados
+ARQUIVO_REGRAS = SRC_DIR / "data" / "rules.py"
 
-class SIHPreprocessor:
-    """Pré-processamento SIH/SUS com processamento em chunks"""
-    
-    def __init__(self, arquivo_entrada=None, arquivo_saida=None, chunk_size=100_000):
-        self.entrada = arquivo_entrada or Settings.INTERIM_DIR / "sih_rs.parquet"
-        self.saida = arquivo_saida or Settings.INTERIM_DIR / "sih_rs_tratado.parquet"
-        self.chunk_size = chunk_size
-        self.temp_dir = Path(tempfile.mkdtemp(prefix="sih_processing_"))
-        Settings.criar_diretorios()
-        logger.info(f"Diretório temporário: {self.temp_dir}")
-    
-    def tratar_chunk_completo(self, df: pl.DataFrame) -> pl.DataFrame:
-        """Aplica todos os tratamentos a um chunk"""
-                
-        # === Conversão padronizada de tipos numéricos ===
-        cols_int64 = [
-            "N_AIH", "CNES", "CEP", "PROC_REA"
-        ]
-
-        # Colunas de contagem ou valores médios → Int32
-        cols_int32 = [
-            "DIAR_ACOM", "UTI_MES_TO", "UTI_INT_TO", "codigo_6d", "NAT_JUR", "CBOR"
-        ]
-
-        # Colunas com intervalos pequenos → Int16 
-        cols_int16 = [
-            "IDADE", "DIAS_PERM", "NACIONAL", "GESTAO", "NATUREZA"
-        ]
-
-        # Colunas com intervalos pequenos → Int8 
-        cols_int8 = [
-            "SEXO", "NUM_FILHOS", "ETNIA", "RACA_COR", "INSTRU", "COMPLEX"
-        ]
-
-       
-
-        # Conversão dos grupos, respeitando a existência das colunas
-        for col in cols_int64:
-            if col in df.columns:
-                df = df.with_columns(pl.col(col).cast(pl.Int64, strict=False).fill_null(0))
-
-        for col in cols_int32:
-            if col in df.columns:
-                df = df.with_columns(pl.col(col).cast(pl.Int32, strict=False).fill_null(0))
-
-        for col in cols_int16:
-            if col in df.columns:
-                df = df.with_columns(pl.col(col).cast(pl.Int16, strict=False).fill_null(0))
+# Saída lateral do primeiro perfil: linhas alteradas ou descartadas pelas regras (ver rules.planejar_quarentena)
+NOME_QUARENTENA = "quarentena"
 
-        for col in cols_int8:
-            if col in df.columns:
-                df = df.with_columns(pl.col(col).cast(pl.Int8, strict=False).fill_null(0))
+# Saídas do modo fundido (PREPROCESS_FUNDIR), gravadas no lugar do primeiro perfil
+NOME_CONTRAIDO = "contraido"
+NOME_PROJECAO = "projecao"
 
-        
-        # Converte campos de valor de texto para float, tratando vírgulas
-        campos_valores = ['VAL_SH', 'VAL_SP', 'VAL_TOT', 'VAL_UTI']
-        for col in campos_valores:
-            if col in df.columns:
-                df = df.with_columns(
-                    pl.col(col)
-                    .cast(pl.String, strict=False)
-                    .str.replace_all(",", ".")
-                    .str.replace_all(" ", "")
-                    .str.replace_all("-", "")
-                    .cast(pl.Float64, strict=False)
-                    .fill_null(0.0)
-                    .clip(lower_bound=0.0)
-                    .alias(col)
-                )
-
-        if 'VAL_UTI' not in df.columns:
-            df = df.with_columns(pl.lit(0.0).cast(pl.Float64).alias('VAL_UTI'))
-
-        # ETAPA 2: Recalcula e substitui 'VAL_TOT' pela soma dos componentes.
-        # Esta é a nova "fonte da verdade" para o valor total.
-        df = df.with_columns(
-            (
-                pl.col("VAL_SH") + 
-                pl.col("VAL_SP") + 
-                pl.col("VAL_UTI")
-            ).alias("VAL_TOT")
-        )
-
-        # Trata campos de data
-        campos_datas = ['DT_INTER', 'DT_SAIDA', 'NASC']
-        for col in campos_datas:
-            if col in df.columns:
-                df = df.with_columns([
-                    pl.col(col).cast(pl.String).str.strptime(pl.Date, format="%Y%m%d", strict=False)
-                ])
-
-        # Calcula a idade de forma precisa
-        if 'DT_INTER' in df.columns and 'NASC' in df.columns:
-            df = df.with_columns([
-                (pl.col("DT_INTER").dt.year() - pl.col("NASC").dt.year() -
-                 pl.when(
-                     (pl.col("DT_INTER").dt.month() < pl.col("NASC").dt.month()) |
-                     ((pl.col("DT_INTER").dt.month() == pl.col("NASC").dt.month()) &
-                      (pl.col("DT_INTER").dt.day() < pl.col("NASC").dt.day()))
-                 )
-                 .then(1)
-                 .otherwise(0)
-                )
-                .clip(0, 150)
-                .cast(pl.Int16)
-                .alias("IDADE")
-            ])
-            
-        # Calcula DIAS_PERM a partir das datas
-        if 'DT_INTER' in df.columns and 'DT_SAIDA' in df.columns:
-            df = df.with_columns(
-                (pl.col("DT_SAIDA") - pl.col("DT_INTER")).dt.total_days().alias("DIAS_PERM")
-            )
-            df = df.with_columns(
-                pl.col("DIAS_PERM").cast(pl.Int16, strict=False).fill_null(0)
-            )
+# Chave da ordenação opcional das saídas dos perfis (PREPROCESS_ORDENAR)
+CHAVE_ORDEM = "N_AIH"
 
-        # Padronização dos códigos de município para 6 dígitos/ Mapeamento de valores não encontrado
-        # === Tratamento dos códigos de município  ===
-        campos_municipio = ['MUNIC_RES', 'MUNIC_MOV']
-
-        # Padronização dos códigos de município para 6 dígitos/ Mapeamento de valores não encontrado
-        for col in campos_municipio:
-            if col in df.columns:
-                df = df.with_columns(
-                    pl.col(col)
-                    .cast(pl.String, strict=False)
-                    .str.strip_chars()
-                    .fill_null("000000")
-                    
-                    # --- LÓGICA DE GENERALIZAÇÃO PARA O DISTRITO FEDERAL ---
-                    .pipe(lambda s:
-                        # SE o código começar com '53' (prefixo do DF)
-                        pl.when(s.str.starts_with("53"))
-                        .then(pl.lit("530010"))  # ENTÃO, substitui pelo código unificado de Brasília
-                        .otherwise(s)           # SENÃO, mantém o código original
-                    )
-                    
-                    # Continua com a padronização geral para 6 dígitos
-                    .str.slice(0, 6)
-                    .str.pad_start(length=6, fill_char='0')
-
-                    .cast(pl.Int64, strict=False)  # Tenta converter o string limpo para inteiro de 64 bits
-                    .fill_null(0)                  # Preenche 0 (código ignorado) caso o cast falhe
-                    .clip(lower_bound=0)           # Garante que não há valores negativos (correção do clip)
-                    
-                    .alias(col)
-                )
+# Pico do modo streaming com uma thread, que não depende da entrada (medido: 0,4 a 0,7 GB)
+MEMORIA_STREAMING_MB = 1024
 
 
-        # Tratamento da coluna NACIONAL
-        if 'NACIONAL' in df.columns:
-            df = df.with_columns(
-                # 1. Usa a lógica WHEN/THEN/OTHERWISE como a expressão principal
-                pl.when(pl.col("NACIONAL") == 0)
-                .then(pl.lit(10)) # Substitui 0 por 10
-                .otherwise(pl.col("NACIONAL"))
-                
-                # 2. Aplica o limite no resultado da condição
+@dataclass
+class PerfilSaida:
+    """Uma saída do pré-processamento: regras aplicadas e arquivo de destino"""
+    nome: str
+    regras: List[RegraLimpeza]
+    saida: Path
 
-                .clip(lower_bound=0, upper_bound=350) 
-                
-                .alias("NACIONAL") # Nomeia a coluna final
-            )
 
-        # === Tratamento de RACA_COR e ETNIA ===
-        if "RACA_COR" in df.columns and "ETNIA" in df.columns:
-            df = df.with_columns([
-                pl.col("RACA_COR")
-                .cast(pl.Int8, strict=False)
-                .fill_null(0)
-                .clip(lower_bound=0, upper_bound=99)
-                .alias("RACA_COR"),
-
-                pl.col("ETNIA")
-                .cast(pl.Int16, strict=False)  # precisa ser Int16 pois vai até 264
-                .fill_null(0)
-                .clip(lower_bound=0, upper_bound=264)
-                .alias("ETNIA")
-            ])
-
-            # Se RACA_COR != 5 e ETNIA for válida (≠ 0)
-            df = df.with_columns(
-                pl.when((pl.col("RACA_COR") != 5) & (pl.col("ETNIA") != 0))
-                .then(pl.lit(5))
-                .otherwise(pl.col("RACA_COR"))
-                .alias("RACA_COR")
-            )
+# Perfis conhecidos: regras e caminho de saída por UF
+PERFIS = {
+    "tratado": (REGRAS, Settings.get_tratado_path),
+    "variavel_tipo": (REGRAS_TIPO, Settings.get_variavel_tipo_path),
+}
 
 
-        # Padronização do código de procedimento (PROC_REA)
-        if "PROC_REA" in df.columns:
-            df = df.with_columns(
-                pl.col("PROC_REA")
-                .cast(pl.Int64, strict=False)
-                .fill_null(0)
-                .clip(lower_bound=0)
-                .alias("PROC_REA")
-            )
-
+class SIHPreprocessor:
+    """
+    Pré-processamento SIH/SUS com processamento em chunks.
+
+    Cada perfil (ver PERFIS) é uma saída; todos são gravados a partir de uma única
+    leitura da entrada unificada.
+
+    No modo em chunks, as partes ficam em um diretório de trabalho durável
+    (interim/preprocess_chunks/uf=XX) com um manifesto; uma execução interrompida
+    é retomada a partir dos chunks já concluídos.
+
+    Com `quarentena`, o primeiro perfil grava também, na mesma passada, as linhas que as
+    regras alteraram ou descartaram (N_AIH, máscara das regras e valores originais).
+
+    Com `ordenar`, as saídas dos perfis são gravadas ordenadas por N_AIH (ordenação
+    estável) e declaram isso nos metadados do parquet, o que habilita a contração
+    sequencial de data/aggregate.py.
+
+    Com `fundir`, o primeiro perfil não é gravado: na mesma varredura dos demais perfis, as
+    linhas tratadas vão direto para as partições por hash de N_AIH da contração
+    (data/aggregate.py, contraídas uma a uma em sih_contraido.parquet) e para a projeção das
+    colunas que as etapas seguintes leem do tratado (PREPROCESS_PROJECAO_COLUNAS), sem a ida
+    e volta do sih_tratado.parquet completo pelo disco. O número de partições segue o
+    orçamento da contração (CONTRACT_MEMORIA_MB); no modo em chunks, cada chunk grava as
+    suas partições, e cada partição é contraída a partir das de todos os chunks, em ordem.
+    """
     
-        
-        # Tratamento de campos CID
-        campos_cid = ['DIAG_PRINC', 'DIAG_SECUN', 'CID_NOTIF', 'CID_ASSO', 'CID_MORTE']
-        for col in campos_cid:
-            if col in df.columns:
-                df = df.with_columns(
-                    pl.col(col)
-                    .cast(pl.String, strict=False)  # Garante que é texto
-                    .str.strip_chars()              # Remove espaços, transformando '  ' em ''
-                    .str.to_uppercase()             # Converte para maiúsculas
-                    
-                    # --- LÓGICA DE PADRONIZAÇÃO APRIMORADA ---
-                    .pipe(lambda s: 
-                        # SE a string for vazia, nula, OU contiver apenas zeros (ex: '0', '00', '0000')
-                        pl.when(
-                            s.is_in([""]) | 
-                            s.is_null() | 
-                            s.str.contains(r"^0+$") # Regex: ^ (início), 0+ (um ou mais zeros), $ (fim)
-                        )
-                        .then(pl.lit("0"))  # ENTÃO, substitui por um único '0'
-                        .otherwise(s)       # SENÃO, mantém o valor original
-                    )
-                    .alias(col)
-                )
+    def __init__(self, arquivo_entrada=None, arquivo_saida=None, chunk_size=100_000, uf=None,
+                 streaming=None, memoria_mb=None, regras=None, perfis=None, workers=None, retomar=None,
+                 quarentena=None, ordenar=None, fundir=None):
+        self.uf = (uf or Settings.UF_DEFAULT[0]).upper()
+        self.streaming = Settings.PREPROCESS_STREAMING if streaming is None else streaming
+        self.memoria_mb = memoria_mb or Settings.PREPROCESS_MEMORIA_MB
+        self.entrada = arquivo_entrada or Settings.get_unificado_dir(self.uf)
+        self.chunk_size = chunk_size
+        self.workers = workers or Settings.PREPROCESS_WORKERS or 1
+        self.valores_invalidos: Dict[str, int] = {}
+        self.regras = regras or REGRAS
+        self.perfis = [
+            p if isinstance(p, PerfilSaida) else self.criar_perfil(p, arquivo_saida)
+            for p in (perfis or Settings.PREPROCESS_PERFIS)
+        ]
+        self.saida = self.perfis[0].saida
+        self.quarentena = Settings.PREPROCESS_QUARENTENA if quarentena is None else quarentena
+        self.arquivo_quarentena = self.saida.with_name(Settings.PARQUET_QUARANTINE_FILENAME)
+        self.ordenar = Settings.PREPROCESS_ORDENAR if ordenar is None else ordenar
+        self.fundir = Settings.PREPROCESS_FUNDIR if fundir is None else fundir
+        self.buckets = 0
+        self.arquivo_contraido = Settings.get_contraido_path(self.uf)
+        self.arquivo_projecao = self.saida.with_name(Settings.PARQUET_PROJECTION_FILENAME)
+        self.retomar = Settings.PREPROCESS_RETOMAR if retomar is None else retomar
+        self.trabalho_dir = Settings.get_preprocess_trabalho_dir(self.uf)
+        self.arquivo_manifesto = self.trabalho_dir / Settings.PREPROCESS_MANIFEST_FILENAME
+        self.manifesto = {"assinatura": {}, "chunks": {}}
+        Settings.criar_diretorios()
+    
+    def criar_perfil(self, nome: str, arquivo_saida=None) -> PerfilSaida:
+        """Perfil pelo nome; `arquivo_saida` e `regras` do construtor valem para o perfil 'tratado'"""
+        if nome not in PERFIS:
+            raise ValueError(f"Perfil de pré-processamento desconhecido: {nome}")
+        regras, caminho = PERFIS[nome]
+        if nome == "tratado":
+            return PerfilSaida(nome, self.regras, Path(arquivo_saida) if arquivo_saida else caminho(self.uf))
+        return PerfilSaida(nome, regras, caminho(self.uf))
 
-        # Garante que N_AIH não seja nulo para evitar problemas posteriores
-        df = df.filter(pl.col("N_AIH").is_not_null())
-        
-        return df
+    def tratar_chunk_completo(self, df: pl.DataFrame) -> pl.DataFrame:
+        """
+        Aplica todos os tratamentos a um chunk (ou a um LazyFrame, no modo streaming).
+
+        As regras vêm do registro em data/rules.py, compiladas em um plano fundido:
+        uma projeção com as regras de cada coluna compostas, as derivações que
+        dependem de colunas já tratadas (VAL_TOT, IDADE, DIAS_PERM e a reconciliação
+        RACA_COR/ETNIA) e o filtro de N_AIH. O resultado é idêntico ao da implementação
+        anterior, mantida em reports/benchmark_preprocess.py.
+        """
+        return aplicar(df, self.regras)
+
+    def processar_salvar_chunk(self) -> Dict[str, List[Path]]:
+        """Processa chunks e salva arquivos temporários de cada perfil ({perfil: [arquivos]})"""
+        if self.workers > 1:
+            if self.perfis_registrados():
+                return self.processar_chunks_paralelo()
+            logger.warning("Perfis ou regras fora do registro não vão para os workers; processando em sequência")
 
-    def processar_salvar_chunk(self) -> list:
-        """Processa chunks e salva arquivos temporários"""
         logger.info("=== FASE 1: Processamento em Chunks ===")
         
-        df_lazy = pl.scan_parquet(self.entrada)
-        total_rows = df_lazy.select(pl.len()).collect().item()
-        logger.info(f"Total de registros: {total_rows:,}")
-        
-        arquivos_temp = []
-        chunk_num = 0
+        # Entrada pode ser o dataset unificado (pasta ano=/mes=) ou um único arquivo.
+        # Os chunks seguem os row groups e cada um é lido uma única vez,
+        # compartilhado por todos os perfis
+        chunks = planejar_chunks(self.entrada, self.chunk_size)
+        total_rows = sum(linhas for _, _, linhas in chunks)
+        logger.info(f"Total de registros: {total_rows:,} ({len(chunks)} chunks)")
+        concluidos = self.preparar_trabalho(chunks)
+        lidas = 0
         
-        for start in range(0, total_rows, self.chunk_size):
-            chunk_num += 1
-            end = min(start + self.chunk_size, total_rows)
+        for chunk_num, (arquivo, grupo, linhas) in enumerate(chunks, start=1):
+            lidas += linhas
+            if chunk_num in concluidos:
+                continue
             
             if chunk_num % 10 == 0 or chunk_num == 1:
-                progresso = (end / total_rows) * 100
+                progresso = (lidas / total_rows) * 100 if total_rows else 100.0
                 logger.info(f"Processando chunk {chunk_num} ({progresso:.1f}%)...")
             
-            chunk = df_lazy.slice(start, self.chunk_size).collect()
-            chunk_tratado = self.tratar_chunk_completo(chunk)
-            
-            arquivo_temp = self.temp_dir / f"chunk_{chunk_num:03d}.parquet"
-            chunk_tratado.write_parquet(arquivo_temp, compression="snappy")
-            arquivos_temp.append(arquivo_temp)
+            chunk = ler_chunk(arquivo, grupo)
+            invalidas = contar_valores_invalidos(chunk)
+            saidas = tratar_perfis(
+                chunk, [(p.nome, p.regras) for p in self.perfis], self.quarentena, self.ordenar, self.fundir
+            )
+            checksums = gravar_partes(saidas, self.trabalho_dir, chunk_num, self.buckets)
+            del saidas
+            self.registrar_chunk(chunk_num, arquivo, grupo, linhas, checksums, invalidas)
             
-            del chunk, chunk_tratado
+            del chunk
             if chunk_num % 5 == 0:
                 gc.collect()
         
-        logger.info(f"{len(arquivos_temp)} chunks processados e salvos")
-        return arquivos_temp
+        logger.info(f"{len(chunks)} chunks processados e salvos ({len(self.perfis)} perfis)")
+        return self.partes_concluidas()
     
-    def limpar_temp(self):
-        """Remove arquivos temporários"""
+    def saidas_chunk(self) -> List[str]:
+        """
+        Partes gravadas por chunk: uma por perfil e a quarentena; com `fundir`, as partições da
+        contração e a projeção no lugar do primeiro perfil
+        """
+        nomes = [p.nome for p in self.perfis] + ([NOME_QUARENTENA] if self.quarentena else [])
+        if self.fundir:
+            nomes = nomes[1:] + [NOME_CONTRAIDO, NOME_PROJECAO]
+        return nomes
+
+    def destinos_finais(self) -> Dict[str, Path]:
+        """Arquivos gravados pela execução; com `fundir`, contraído e projeção substituem o primeiro perfil"""
+        destinos = {p.nome: p.saida for p in self.perfis}
+        if self.quarentena:
+            destinos[NOME_QUARENTENA] = self.arquivo_quarentena
+        if self.fundir:
+            del destinos[self.perfis[0].nome]
+            destinos[NOME_CONTRAIDO] = self.arquivo_contraido
+            destinos[NOME_PROJECAO] = self.arquivo_projecao
+        return destinos
+
+    def metadados_saida(self, nome: str) -> Optional[Dict[str, str]]:
+        """Metadados de ordenação das saídas dos perfis (quarentena e contraído não são ordenados)"""
+        if self.ordenar and nome not in (NOME_QUARENTENA, NOME_CONTRAIDO):
+            return metadados_ordenacao(CHAVE_ORDEM)
+        return None
+
+    def planos_gravacao(self, saidas: Dict[str, pl.LazyFrame], destinos: Dict[str, Path]) -> List[pl.LazyFrame]:
+        """Um sink_parquet lazy por saída (executados juntos por collect_all)"""
+        return [
+            plano.sink_parquet(
+                destinos[nome],
+                compression="snappy",
+                row_group_size=Settings.PARQUET_ROW_GROUP_SIZE,
+                metadata=self.metadados_saida(nome),
+                lazy=True
+            )
+            for nome, plano in saidas.items()
+        ]
+
+    def contrator_fundido(self, saida: Path) -> SIHContractor:
+        """Contração do modo `fundir`, com a máscara CONFLITOS calculada em cada partição"""
+        return SIHContractor(uf=self.uf, arquivo_saida=saida)
+
+    def contrair_chunks(self, diretorios: List[Path], saida: Path):
+        """Contrai cada partição a partir das de todos os chunks, na ordem dos chunks (modo `fundir`)"""
+        particoes = [
+            [diretorio / nome_bucket(bucket) for diretorio in diretorios if (diretorio / nome_bucket(bucket)).exists()]
+            for bucket in range(self.buckets)
+        ]
+        self.contrator_fundido(saida).contrair_particoes([arquivos for arquivos in particoes if arquivos])
+
+    def finalizar_contracao(self):
+        """Relatório de conflitos da contração gravada no modo `fundir`"""
+        contrator = SIHContractor(uf=self.uf, arquivo_saida=self.arquivo_contraido)
+        # O manifesto da contração incremental descreve um sih_tratado.parquet que não foi gravado
+        contrator.arquivo_manifesto.unlink(missing_ok=True)
+        contrator.registrar_conflitos()
+
+    def perfis_registrados(self) -> bool:
+        """Os workers reconstroem os perfis pelo nome: só vale para os perfis de PERFIS sem regras próprias"""
+        return all(p.nome in PERFIS and p.regras is PERFIS[p.nome][0] for p in self.perfis)
+
+    def processar_chunks_paralelo(self) -> Dict[str, List[Path]]:
+        """
+        Distribui os chunks (faixas de row groups) entre processos. Cada worker lê o seu
+        chunk, aplica os perfis e grava as suas partes; o coordenador só despacha
+        enquanto a memória estimada dos chunks em voo cabe no orçamento e devolve as
+        partes na ordem dos chunks (a saída é igual à do modo sequencial).
+        """
+        chunks = planejar_chunks(self.entrada, self.chunk_size)
+        total_rows = sum(linhas for _, _, linhas in chunks)
+        # Orçamento dos chunks em voo: começa em memoria_mb e é ajustado pelo governador
+        # a cada chunk concluído, conforme o RSS (coordenador + workers) e a memória livre
+        governador = GovernadorMemoria(f"preprocess_{self.uf}", self.memoria_mb * MB, minimo=MB, bytes_por_unidade=1)
+        orcamento = governador.tamanho
+        # Chunk lido + uma cópia tratada por perfil
+        custo = Settings.BYTES_POR_REGISTRO * (1 + len(self.saidas_chunk()))
+        threads = max(1, (os.cpu_count() or 1) // self.workers)
+        logger.info(
+            f"=== FASE 1: Processamento em Chunks ({self.workers} processos x {threads} threads) ==="
+        )
+        logger.info(f"Total de registros: {total_rows:,} ({len(chunks)} chunks)")
+
+        nomes = [p.nome for p in self.perfis]
+        concluidos = self.preparar_trabalho(chunks)
+
+        pendentes = [(n, chunk) for n, chunk in enumerate(chunks, start=1) if n not in concluidos]
+        em_voo = {}
+        concluidas = len(concluidos)
+
+        # Cada worker usa uma fração do pool de threads do polars (lido na importação, no spawn)
+        threads_anterior = os.environ.get("POLARS_MAX_THREADS")
+        os.environ["POLARS_MAX_THREADS"] = str(threads)
+        try:
+            contexto = multiprocessing.get_context("spawn")
+            with ProcessPoolExecutor(max_workers=self.workers, mp_context=contexto) as executor:
+                while pendentes or em_voo:
+                    memoria_em_voo = sum(em[-1] * custo for em in em_voo.values())
+                    while pendentes and len(em_voo) < self.workers:
+                        chunk_num, (arquivo, grupo, linhas) = pendentes[0]
+                        if em_voo and memoria_em_voo + linhas * custo > orcamento:
+                            break
+                        pendentes.pop(0)
+                        futuro = executor.submit(
+                            tratar_chunk_worker, arquivo, grupo, chunk_num, nomes, self.trabalho_dir,
+                            self.quarentena, self.ordenar, self.buckets
+                        )
+                        em_voo[futuro] = (chunk_num, arquivo, grupo, linhas)
+                        memoria_em_voo += linhas * custo
+
+                    feitos, _ = wait(list(em_voo), return_when=FIRST_COMPLETED)
+                    for futuro in feitos:
+                        chunk_num, arquivo, grupo, linhas = em_voo.pop(futuro)
+                        checksums, invalidas = futuro.result()
+                        self.registrar_chunk(chunk_num, arquivo, grupo, linhas, checksums, invalidas)
+                        orcamento = governador.ajustar()
+                        concluidas += 1
+                        if concluidas % 10 == 0 or concluidas == 1:
+                            logger.info(f"Chunks concluídos: {concluidas}/{len(chunks)}")
+        finally:
+            if threads_anterior is None:
+                os.environ.pop("POLARS_MAX_THREADS", None)
+            else:
+                os.environ["POLARS_MAX_THREADS"] = threads_anterior
+            governador.exportar_metricas()
+
+        logger.info(f"{concluidas} chunks processados e salvos ({len(self.perfis)} perfis)")
+        return self.partes_concluidas()
+
+    # === CHECKPOINT (RETOMADA DO MODO EM CHUNKS) ===
+
+    def assinatura_execucao(self) -> dict:
+        """
+        O que precisa ser igual para reaproveitar chunks de uma execução anterior: arquivos de
+        entrada (tamanho e mtime), tamanho do chunk, perfis (regras e saída) e o código das regras
+        """
+        entrada = {}
+        for arquivo in resolver_entrada(self.entrada):
+            stat = arquivo.stat()
+            entrada[str(arquivo)] = {"tamanho": stat.st_size, "mtime": stat.st_mtime}
+        return {
+            "entrada": entrada,
+            "chunk_size": self.chunk_size,
+            "perfis": {
+                p.nome: {"regras": [r.nome for r in p.regras], "saida": str(p.saida)} for p in self.perfis
+            },
+            "regras_sha1": hash_arquivo(ARQUIVO_REGRAS),
+            "quarentena": self.quarentena,
+            "ordenar": self.ordenar,
+            "fundir": {"buckets": self.buckets, "projecao": Settings.PREPROCESS_PROJECAO_COLUNAS} if self.fundir else None,
+        }
+
+    def carregar_manifesto(self, assinatura: dict) -> dict:
+        """Manifesto de uma execução interrompida com a mesma assinatura (vazio se não houver)"""
+        if not self.arquivo_manifesto.exists():
+            return {}
         try:
-            import shutil
-            shutil.rmtree(self.temp_dir)
-            logger.info(f"Diretório temporário removido: {self.temp_dir}")
+            with open(self.arquivo_manifesto, "r", encoding="utf-8") as f:
+                manifesto = json.load(f)
+        except (json.JSONDecodeError, OSError) as e:
+            logger.warning(f"Manifesto dos chunks ilegível ({e}); os chunks serão refeitos")
+            return {}
+        if manifesto.get("assinatura") != assinatura:
+            logger.info("Entrada, perfis ou regras mudaram desde a última execução; os chunks serão refeitos")
+            return {}
+        return manifesto
+
+    def _salvar_manifesto(self):
+        """Grava o manifesto de forma atômica"""
+        temp = self.arquivo_manifesto.with_suffix(".json.tmp")
+        with open(temp, "w", encoding="utf-8") as f:
+            json.dump(self.manifesto, f, indent=2, sort_keys=True)
+        os.replace(temp, self.arquivo_manifesto)
+
+    def preparar_trabalho(self, chunks: List[Tuple[Path, List[int], int]]) -> Dict[int, dict]:
+        """
+        Prepara o diretório de trabalho e devolve os chunks já concluídos ({chunk_num: registro}).
+        Um chunk é reaproveitado se a faixa (arquivo, row groups) confere com o plano atual e
+        cada parte existe com o mesmo checksum; os demais são refeitos.
+        """
+        assinatura = self.assinatura_execucao()
+        anterior = self.carregar_manifesto(assinatura) if self.retomar else {}
+        if not anterior and self.trabalho_dir.exists():
+            shutil.rmtree(self.trabalho_dir)
+        for nome in self.saidas_chunk():
+            (self.trabalho_dir / nome).mkdir(parents=True, exist_ok=True)
+
+        concluidos = {}
+        for chave, registro in anterior.get("chunks", {}).items():
+            chunk_num = int(chave)
+            if not 1 <= chunk_num <= len(chunks):
+                continue
+            arquivo, grupo, _ = chunks[chunk_num - 1]
+            if registro["arquivo"] != str(arquivo) or registro["row_groups"] != list(grupo):
+                continue
+            if all(self.parte_valida(nome, registro["partes"].get(nome)) for nome in self.saidas_chunk()):
+                concluidos[chunk_num] = registro
+
+        self.manifesto = {"assinatura": assinatura, "chunks": {f"{n:05d}": r for n, r in concluidos.items()}}
+        self._salvar_manifesto()
+        for registro in concluidos.values():
+            self.somar_valores_invalidos(registro["invalidos"])
+        if concluidos:
+            logger.info(f"Retomando: {len(concluidos)}/{len(chunks)} chunks já concluídos em {self.trabalho_dir}")
+        return concluidos
+
+    def parte_valida(self, perfil: str, parte: dict) -> bool:
+        """A parte registrada no manifesto existe e o checksum confere"""
+        if not parte:
+            return False
+        caminho = self.trabalho_dir / perfil / parte["arquivo"]
+        return caminho.exists() and hash_parte(caminho) == parte["sha1"]
+
+    def registrar_chunk(self, chunk_num: int, arquivo: Path, grupo: List[int], linhas: int,
+                        checksums: Dict[str, str], invalidas: Dict[str, int]):
+        """Marca o chunk como concluído no manifesto (só depois de todas as partes gravadas)"""
+        self.manifesto["chunks"][f"{chunk_num:05d}"] = {
+            "arquivo": str(arquivo),
+            "row_groups": list(grupo),
+            "linhas": linhas,
+            "partes": {
+                nome: {"arquivo": nome_parte(chunk_num, nome), "sha1": sha1} for nome, sha1 in checksums.items()
+            },
+            "invalidos": invalidas,
+        }
+        self._salvar_manifesto()
+        self.somar_valores_invalidos(invalidas)
+
+    def partes_concluidas(self) -> Dict[str, List[Path]]:
+        """Partes de cada saída na ordem dos chunks ({perfil: [arquivos]})"""
+        ordem = sorted(self.manifesto["chunks"])
+        return {
+            nome: [
+                self.trabalho_dir / nome / self.manifesto["chunks"][n]["partes"][nome]["arquivo"]
+                for n in ordem
+            ]
+            for nome in self.saidas_chunk()
+        }
+
+    def somar_valores_invalidos(self, contagens: Dict[str, int]):
+        for col, n in contagens.items():
+            self.valores_invalidos[col] = self.valores_invalidos.get(col, 0) + n
+
+    def streaming_cabe(self) -> bool:
+        """
+        O motor streaming do polars não tem um limite de memória que ele respeite: o tamanho
+        dos chunks do motor não altera o pico. Com uma thread, o pico medido fica estável
+        (0,4 a 0,7 GB de 1,5M a 6M linhas, ver MEMORIA_STREAMING_MB); com mais de uma, cresce
+        com a entrada (1,1 GB em 1,5M linhas, 3,7 GB em 6M), e a estimativa passa a ser a
+        entrada inteira (linhas x BYTES_POR_REGISTRO). Se a estimativa não couber em
+        memoria_mb, usa o modo em chunks, em que o orçamento limita os chunks em voo.
+        """
+        linhas = contar_linhas(resolver_entrada(self.entrada))
+        estimativa = MEMORIA_STREAMING_MB * MB
+        if pl.thread_pool_size() > 1:
+            estimativa = max(estimativa, linhas * Settings.BYTES_POR_REGISTRO)
+        orcamento = orcamento_maquina(self.memoria_mb * MB)
+        if estimativa <= orcamento:
+            return True
+        logger.warning(
+            f"Modo streaming desativado: estimativa {estimativa / MB:,.0f} MB para {linhas:,} linhas "
+            f"({pl.thread_pool_size()} threads) não cabe no orçamento ({orcamento / MB:,.0f} MB); "
+            f"usando chunks de {self.chunk_size:,}"
+        )
+        return False
+
+    def processar_streaming(self, destinos: Dict[str, Path]):
+        """
+        Expressa cada perfil como um plano lazy sobre toda a entrada e grava direto nos
+        destinos: sem arquivos temporários e sem collect final. Os planos são executados
+        juntos (collect_all), compartilhando uma única varredura da entrada.
+
+        A contagem de valores anulados (datas, CIDs) é uma varredura à parte, só das colunas
+        que ela lê: no mesmo collect_all, o cache da entrada compartilhada acumulava a entrada
+        inteira (2,2 GB contra 0,7 GB em 3M linhas, no mesmo tempo).
+
+        Com `fundir`, a projeção e as partições da contração são dois sinks do mesmo plano
+        tratado: o collect_all aplica as regras uma vez (6,3 s contra 6,2 s de um sink só, em 3M
+        linhas) e o pico fica estável (0,7 GB em 2M linhas, 0,9 GB em 12,5M, com uma thread).
+        """
+        logger.info("=== Processamento streaming ===")
+        arquivos_entrada = resolver_entrada(self.entrada)
+        logger.info(f"{len(arquivos_entrada)} arquivos | {len(self.perfis)} perfis")
+
+        entrada = pl.scan_parquet(arquivos_entrada)
+        saidas, tratado = {}, None
+        for i, perfil in enumerate(self.perfis):
+            if i == 0 and self.quarentena:
+                saidas[perfil.nome], saidas[NOME_QUARENTENA] = aplicar_com_quarentena(entrada, perfil.regras)
+            else:
+                saidas[perfil.nome] = aplicar(entrada, perfil.regras)
+            if i == 0 and self.fundir:
+                # As linhas tratadas vão, sem ordenar, para as partições da contração; com `ordenar`,
+                # só a projeção é ordenada
+                tratado = saidas.pop(perfil.nome)
+                projecao = tratado.select(colunas_projecao(tratado.collect_schema().names()))
+                saidas[NOME_PROJECAO] = projecao.sort(CHAVE_ORDEM, maintain_order=True) if self.ordenar else projecao
+            elif self.ordenar:
+                saidas[perfil.nome] = saidas[perfil.nome].sort(CHAVE_ORDEM, maintain_order=True)
+        planos = self.planos_gravacao(saidas, destinos)
+        if tratado is not None:
+            contrator = self.contrator_fundido(destinos[NOME_CONTRAIDO])
+            planos.append(contrator.plano_particoes(self.buckets, tratado))
+        pl.collect_all(planos, engine="streaming")
+        if tratado is not None:
+            contrator.contrair_particoes([[arquivo] for arquivo in contrator.particoes()])
+        invalidas = contagem_valores_invalidos(entrada).collect(engine="streaming")
+        if invalidas.width:
+            self.somar_valores_invalidos(invalidas.row(0, named=True))
+
+    def registrar_resumo_quarentena(self, registros: int):
+        """Loga as linhas em quarentena por regra (relatório completo: reports/quarentena_report.py)"""
+        quarentena = pl.scan_parquet(self.arquivo_quarentena)
+        total = quarentena.select(pl.len()).collect().item()
+        logger.info(f"Quarentena: {total:,} linhas alteradas ou descartadas → {self.arquivo_quarentena.name}")
+        resumo = resumo_quarentena(quarentena, self.perfis[0].regras).sort("linhas", descending=True)
+        for linha in resumo.iter_rows(named=True):
+            pct = 100.0 * linha["linhas"] / registros if registros else 0.0
+            logger.info(f"  {linha['regra']:18} {linha['linhas']:>12,} ({pct:.2f}% dos registros)")
+
+    def limpar_trabalho(self):
+        """Remove o diretório de trabalho (chamado só depois que as saídas foram gravadas)"""
+        if not self.trabalho_dir.exists():
+            return
+        try:
+            shutil.rmtree(self.trabalho_dir)
+            logger.info(f"Diretório de trabalho removido: {self.trabalho_dir}")
         except Exception as e:
-            logger.warning(f"Erro ao remover temp: {e}")
+            logger.warning(f"Erro ao remover diretório de trabalho: {e}")
     
     def processar(self) -> int:
-        """Processamento principal"""
-        logger.info("=== PRÉ-PROCESSAMENTO SIH/SUS ===")
+        """Processamento principal (retorna os registros do primeiro perfil)"""
+        logger.info(f"=== PRÉ-PROCESSAMENTO SIH/SUS (UF {self.uf}) ===")
         logger.info(f"Entrada: {self.entrada}")
-        logger.info(f"Saída: {self.saida}")
-        logger.info(f"Chunk size: {self.chunk_size:,}")
+        for perfil in self.perfis:
+            logger.info(f"Saída ({perfil.nome}): {perfil.saida}")
+        if self.streaming and not self.streaming_cabe():
+            self.streaming = False
+        modo = 'streaming' if self.streaming else f'chunks de {self.chunk_size:,} ({self.workers} processos)'
+        logger.info(f"Modo: {modo}")
+        if self.fundir:
+            linhas = contar_linhas(resolver_entrada(self.entrada))
+            self.buckets = self.contrator_fundido(self.arquivo_contraido).definir_buckets(linhas)
+            logger.info(
+                f"Fundido com a contração ({self.buckets} partições): {self.arquivo_contraido} "
+                f"(+ {self.arquivo_projecao.name})"
+            )
         
         inicio = time.time()
         
         try:
-            if self.saida.exists():
-                timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-                
-                Settings.BACKUPS_DIR.mkdir(parents=True, exist_ok=True)
-                backup = Settings.BACKUPS_DIR / f"{self.saida.stem}_backup_{timestamp}.parquet"
-
-                self.saida.rename(backup)
-                logger.info(f"Backup criado: {backup.name}")
-            
-            arquivos_temp = self.processar_salvar_chunk()
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            # Com `fundir`, o tratado anterior também vai para o backup (não fica um tratado defasado)
+            for perfil in self.perfis:
+                if perfil.saida.exists():
+                    Settings.BACKUPS_DIR.mkdir(parents=True, exist_ok=True)
+                    backup = Settings.BACKUPS_DIR / f"{perfil.saida.stem}_{self.uf}_backup_{timestamp}.parquet"
+
+                    perfil.saida.rename(backup)
+                    logger.info(f"Backup criado: {backup.name}")
             
-            logger.info("Unificando e salvando arquivo final...")
+            # Quarentena, contraído e projeção são derivados da execução: substituídos sem backup
+            destinos = self.destinos_finais()
+            temps = {}
+            for nome, destino in destinos.items():
+                destino.parent.mkdir(parents=True, exist_ok=True)
+                temps[nome] = destino.with_name(destino.name + ".tmp")
+
+            if self.streaming:
+                self.processar_streaming(temps)
+            else:
+                arquivos_temp = self.processar_salvar_chunk()
+                
+                logger.info("Unificando e salvando arquivos finais...")
+                
+                # Os chunks tratados são concatenados um row group por vez, sem materializar o
+                # dataset (com `ordenar`, as partes já ordenadas são mescladas por N_AIH; com
+                # `fundir`, as partições dos chunks são contraídas)
+                saidas = {}
+                for nome in self.saidas_chunk():
+                    if nome == NOME_CONTRAIDO:
+                        self.contrair_chunks(arquivos_temp[nome], temps[nome])
+                    elif self.metadados_saida(nome):
+                        saidas[nome] = mesclar_ordenado([pl.scan_parquet(a) for a in arquivos_temp[nome]], CHAVE_ORDEM)
+                    else:
+                        concatenar_partes(arquivos_temp[nome], temps[nome])
+                if saidas:
+                    pl.collect_all(self.planos_gravacao(saidas, temps), engine="streaming")
+            for nome, destino in destinos.items():
+                os.replace(temps[nome], destino)
+            self.limpar_trabalho()
+            if self.fundir:
+                self.finalizar_contracao()
             
-            # Lê os arquivos temporários de forma lazy para evitar estouro de memória
-            df_lazy = pl.scan_parquet(arquivos_temp)
-            df_final = df_lazy.collect()
-            
-            registros_finais = len(df_final)
-            logger.info(f"Registros finais: {registros_finais:,}")
-
-            df_final.write_parquet(self.saida, compression="snappy", use_pyarrow=True)
+            # Linhas tratadas: as do primeiro perfil ou, com `fundir`, as da projeção
+            nome_tratado = NOME_PROJECAO if self.fundir else self.perfis[0].nome
+            registros = {nome: contar_linhas([destino]) for nome, destino in destinos.items() if nome != NOME_QUARENTENA}
             
             tempo_total = time.time() - inicio
-            tamanho_final_mb = self.saida.stat().st_size / (1024 * 1024)
             
             logger.info("="*60)
             logger.info("PROCESSAMENTO CONCLUÍDO!")
             logger.info("="*60)
-            logger.info(f"Registros processados: {registros_finais:,}")
-            logger.info(f"Tamanho final: {tamanho_final_mb:.1f} MB")
+            for nome, n in registros.items():
+                tamanho_mb = destinos[nome].stat().st_size / (1024 * 1024)
+                logger.info(f"{nome}: {n:,} registros, {tamanho_mb:.1f} MB")
+            if self.valores_invalidos:
+                resumo = ", ".join(f"{col}={n:,}" for col, n in self.valores_invalidos.items())
+                logger.info(f"Valores anulados (datas inválidas, CIDs fora do dicionário): {resumo}")
+            if self.quarentena:
+                self.registrar_resumo_quarentena(registros[nome_tratado])
             logger.info(f"Tempo total: {tempo_total:.1f}s ({tempo_total/60:.1f} min)")
             
-            return registros_finais
+            return registros[nome_tratado]
             
         except Exception as e:
             logger.error(f"Erro: {e}")
+            if not self.streaming and self.manifesto["chunks"]:
+                logger.info(
+                    f"{len(self.manifesto['chunks'])} chunks concluídos mantidos em {self.trabalho_dir}; "
+                    "a próxima execução retoma a partir deles"
+                )
             raise
         finally:
-            self.limpar_temp()
             gc.collect()
 
 
+def nome_parte(chunk_num: int, saida: str = "") -> str:
+    """Parte de uma saída no chunk; as partições da contração (modo `fundir`) são um diretório"""
+    if saida == NOME_CONTRAIDO:
+        return f"chunk_{chunk_num:05d}"
+    return f"chunk_{chunk_num:05d}.parquet"
+
+
+def colunas_projecao(colunas: List[str]) -> List[str]:
+    """Colunas do tratado gravadas na projeção (modo `fundir`)"""
+    return [c for c in Settings.PREPROCESS_PROJECAO_COLUNAS if c in colunas]
+
+
+def gravar_parte(df: pl.DataFrame, caminho: Path) -> str:
+    """Grava uma parte via .tmp + rename (sem partes truncadas) e devolve o SHA-1 do arquivo"""
+    temp = caminho.with_name(caminho.name + ".tmp")
+    df.write_parquet(temp, compression="snappy")
+    os.replace(temp, caminho)
+    return hash_arquivo(caminho)
+
+
+def hash_parte(caminho: Path) -> str:
+    """SHA-1 de uma parte; de um diretório de partições, o dos nomes e checksums dos arquivos"""
+    if not caminho.is_dir():
+        return hash_arquivo(caminho)
+    sha1 = hashlib.sha1()
+    for arquivo in sorted(caminho.glob("*.parquet")):
+        sha1.update(f"{arquivo.name}:{hash_arquivo(arquivo)}\n".encode())
+    return sha1.hexdigest()
+
+
+def gravar_particoes(df: pl.DataFrame, diretorio: Path, buckets: int) -> str:
+    """
+    Grava as linhas de um chunk em um arquivo por partição (hash de N_AIH, na ordem do chunk),
+    via diretório .tmp + rename, e devolve o SHA-1 do diretório
+    """
+    temp = diretorio.with_name(diretorio.name + ".tmp")
+    shutil.rmtree(temp, ignore_errors=True)
+    temp.mkdir(parents=True)
+    particoes = df.with_columns(expressao_bucket(buckets)).partition_by(
+        COLUNA_BUCKET, include_key=False, as_dict=True
+    )
+    for (bucket,), particao in particoes.items():
+        particao.write_parquet(temp / nome_bucket(bucket), compression="snappy")
+    shutil.rmtree(diretorio, ignore_errors=True)
+    os.replace(temp, diretorio)
+    return hash_parte(diretorio)
+
+
+def gravar_partes(saidas: Dict[str, pl.DataFrame], trabalho_dir: Path, chunk_num: int,
+                  buckets: int = 0) -> Dict[str, str]:
+    """Grava a parte de cada saída do chunk e devolve os checksums ({saida: sha1})"""
+    checksums = {}
+    for nome, df_saida in saidas.items():
+        caminho = Path(trabalho_dir) / nome / nome_parte(chunk_num, nome)
+        if nome == NOME_CONTRAIDO:
+            checksums[nome] = gravar_particoes(df_saida, caminho, buckets)
+        else:
+            checksums[nome] = gravar_parte(df_saida, caminho)
+    return checksums
+
+
+def tratar_perfis(chunk: pl.DataFrame, perfis: List[Tuple[str, List[RegraLimpeza]]],
+                  quarentena: bool, ordenar: bool = False, fundir: bool = False) -> Dict[str, pl.DataFrame]:
+    """
+    Saída de cada perfil para um chunk; com `quarentena`, o primeiro perfil a gera no mesmo
+    plano. Com `ordenar`, as saídas dos perfis saem ordenadas por N_AIH (para a mescla final).
+    Com `fundir`, o primeiro perfil dá as linhas das partições da contração e a projeção.
+    """
+    saidas = {}
+    for i, (nome, regras) in enumerate(perfis):
+        if i == 0 and quarentena:
+            saidas[nome], saidas[NOME_QUARENTENA] = aplicar_com_quarentena(chunk, regras)
+        else:
+            saidas[nome] = aplicar(chunk, regras)
+        if ordenar:
+            saidas[nome] = saidas[nome].sort(CHAVE_ORDEM, maintain_order=True)
+    if fundir:
+        tratado = saidas.pop(perfis[0][0])
+        saidas[NOME_CONTRAIDO] = tratado
+        saidas[NOME_PROJECAO] = tratado.select(colunas_projecao(tratado.columns))
+    return saidas
+
+
+def tratar_chunk_worker(arquivo: Path, grupo: List[int], chunk_num: int, perfis: List[str],
+                        trabalho_dir: Path, quarentena: bool = False, ordenar: bool = False,
+                        buckets: int = 0) -> Tuple[Dict[str, str], Dict[str, int]]:
+    """
+    Lê um chunk, aplica os perfis e grava uma parte por saída (executada em processo worker).
+    Com `buckets` (modo `fundir`), o primeiro perfil vai para as partições da contração.
+    Retorna o checksum de cada parte e as contagens de valores anulados do chunk.
+    """
+    chunk = ler_chunk(arquivo, grupo)
+    saidas = tratar_perfis(chunk, [(nome, PERFIS[nome][0]) for nome in perfis], quarentena, ordenar, buckets > 0)
+    checksums = gravar_partes(saidas, trabalho_dir, chunk_num, buckets)
+    return checksums, contar_valores_invalidos(chunk)
+
+
+def contar_valores_invalidos(chunk: pl.DataFrame) -> Dict[str, int]:
+    """Datas que não decodificam e CIDs fora do dicionário, por coluna"""
+    contagens = contagem_valores_invalidos(chunk)
+    return contagens.row(0, named=True) if contagens.width else {}
+
+
+def processar_uf(uf: str) -> int:
+    """Pré-processa uma UF (executada em processo worker por executar_por_uf)"""
+    return SIHPreprocessor(chunk_size=100_000, uf=uf).processar()
+
+
 def main():
     """Execução principal"""
     try:
-        preprocessor = SIHPreprocessor(chunk_size=100_000)
-        resultado = preprocessor.processar()
-        print(f"\nSUCESSO! {resultado:,} registros processados.")
+        resultados = executar_por_uf(processar_uf, Settings.UF_DEFAULT)
+        resultado = sum(resultados.values())
+        print(f"\nSUCESSO! {resultado:,} registros processados ({len(resultados)} UFs).")
         
     except Exception as e:
         print(f"\nERRO: {e}")
@@ -0,0 +1,707 @@
+"""
+Registro declarativo das regras de limpeza do SIH
+Localização: projeto_sih/src/data/rules.py
+Função: TRANSFORM - Cada regra de limpeza é declarada uma única vez e compilada em um
+plano polars fundido (pré-processamento), medida isoladamente (tempo e linhas afetadas)
+e traduzida, quando faz sentido, no teste SQL correspondente do dbt (sih_analytics/tests)
+
+Uso: python src/data/rules.py [--dbt] [--perfil UF] [--linhas 100000]
+"""
+import sys
+import time
+import argparse
+import logging
+from dataclasses import dataclass
+from functools import lru_cache
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple, Union
+
+import polars as pl
+
+SRC_DIR = Path(__file__).parent.parent
+sys.path.insert(0, str(SRC_DIR))
+from config.settings import Settings
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+# === Grupos de colunas das regras de limpeza ===
+COLS_INT64 = ["N_AIH", "CNES", "CEP", "PROC_REA"]
+
+# Colunas de contagem ou valores médios → Int32
+COLS_INT32 = ["DIAR_ACOM", "UTI_MES_TO", "UTI_INT_TO", "codigo_6d", "NAT_JUR", "CBOR"]
+
+# Colunas com intervalos pequenos → Int16
+COLS_INT16 = ["IDADE", "DIAS_PERM", "NACIONAL", "GESTAO", "NATUREZA"]
+
+# Colunas com intervalos pequenos → Int8
+COLS_INT8 = ["SEXO", "NUM_FILHOS", "ETNIA", "RACA_COR", "INSTRU", "COMPLEX"]
+
+CAMPOS_VALORES = ['VAL_SH', 'VAL_SP', 'VAL_TOT', 'VAL_UTI']
+CAMPOS_DATAS = ['DT_INTER', 'DT_SAIDA', 'NASC']
+CAMPOS_MUNICIPIO = ['MUNIC_RES', 'MUNIC_MOV']
+CAMPOS_CID = ['DIAG_PRINC', 'DIAG_SECUN', 'CID_NOTIF', 'CID_ASSO', 'CID_MORTE']
+
+# Etapas do plano compilado
+ETAPA_COLUNA = 1      # Regras por coluna, compostas em uma única projeção
+ETAPA_DERIVADA = 2    # Derivações sobre as colunas já tratadas
+ETAPA_FILTRO = 3      # Predicados de linhas mantidas
+
+DBT_TESTS_DIR = Settings.BASE_DIR / "sih_analytics" / "tests"
+PREFIXO_TESTE_DBT = "regra_"
+
+
+@dataclass(frozen=True)
+class RegraLimpeza:
+    """
+    Uma regra de limpeza.
+
+    `transformar` recebe a expressão acumulada da coluna (etapa 1), `pl.col(coluna)`
+    (etapa 2) ou nada útil (etapa 3, devolve o predicado das linhas mantidas).
+    `sql_violacao` é a condição WHERE que identifica, já no banco, uma linha que a
+    regra deveria ter corrigido; `{col}` é substituído pelo nome da coluna entre aspas.
+    `disparou(antes, depois)` é o predicado das linhas em que a regra alterou o valor
+    (quarentena); por padrão, o valor de antes convertido para o tipo de depois difere.
+    Com `quarentena=False` a regra não entra na máscara: as derivações que só recalculam
+    a coluna a partir de outras (VAL_TOT, IDADE, DIAS_PERM) alteram quase toda linha.
+    `preparar` (etapa 1) converte a coluna em um with_columns anterior à projeção, e
+    `transformar` recebe a coluna já convertida: uma conversão referenciada várias vezes
+    pela transformação (ex.: o Int32 das datas) é calculada uma única vez.
+    """
+    nome: str
+    descricao: str
+    colunas: Tuple[str, ...]
+    transformar: Callable[[pl.Expr], pl.Expr]
+    etapa: int = ETAPA_COLUNA
+    requer: Tuple[str, ...] = ()
+    padrao: Optional[Callable[[], pl.Expr]] = None   # Valor da coluna quando ausente na entrada
+    sql_violacao: Optional[str] = None
+    sql_tabela: Optional[str] = None                  # Padrão: tabela que contém a coluna
+    disparou: Optional[Callable[[pl.Expr, pl.Expr], pl.Expr]] = None
+    quarentena: bool = True
+    preparar: Optional[Callable[[pl.Expr], pl.Expr]] = None
+
+    def aplicavel(self, colunas: set) -> bool:
+        return all(c in colunas for c in self.requer)
+
+
+# === Transformações ===
+
+def _cast_inteiro(tipo: pl.DataType) -> Callable[[pl.Expr], pl.Expr]:
+    return lambda e: e.cast(tipo, strict=False).fill_null(0)
+
+
+def _valor(e: pl.Expr) -> pl.Expr:
+    # Texto → float, tratando vírgula decimal, espaços e sinais
+    return (
+        e.cast(pl.String, strict=False)
+        .str.replace_all(",", ".")
+        .str.replace_all(" ", "")
+        .str.replace_all("-", "")
+        .cast(pl.Float64, strict=False)
+        .fill_null(0.0)
+        .clip(lower_bound=0.0)
+    )
+
+
+def _valor_alterado(antes: pl.Expr, depois: pl.Expr) -> pl.Expr:
+    # Vírgula decimal não conta; sinal removido, texto ilegível ou vazio → 0.0 contam
+    lido = antes.cast(pl.String, strict=False).str.strip_chars().str.replace_all(",", ".").cast(pl.Float64, strict=False)
+    return lido.ne_missing(depois)
+
+
+def _preenchido(e: pl.Expr) -> pl.Expr:
+    s = e.cast(pl.String, strict=False).str.strip_chars()
+    return s.is_not_null() & (s != "")
+
+
+def inteiro_data(e: pl.Expr) -> pl.Expr:
+    """AAAAMMDD em texto de largura fixa (ou inteiro) → Int32; ilegível → nulo"""
+    return e.cast(pl.String, strict=False).str.strip_chars().cast(pl.Int32, strict=False)
+
+
+def data_de_inteiro(v: pl.Expr) -> pl.Expr:
+    """
+    Inteiro AAAAMMDD → Date por aritmética: ano, mês e dia separados por divisão,
+    validados (inclusive 29/02) e convertidos em dias desde 1970-01-01; inválidas → nulo.
+    `v` é referenciada várias vezes: use sobre uma coluna já convertida (inteiro_data em
+    um with_columns anterior); composta com a conversão, ela é refeita a cada referência.
+    """
+    ano, mes, dia = v // 10000, (v // 100) % 100, v % 100
+    bissexto = ((ano % 4 == 0) & (ano % 100 != 0)) | (ano % 400 == 0)
+    dias_no_mes = pl.when(mes == 2).then(28 + bissexto.cast(pl.Int32)).otherwise(30 + (mes + mes // 8) % 2)
+    valida = (ano >= 1) & (ano <= 9999) & (mes >= 1) & (mes <= 12) & (dia >= 1) & (dia <= dias_no_mes)
+    # Ano começando em março: o dia bissexto é o último do ano
+    a = ano - (mes <= 2).cast(pl.Int32)
+    dias = 365 * a + a // 4 - a // 100 + a // 400 + (153 * ((mes + 9) % 12) + 2) // 5 + dia - 719469
+    return pl.when(valida).then(dias).cast(pl.Date)
+
+
+def decodificar_datas(
+    df: Union[pl.DataFrame, pl.LazyFrame], colunas: List[str]
+) -> Union[pl.DataFrame, pl.LazyFrame]:
+    """
+    Colunas AAAAMMDD → Date sem formatar e reinterpretar texto: o Int32 é convertido uma
+    vez e a aritmética de data_de_inteiro roda sobre ele (0,7 s contra 0,9 s do strptime em
+    3M linhas x 3 colunas com a cardinalidade das datas do SIH; ver reports/benchmark_preprocess.py)
+    """
+    return df.with_columns(inteiro_data(pl.col(c)).alias(c) for c in colunas).with_columns(
+        data_de_inteiro(pl.col(c)).alias(c) for c in colunas
+    )
+
+
+def _data_invalida(antes: pl.Expr, depois: pl.Expr) -> pl.Expr:
+    return _preenchido(antes) & depois.is_null()
+
+
+# Int32 das datas nas contagens laterais (convertido uma vez, como na regra "datas")
+SUFIXO_INTEIRO_DATA = "_AAAAMMDD"
+
+
+def contagem_datas_invalidas(colunas: set) -> List[pl.Expr]:
+    """
+    Por coluna de data: valores preenchidos que não formam uma data válida (sobre o
+    Int32 de col + SUFIXO_INTEIRO_DATA, ver contagem_valores_invalidos)
+    """
+    contagens = []
+    for col in CAMPOS_DATAS:
+        if col in colunas:
+            invalida = _data_invalida(pl.col(col), data_de_inteiro(pl.col(col + SUFIXO_INTEIRO_DATA)))
+            contagens.append(invalida.sum().cast(pl.Int64).alias(col))
+    return contagens
+
+
+def contagem_cids_fora_dicionario(colunas: set) -> List[pl.Expr]:
+    """Por coluna de CID: códigos (já normalizados) que não estão no dicionário CID-10"""
+    return [
+        _cid_dicionario(_cid(pl.col(col))).is_null().sum().cast(pl.Int64).alias(col)
+        for col in CAMPOS_CID if col in colunas
+    ]
+
+
+def contagem_valores_invalidos(df: Union[pl.DataFrame, pl.LazyFrame]) -> Union[pl.DataFrame, pl.LazyFrame]:
+    """
+    Contagens laterais do pré-processamento (uma linha, uma coluna por campo): datas
+    inválidas e CIDs fora do dicionário
+    """
+    colunas = set(df.collect_schema().names())
+    datas = [c for c in CAMPOS_DATAS if c in colunas]
+    return df.with_columns(inteiro_data(pl.col(c)).alias(c + SUFIXO_INTEIRO_DATA) for c in datas).select(
+        contagem_datas_invalidas(colunas) + contagem_cids_fora_dicionario(colunas)
+    )
+
+
+def _municipio(e: pl.Expr) -> pl.Expr:
+    # DF colapsado em 530010 (Brasília) e padronização para 6 dígitos
+    s = e.cast(pl.String, strict=False).str.strip_chars().fill_null("000000")
+    return (
+        pl.when(s.str.starts_with("53")).then(pl.lit("530010")).otherwise(s)
+        .str.slice(0, 6)
+        .str.pad_start(length=6, fill_char='0')
+        .cast(pl.Int64, strict=False)
+        .fill_null(0)
+        .clip(lower_bound=0)
+    )
+
+
+def _nacional(e: pl.Expr) -> pl.Expr:
+    return pl.when(e == 0).then(pl.lit(10)).otherwise(e).clip(lower_bound=0, upper_bound=350)
+
+
+def _cid(e: pl.Expr) -> pl.Expr:
+    # Vazio, nulo ou só zeros → '0'
+    s = e.cast(pl.String, strict=False).str.strip_chars().str.to_uppercase()
+    return pl.when(s.is_in([""]) | s.is_null() | s.str.contains(r"^0+$")).then(pl.lit("0")).otherwise(s)
+
+
+@lru_cache(maxsize=1)
+def dicionario_cid10() -> pl.Enum:
+    """
+    Enum fixo com os códigos de data/support/cid10.csv (inclui '0', não preenchido),
+    em ordem alfabética: o mesmo dicionário para todas as UFs e execuções.
+    """
+    arquivo = Settings.get_support_file_path("cid10")
+    if not arquivo.exists():
+        raise FileNotFoundError(f"Dicionário CID-10 não encontrado: {arquivo}")
+    codigos = pl.read_csv(arquivo, columns=["CID"], schema_overrides={"CID": pl.String}, encoding="utf8-lossy")["CID"]
+    codigos = pl.concat([codigos.str.strip_chars().str.to_uppercase(), pl.Series(["0"])])
+    return pl.Enum(codigos.drop_nulls().unique().sort())
+
+
+def _cid_zeros_alterado(antes: pl.Expr, depois: pl.Expr) -> pl.Expr:
+    # Vazio/nulo → '0' é só a marca de não preenchido; conta quando um código preenchido muda
+    s = antes.cast(pl.String, strict=False).str.strip_chars().str.to_uppercase()
+    return _preenchido(antes) & s.ne_missing(depois)
+
+
+def _cid_dicionario(e: pl.Expr) -> pl.Expr:
+    # Códigos fora do dicionário viram nulo (contados por contagem_cids_fora_dicionario)
+    return e.cast(dicionario_cid10(), strict=False)
+
+
+def _idade(_: pl.Expr) -> pl.Expr:
+    return (
+        pl.col("DT_INTER").dt.year() - pl.col("NASC").dt.year() -
+        pl.when(
+            (pl.col("DT_INTER").dt.month() < pl.col("NASC").dt.month()) |
+            ((pl.col("DT_INTER").dt.month() == pl.col("NASC").dt.month()) &
+             (pl.col("DT_INTER").dt.day() < pl.col("NASC").dt.day()))
+        )
+        .then(1)
+        .otherwise(0)
+    ).clip(0, 150).cast(pl.Int16)
+
+
+def _dias_perm(_: pl.Expr) -> pl.Expr:
+    return (pl.col("DT_SAIDA") - pl.col("DT_INTER")).dt.total_days().cast(pl.Int16, strict=False).fill_null(0)
+
+
+def _raca_etnia(_: pl.Expr) -> pl.Expr:
+    # Se RACA_COR != 5 e ETNIA for válida (≠ 0), a raça/cor passa a ser indígena
+    return (
+        pl.when((pl.col("RACA_COR") != 5) & (pl.col("ETNIA") != 0))
+        .then(pl.lit(5))
+        .otherwise(pl.col("RACA_COR"))
+    )
+
+
+SQL_IDADE = """"DT_INTER" IS NOT NULL AND "NASC" IS NOT NULL AND "DT_INTER" > "NASC"
+    AND {col} <> LEAST(GREATEST(
+        EXTRACT(YEAR FROM "DT_INTER") - EXTRACT(YEAR FROM "NASC") -
+        CASE
+            WHEN EXTRACT(MONTH FROM "DT_INTER") < EXTRACT(MONTH FROM "NASC") OR
+                 (EXTRACT(MONTH FROM "DT_INTER") = EXTRACT(MONTH FROM "NASC") AND
+                  EXTRACT(DAY FROM "DT_INTER") < EXTRACT(DAY FROM "NASC"))
+            THEN 1 ELSE 0
+        END, 0), 150)"""
+
+
+# === Registro (a ordem é a ordem de aplicação) ===
+REGRAS: List[RegraLimpeza] = [
+    RegraLimpeza("tipo_int64", "Códigos numéricos longos → Int64", tuple(COLS_INT64), _cast_inteiro(pl.Int64)),
+    RegraLimpeza("tipo_int32", "Contagens e valores médios → Int32", tuple(COLS_INT32), _cast_inteiro(pl.Int32)),
+    RegraLimpeza("tipo_int16", "Intervalos pequenos → Int16", tuple(COLS_INT16), _cast_inteiro(pl.Int16)),
+    RegraLimpeza("tipo_int8", "Intervalos pequenos → Int8", tuple(COLS_INT8), _cast_inteiro(pl.Int8)),
+    RegraLimpeza(
+        "valores", "Valores em texto → float não negativo (vírgula decimal)", tuple(CAMPOS_VALORES), _valor,
+        sql_violacao="{col} < 0", disparou=_valor_alterado,
+    ),
+    RegraLimpeza(
+        "val_uti_ausente", "VAL_UTI ausente na entrada → 0.0", ("VAL_UTI",), lambda e: e,
+        padrao=lambda: pl.lit(0.0).cast(pl.Float64),
+    ),
+    RegraLimpeza(
+        "datas", "Datas AAAAMMDD → Date", tuple(CAMPOS_DATAS), data_de_inteiro, preparar=inteiro_data,
+        disparou=_data_invalida,
+    ),
+    RegraLimpeza(
+        "municipio_df", "Municípios com 6 dígitos; DF colapsado em 530010", tuple(CAMPOS_MUNICIPIO), _municipio,
+        sql_violacao="{col} BETWEEN 530000 AND 539999 AND {col} <> 530010",
+    ),
+    RegraLimpeza(
+        "nacional", "NACIONAL 0 → 10 (Brasil), limitado a [0, 350]", ("NACIONAL",), _nacional,
+        sql_violacao="{col} < 0 OR {col} > 350",
+    ),
+    RegraLimpeza(
+        "raca_cor_limites", "RACA_COR em [0, 99]", ("RACA_COR",),
+        lambda e: e.cast(pl.Int8, strict=False).fill_null(0).clip(lower_bound=0, upper_bound=99),
+        requer=("RACA_COR", "ETNIA"),
+    ),
+    RegraLimpeza(
+        "etnia_limites", "ETNIA em [0, 264]", ("ETNIA",),
+        lambda e: e.cast(pl.Int16, strict=False).fill_null(0).clip(lower_bound=0, upper_bound=264),
+        requer=("RACA_COR", "ETNIA"),
+        sql_violacao="{col} < 0 OR {col} > 264",
+    ),
+    RegraLimpeza(
+        "proc_rea", "PROC_REA → Int64 não negativo", ("PROC_REA",),
+        lambda e: e.cast(pl.Int64, strict=False).fill_null(0).clip(lower_bound=0),
+    ),
+    RegraLimpeza(
+        "cid_zeros", "CIDs em maiúsculas; vazio, nulo ou só zeros → '0'", tuple(CAMPOS_CID), _cid,
+        sql_violacao="{col} <> UPPER(TRIM({col})) OR ({col} ~ '^0+$' AND {col} <> '0')",
+        disparou=_cid_zeros_alterado,
+    ),
+    RegraLimpeza(
+        "cid_dicionario", "CIDs codificados no Enum do CID-10 (fora do dicionário → nulo)", tuple(CAMPOS_CID),
+        _cid_dicionario, disparou=lambda antes, depois: antes.is_not_null() & depois.is_null(),
+        sql_violacao="{col} IS NOT NULL AND {col} NOT IN (SELECT \"CID\" FROM {{ source('public', 'cid10') }})",
+    ),
+    RegraLimpeza(
+        "val_tot", "VAL_TOT = VAL_SH + VAL_SP + VAL_UTI", ("VAL_TOT",),
+        lambda _: pl.col("VAL_SH") + pl.col("VAL_SP") + pl.col("VAL_UTI"),
+        etapa=ETAPA_DERIVADA, quarentena=False,
+    ),
+    RegraLimpeza(
+        "idade", "IDADE recalculada de NASC e DT_INTER, em [0, 150]", ("IDADE",), _idade,
+        etapa=ETAPA_DERIVADA, requer=("DT_INTER", "NASC"), sql_violacao=SQL_IDADE, quarentena=False,
+    ),
+    RegraLimpeza(
+        "dias_perm", "DIAS_PERM = DT_SAIDA - DT_INTER", ("DIAS_PERM",), _dias_perm,
+        etapa=ETAPA_DERIVADA, requer=("DT_INTER", "DT_SAIDA"), quarentena=False,
+        sql_violacao='"DT_INTER" IS NOT NULL AND "DT_SAIDA" IS NOT NULL AND {col} <> ("DT_SAIDA" - "DT_INTER")',
+    ),
+    RegraLimpeza(
+        "raca_etnia", "RACA_COR = 5 (indígena) quando ETNIA é válida", ("RACA_COR",), _raca_etnia,
+        etapa=ETAPA_DERIVADA, requer=("RACA_COR", "ETNIA"),
+        sql_violacao="{col} <> 5 AND \"N_AIH\" IN (SELECT \"N_AIH\" FROM {{ source('public', 'etnia') }} WHERE \"ETNIA\" <> 0)",
+    ),
+    RegraLimpeza(
+        "n_aih_nulo", "Descarta registros sem N_AIH", ("N_AIH",), lambda _: pl.col("N_AIH").is_not_null(),
+        etapa=ETAPA_FILTRO, sql_violacao="{col} IS NULL",
+    ),
+]
+
+
+def obter_regra(nome: str, regras: Optional[List[RegraLimpeza]] = None) -> RegraLimpeza:
+    for regra in regras or REGRAS:
+        if regra.nome == nome:
+            return regra
+    raise KeyError(f"Regra de limpeza desconhecida: {nome}")
+
+
+# Perfil "variável tipo": apenas a tipagem das colunas, sem a limpeza de valores
+# (antiga saída de preprocess_type.py)
+REGRAS_TIPO: List[RegraLimpeza] = [
+    RegraLimpeza(
+        "valores_float", "Valores → float (sem limpeza)", tuple(CAMPOS_VALORES),
+        lambda e: e.cast(pl.Float64, strict=False),
+    ),
+    obter_regra("val_uti_ausente"),
+    obter_regra("datas"),
+    RegraLimpeza("nacional_int16", "NACIONAL → Int16 (sem limpeza)", ("NACIONAL",), lambda e: e.cast(pl.Int16, strict=False)),
+    RegraLimpeza(
+        "tipo_int8_bruto", "NUM_FILHOS e ETNIA → Int8 (sem preenchimento)", ("NUM_FILHOS", "ETNIA"),
+        lambda e: e.cast(pl.Int8, strict=False),
+    ),
+]
+
+
+# === Compilação ===
+
+def compilar(
+    regras: List[RegraLimpeza], colunas: set
+) -> Tuple[List[pl.Expr], List[pl.Expr], List[pl.Expr], List[pl.Expr]]:
+    """
+    Compila as regras para um schema de entrada em (preparo, projeção da etapa 1,
+    derivações da etapa 2, predicados). Na etapa 1 as regras de uma mesma coluna são
+    compostas, na ordem do registro, em uma única expressão; o `preparar` de uma regra
+    leva a composição até ela para o preparo, e a projeção continua da coluna preparada.
+    """
+    preparo: Dict[str, pl.Expr] = {}
+    exprs: Dict[str, pl.Expr] = {}
+    derivadas, filtros = [], []
+
+    for regra in regras:
+        if not regra.aplicavel(colunas):
+            continue
+        if regra.etapa == ETAPA_COLUNA:
+            for col in regra.colunas:
+                if col in colunas and regra.preparar is not None:
+                    if col in preparo:
+                        raise ValueError(f"Coluna {col} preparada por mais de uma regra")
+                    preparo[col] = regra.preparar(exprs.pop(col, pl.col(col)))
+                if col in colunas:
+                    exprs[col] = regra.transformar(exprs.get(col, pl.col(col)))
+                elif regra.padrao is not None:
+                    exprs[col] = regra.padrao()
+        elif regra.etapa == ETAPA_DERIVADA:
+            derivadas.extend(regra.transformar(pl.col(col)).alias(col) for col in regra.colunas)
+        else:
+            filtros.append(regra.transformar(pl.col(regra.colunas[0])))
+
+    return (
+        [expr.alias(col) for col, expr in preparo.items()],
+        [expr.alias(col) for col, expr in exprs.items()],
+        derivadas,
+        filtros,
+    )
+
+
+def aplicar(
+    df: Union[pl.DataFrame, pl.LazyFrame], regras: Optional[List[RegraLimpeza]] = None
+) -> Union[pl.DataFrame, pl.LazyFrame]:
+    """Aplica o plano compilado (um DataFrame passa pelo motor lazy e volta materializado)"""
+    if isinstance(df, pl.DataFrame):
+        # Pelo motor lazy, as subexpressões repetidas (ex.: o CID normalizado usado
+        # no when/then) são calculadas uma única vez
+        return aplicar(df.lazy(), regras).collect()
+
+    preparo, projecao, derivadas, filtros = compilar(regras or REGRAS, set(df.collect_schema().names()))
+    if preparo:
+        df = df.with_columns(preparo)
+    if projecao:
+        df = df.with_columns(projecao)
+    if derivadas:
+        df = df.with_columns(derivadas)
+    for predicado in filtros:
+        df = df.filter(predicado)
+    return df
+
+
+# === Quarentena ===
+
+COLUNA_MASCARA = "REGRAS"          # Bit i = regras[i] alterou (ou descartou) a linha
+SUFIXO_ORIGINAL = "_ORIGINAL"      # Valor de entrada (texto) das colunas alteradas
+
+
+def _alterou(regra: RegraLimpeza, antes: pl.Expr, depois: pl.Expr, tipo: pl.DataType) -> pl.Expr:
+    if regra.disparou is not None:
+        return regra.disparou(antes, depois).fill_null(False)
+    return antes.cast(tipo, strict=False).ne_missing(depois)
+
+
+def planejar_quarentena(
+    df: pl.LazyFrame, regras: Optional[List[RegraLimpeza]] = None
+) -> Tuple[pl.LazyFrame, pl.LazyFrame]:
+    """
+    Saída tratada e quarentena a partir de um único plano. As regras são aplicadas em
+    etapas (uma projeção por regra, como a implementação sequencial de
+    reports/benchmark_preprocess.py) para que cada uma compare o valor de antes com o
+    seu resultado sem recalcular a cadeia da coluna.
+    A saída tratada é igual à de `aplicar`. A quarentena tem N_AIH (tratado), a máscara
+    das regras (COLUNA_MASCARA) e o valor original de cada coluna alterada (nulo nas
+    demais); as linhas descartadas pelos filtros entram só nela. Regras com
+    `quarentena=False` são aplicadas sem comparação e não marcam linhas.
+    """
+    regras = regras or REGRAS
+    if len(regras) > 63:
+        raise ValueError("A máscara da quarentena comporta no máximo 63 regras")
+    colunas = set(df.collect_schema().names())
+    saida = aplicar(df, regras).collect_schema().names()
+    aplicaveis = [(bit, regra) for bit, regra in enumerate(regras) if regra.aplicavel(colunas)]
+    originais = sorted({c for _, regra in aplicaveis if regra.quarentena for c in regra.colunas if c in colunas})
+
+    plano = df.with_columns(pl.col(c).cast(pl.String, strict=False).alias(c + SUFIXO_ORIGINAL) for c in originais)
+    marcadas, filtros = [], []
+    # Mesma ordem de `compilar`: etapa 1, derivações, filtros
+    for bit, regra in sorted(aplicaveis, key=lambda item: item[1].etapa):
+        if regra.etapa == ETAPA_FILTRO:
+            col = regra.colunas[0]
+            predicado = regra.transformar(pl.col(col))
+            plano = plano.with_columns((~predicado).fill_null(True).alias(f"_q{bit}_{col}"))
+            marcadas.append((bit, col))
+            filtros.append(predicado)
+            continue
+
+        novos, padroes, preparados = {}, [], []
+        for col in regra.colunas:
+            if col in colunas and regra.preparar is not None:
+                # Coluna preparada à parte: a comparação usa o valor de antes
+                preparados.append(regra.preparar(pl.col(col)).alias(f"_p_{col}"))
+                novos[col] = regra.transformar(pl.col(f"_p_{col}"))
+            elif col in colunas:
+                novos[col] = regra.transformar(pl.col(col))
+            elif regra.etapa == ETAPA_DERIVADA:
+                padroes.append(regra.transformar(pl.col(col)).alias(col))
+            elif regra.padrao is not None:
+                padroes.append(regra.padrao().alias(col))
+        if padroes:
+            # Coluna ausente na entrada: criada sem valor original para comparar
+            plano = plano.with_columns(padroes)
+        if preparados:
+            plano = plano.with_columns(preparados)
+        if not novos:
+            continue
+        if not regra.quarentena:
+            plano = plano.with_columns(e.alias(c) for c, e in novos.items())
+            continue
+        tipos = plano.select([e.alias(c) for c, e in novos.items()]).collect_schema()
+        plano = plano.with_columns(e.alias(f"_d_{c}") for c, e in novos.items())
+        plano = plano.with_columns(
+            [_alterou(regra, pl.col(c), pl.col(f"_d_{c}"), tipos[c]).alias(f"_q{bit}_{c}") for c in novos]
+            + [pl.col(f"_d_{c}").alias(c) for c in novos]
+        )
+        marcadas.extend((bit, c) for c in novos)
+
+    def alguma(pares) -> pl.Expr:
+        return pl.any_horizontal([pl.col(f"_q{b}_{c}") for b, c in pares])
+
+    bits = sorted({b for b, _ in marcadas})
+    mascara = pl.sum_horizontal(
+        pl.when(alguma([m for m in marcadas if m[0] == b])).then(pl.lit(1 << b, dtype=pl.Int64))
+        .otherwise(pl.lit(0, dtype=pl.Int64))
+        for b in bits
+    ) if bits else pl.lit(0, dtype=pl.Int64)
+    plano = plano.with_columns(mascara.cast(pl.Int64).alias(COLUNA_MASCARA))
+
+    tratado = plano
+    for predicado in filtros:
+        tratado = tratado.filter(predicado)
+    quarentena = plano.filter(pl.col(COLUNA_MASCARA) != 0).select(
+        [pl.col("N_AIH"), pl.col(COLUNA_MASCARA)]
+        + [
+            pl.when(alguma([m for m in marcadas if m[1] == c])).then(pl.col(c + SUFIXO_ORIGINAL))
+            .alias(c + SUFIXO_ORIGINAL)
+            for c in originais
+        ]
+    )
+    return tratado.select(saida), quarentena
+
+
+def aplicar_com_quarentena(
+    df: Union[pl.DataFrame, pl.LazyFrame], regras: Optional[List[RegraLimpeza]] = None
+) -> Tuple[Union[pl.DataFrame, pl.LazyFrame], Union[pl.DataFrame, pl.LazyFrame]]:
+    """
+    (saída tratada, quarentena). Um DataFrame é processado uma única vez; para um LazyFrame
+    os dois planos compartilham a varredura quando executados juntos (collect_all).
+    """
+    if isinstance(df, pl.LazyFrame):
+        return planejar_quarentena(df, regras)
+    return tuple(pl.collect_all(list(planejar_quarentena(df.lazy(), regras))))
+
+
+def resumo_quarentena(quarentena: Union[pl.DataFrame, pl.LazyFrame],
+                      regras: Optional[List[RegraLimpeza]] = None) -> pl.DataFrame:
+    """Linhas marcadas por regra (decodificando a máscara) e total de linhas em quarentena"""
+    regras = regras or REGRAS
+    mascara = pl.col(COLUNA_MASCARA)
+    contagens = quarentena.lazy().select(
+        [pl.len().alias("_total")]
+        + [((mascara & (1 << bit)) != 0).sum().alias(regra.nome) for bit, regra in enumerate(regras)]
+    ).collect()
+    total = contagens["_total"][0]
+    return pl.DataFrame({
+        "regra": [r.nome for r in regras],
+        "bit": list(range(len(regras))),
+        "linhas": [contagens[r.nome][0] for r in regras],
+    }).filter(pl.col("linhas") > 0).with_columns(
+        (100.0 * pl.col("linhas") / total if total else pl.lit(0.0)).alias("pct_quarentena")
+    )
+
+
+# === Custo por regra ===
+
+def _alteradas(antes: pl.DataFrame, depois: pl.DataFrame, colunas: List[str]) -> int:
+    """Linhas em que alguma das colunas mudou de valor (ou de nulo/não nulo)"""
+    mudou = None
+    for col in colunas:
+        if col not in antes.columns:
+            return depois.height
+        diferente = antes[col].cast(pl.String).ne_missing(depois[col].cast(pl.String))
+        mudou = diferente if mudou is None else mudou | diferente
+    return int(mudou.sum()) if mudou is not None else 0
+
+
+def perfilar(df: pl.DataFrame, regras: Optional[List[RegraLimpeza]] = None) -> Tuple[pl.DataFrame, pl.DataFrame]:
+    """
+    Aplica as regras uma a uma sobre um chunk, medindo tempo e linhas afetadas de cada uma.
+    Retorna (chunk tratado, relatório). O chunk tratado é igual ao do plano compilado;
+    os tempos são da regra isolada e não somam o tempo do plano fundido.
+    """
+    regras = regras or REGRAS
+    colunas = set(df.columns)
+    total = df.height
+    linhas = []
+
+    for regra in regras:
+        if not regra.aplicavel(colunas):
+            continue
+        preparo, projecao, derivadas, filtros = compilar([regra], colunas)
+        alvo = [c for c in regra.colunas if c in colunas or regra.padrao is not None or regra.etapa == ETAPA_DERIVADA]
+
+        inicio = time.perf_counter()
+        if filtros:
+            depois = df.lazy().filter(filtros[0]).collect()
+        else:
+            depois = df.lazy().with_columns(preparo).with_columns(projecao or derivadas).collect()
+        tempo = time.perf_counter() - inicio
+
+        if filtros:
+            afetadas = df.height - depois.height
+        else:
+            afetadas = _alteradas(df, depois, alvo)
+
+        linhas.append({
+            "regra": regra.nome,
+            "etapa": regra.etapa,
+            "colunas": ",".join(alvo),
+            "tempo_ms": tempo * 1000,
+            "linhas_afetadas": afetadas,
+            "pct_afetadas": 100.0 * afetadas / total if total else 0.0,
+        })
+        df = depois
+
+    return df, pl.DataFrame(linhas)
+
+
+# === Testes dbt ===
+
+def tabela_da_coluna(coluna: str) -> Optional[str]:
+    """Tabela do banco que guarda a coluna (internacoes tem prioridade)"""
+    # Import tardio: o pacote database carrega a camada de carga no banco
+    from database.schema import TABLE_SCHEMAS
+
+    if coluna in TABLE_SCHEMAS["internacoes"]["columns"]:
+        return "internacoes"
+    for nome, schema in TABLE_SCHEMAS.items():
+        if coluna in schema["columns"]:
+            return nome
+    return None
+
+
+def sql_teste_dbt(regra: RegraLimpeza) -> Optional[str]:
+    """Teste singular do dbt (passa com 0 linhas) para as colunas da regra"""
+    if not regra.sql_violacao:
+        return None
+    consultas = []
+    for col in regra.colunas:
+        tabela = regra.sql_tabela or tabela_da_coluna(col)
+        if tabela is None:
+            continue
+        condicao = regra.sql_violacao.replace("{col}", f'"{col}"')
+        consultas.append(
+            f'SELECT "N_AIH", \'{col}\' AS coluna\n'
+            f"FROM {{{{ source('public', '{tabela}') }}}}\n"
+            f"WHERE {condicao}"
+        )
+    if not consultas:
+        return None
+    cabecalho = (
+        f"-- Gerado por src/data/rules.py a partir da regra '{regra.nome}': {regra.descricao}\n"
+        f"-- O teste passa se esta consulta retornar 0 linhas.\n\n"
+    )
+    return cabecalho + "\n\nUNION ALL\n\n".join(consultas) + "\n"
+
+
+def escrever_testes_dbt(pasta: Optional[Path] = None, regras: Optional[List[RegraLimpeza]] = None) -> List[Path]:
+    """Grava um regra_<nome>.sql por regra com verificação SQL"""
+    pasta = Path(pasta or DBT_TESTS_DIR)
+    pasta.mkdir(parents=True, exist_ok=True)
+    gravados = []
+    for regra in regras or REGRAS:
+        sql = sql_teste_dbt(regra)
+        if sql is None:
+            continue
+        arquivo = pasta / f"{PREFIXO_TESTE_DBT}{regra.nome}.sql"
+        arquivo.write_text(sql, encoding="utf-8")
+        gravados.append(arquivo)
+    logger.info(f"{len(gravados)} testes dbt gravados em {pasta}")
+    return gravados
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dbt", action="store_true", help="Grava os testes SQL das regras em sih_analytics/tests")
+    parser.add_argument("--perfil", metavar="UF", help="Mede as regras sobre o primeiro chunk unificado da UF")
+    parser.add_argument("--linhas", type=int, default=100_000)
+    args = parser.parse_args()
+
+    if args.dbt:
+        escrever_testes_dbt()
+
+    if args.perfil:
+        from data.chunks import iterar_chunks, resolver_entrada
+        chunk, _, _ = next(iterar_chunks(resolver_entrada(Settings.get_unificado_dir(args.perfil.upper())), args.linhas))
+        _, relatorio = perfilar(chunk)
+        with pl.Config(tbl_rows=len(REGRAS), tbl_width_chars=160, float_precision=2):
+            print(relatorio.sort("tempo_ms", descending=True))
+
+    if not (args.dbt or args.perfil):
+        for regra in REGRAS:
+            print(f"[{regra.etapa}] {regra.nome:18} {regra.descricao}")
+
+
+if __name__ == "__main__":
+    main()
@@ -11,23 +11,29 @@ sys.path.insert(0, str(SRC_DIR))
 
 from config.settings import Settings
 from database.schema import TABLE_SCHEMAS
+from data.cid import coluna_codificada
+from data.parallel import executar_por_uf
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(message)s')
 logger = logging.getLogger(__name__)
 
 class TableSplitter:
-    def __init__(self):
+    def __init__(self, uf=None):
     
-        self.input_parquet_path = Settings.INTERIM_DIR / Settings.PARQUET_CONTRACT_FILENAME
-        self.input_parquet_full = Settings.INTERIM_DIR/ Settings.PARQUET_TREATED_FILENAME
-        self.output_dir = Settings.PROCESSED_DIR
+        # Tabelas de cada UF vão para PROCESSED_DIR/uf=XX; as de apoio, para a raiz de PROCESSED_DIR
+        self.uf = (uf or Settings.UF_DEFAULT[0]).upper()
+        self.input_parquet_path = Settings.get_contraido_path(self.uf)
+        # Sem o tratado completo (PREPROCESS_FUNDIR), as colunas de atendimentos vêm da projeção
+        self.input_parquet_full = Settings.get_linhas_tratadas_path(self.uf)
+        self.output_dir = Settings.get_processado_dir(self.uf)
         self.output_dir.mkdir(parents=True, exist_ok=True)
 
         self.internacoes_cols = [
             "CNES", "N_AIH", "ESPEC", "IDENT", "DT_INTER", "DT_SAIDA", 
             "VAL_SH", "VAL_SP", "VAL_TOT",  "DIAS_PERM",
             "COMPLEX",  "MUNIC_MOV", "DIAG_PRINC",
-            "NASC", "SEXO", "IDADE", "NACIONAL", "NUM_FILHOS", "RACA_COR", "MUNIC_RES", "CEP"
+            "NASC", "SEXO", "IDADE", "NACIONAL", "NUM_FILHOS", "RACA_COR", "MUNIC_RES", "CEP",
+            "ID_FONTE", "COMPETENCIA"
         ]
 
         self.uti_detalhes_cols = [
@@ -65,7 +71,7 @@ class TableSplitter:
         ]
 
         self.atendimentos_cols = [
-            "N_AIH", "PROC_REA"
+            "N_AIH", "PROC_REA", "ID_FONTE", "COMPETENCIA"
         ]
 
     def split_atendimentos(self):
@@ -89,7 +95,7 @@ class TableSplitter:
         logger.info(f"Iniciando divisão para a tabela '{table_name}'...")
         try:
             df = pl.read_parquet(self.input_parquet_path, columns=self.internacoes_cols)
-            df = df.select(self.internacoes_cols)
+            df = coluna_codificada(df.select(self.internacoes_cols), "DIAG_PRINC")
             df.write_parquet(output_file, compression="snappy")
             logger.info(f"Divisão para '{table_name}' concluída. {len(df):,} registros salvos.")
             del df
@@ -139,7 +145,8 @@ class TableSplitter:
             if "N_AIH" not in cols:
                 cols.insert(0, "N_AIH")
             df = pl.read_parquet(self.input_parquet_path, columns=cols)
-            df = df.filter(pl.col("IND_VDRL") == "1").unique(subset=["N_AIH"], keep="first")
+            # O conversor nativo grava campos N do DBF como inteiros; o pysus, como texto
+            df = df.filter(pl.col("IND_VDRL").cast(pl.String, strict=False) == "1").unique(subset=["N_AIH"], keep="first")
             df = df.select(cols)
             df.write_parquet(output_file, compression="snappy")
             logger.info(f"Divisão para '{table_name}' concluída. {len(df):,} registros salvos.")
@@ -241,9 +248,10 @@ class TableSplitter:
         try:
             df = pl.read_parquet(self.input_parquet_path, columns=["N_AIH", "MORTE", "CID_MORTE"])
 
-            df = df.filter(pl.col("MORTE") == "1")
+            df = df.filter(pl.col("MORTE").cast(pl.String, strict=False) == "1")
 
             df = df.select(["N_AIH", "CID_MORTE"]).unique(subset=["N_AIH"], keep="first")
+            df = coluna_codificada(df, "CID_MORTE")
 
             df.write_parquet(output_file, compression="snappy")
             logger.info(f"Divisão para '{table_name}' concluída. {len(df):,} registros salvos.")
@@ -339,7 +347,7 @@ class TableSplitter:
         tabela de dimensão no formato longo.
         """
         table_name = "contraceptivos"
-        output_file = Settings.PROCESSED_DIR / Settings.CONTRACEPTIVOS_FILENAME
+        output_file = self.output_dir / Settings.CONTRACEPTIVOS_FILENAME
         
         logger.info(f"Iniciando a criação da tabela de {table_name}.")
         
@@ -423,6 +431,7 @@ class TableSplitter:
             
             # Garante a unicidade do N_AIH para esta tabela de dimensão
             df = df.unique(subset=["N_AIH"], keep="first")
+            df = coluna_codificada(df, "CID_NOTIF")
             
             # Salva o DataFrame no formato Parquet
             df.write_parquet(output_file, compression="snappy")
@@ -465,11 +474,12 @@ class TableSplitter:
         logger.info(f"Iniciando divisão para a tabela '{table_name}'...")
         try:
             df = pl.read_parquet(self.input_parquet_path, columns=["N_AIH", "DIAG_SECUN"])
+            # CIDs já normalizados no Enum do CID-10: zeros viram '0' e inválidos viram nulo
             df = df.filter(
                 pl.col("DIAG_SECUN").is_not_null()
-                & (~pl.col("DIAG_SECUN").str.contains(r"^0+$"))
-                & (~pl.col("DIAG_SECUN").str.starts_with("0"))
+                & (pl.col("DIAG_SECUN") != "0")
             ).unique(subset=["N_AIH", "DIAG_SECUN"])
+            df = coluna_codificada(df, "DIAG_SECUN")
             df.write_parquet(output_file, compression="snappy")
             logger.info(f"Divisão para '{table_name}' concluída. {len(df):,} registros salvos.")
             del df
@@ -494,7 +504,7 @@ class TableSplitter:
 
         for nome, csv_nome in arquivos_apoio.items():
             csv_path = Settings.SUPPORT_FILES_DIR / csv_nome
-            parquet_path = self.output_dir / f"{nome}.parquet"
+            parquet_path = Settings.PROCESSED_DIR / f"{nome}.parquet"
 
             if not csv_path.exists():
                 logger.warning(f"Arquivo de apoio {csv_nome} não encontrado. Pulando a conversão.")
@@ -507,6 +517,8 @@ class TableSplitter:
             try:
                 # Usa Polars para ler CSV e escrever Parquet, mais rápido que Pandas
                 df = pl.read_csv(csv_path, infer_schema_length=10000, encoding="latin1")
+                if nome == "cid10":
+                    df = coluna_codificada(df, "CID")
                 df.write_parquet(parquet_path, compression="snappy")
                 logger.info(f"Conversão de {csv_nome} para {parquet_path.name} concluída com sucesso.")
             except Exception as e:
@@ -514,15 +526,16 @@ class TableSplitter:
                 logger.error(f"Erro ao converter {csv_nome}: {e}")
     
     
-    def run(self):
+    def run(self, converter_apoio: bool = True):
         """
         Executa todas as etapas de divisão e registra o tempo total de execução.
         """
-        logger.info("=== INICIANDO DIVISÃO DE ARQUIVOS PARA CARGA NO BANCO ===")
+        logger.info(f"=== INICIANDO DIVISÃO DE ARQUIVOS PARA CARGA NO BANCO (UF {self.uf}) ===")
         inicio = time.time() 
 
         try:
-            self.converter_csv_parquet()
+            if converter_apoio:
+                self.converter_csv_parquet()
             self.split_internacoes()
             self.split_uti_detalhes()
             self.split_condicoes_especificas()
@@ -559,13 +572,19 @@ class TableSplitter:
         finally:
             gc.collect()
 
+def dividir_uf(uf: str) -> None:
+    """Divide as tabelas de uma UF (executada em processo worker por executar_por_uf)"""
+    TableSplitter(uf=uf).run(converter_apoio=False)
+
+
 def main():
     """
     Função principal para executar o TableSplitter.
     """
     try:
-        splitter = TableSplitter()
-        splitter.run()
+        # As tabelas de apoio são compartilhadas: convertidas uma única vez, antes das UFs
+        TableSplitter().converter_csv_parquet()
+        executar_por_uf(dividir_uf, Settings.UF_DEFAULT)
     except Exception:
         logger.critical("A etapa de divisão falhou. Verifique os logs de erro acima.")
         raise
@@ -1,38 +1,83 @@
 """
-Script para unificar arquivos parquet individuais em um único arquivo
+Script para unificar arquivos parquet individuais em um dataset por UF
 Localização: projeto_sih/src/data/unify.py
-Função: TRANSFORM - Une múltiplos arquivos .parquet em 1 arquivo único
+Função: TRANSFORM - Une os arquivos .parquet de uma UF em INTERIM_DIR/unificado/uf=XX/ano=AAAA/mes=MM/
 """
 import polars as pl
+import pyarrow.parquet as pq
 import gc
+import os
 import time
 import sys
+import json
+import shutil
+import hashlib
 from pathlib import Path
-from typing import List, Optional
+from datetime import date, datetime
+from typing import Dict, List, Optional
 import logging
-from glob import glob
 
 SRC_DIR = Path(__file__).parent.parent
 sys.path.insert(0, str(SRC_DIR))
 from config.settings import Settings
+from data.catalog import CatalogoRaw, id_fonte
+from data.harmonize import HarmonizadorSchema
+from data.memoria import GovernadorMemoria
+from data.parallel import executar_por_uf
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# Colunas de linhagem acrescentadas a cada registro: arquivo DATASUS de origem
+# (ver catalog.id_fonte) e competência (1º dia do mês). Têm poucos valores distintos,
+# então o dictionary encoding do parquet as armazena quase de graça.
+SCHEMA_LINHAGEM = {
+    "ID_FONTE": pl.Int32,
+    "COMPETENCIA": pl.Date,
+}
+
+
+def arquivos_unificados(pasta: Path) -> List[Path]:
+    """Lista os arquivos de um dataset unificado (uf=XX/ano=AAAA/mes=MM/*.parquet)"""
+    return sorted(Path(pasta).glob("ano=*/mes=*/*.parquet"))
+
+
+def hash_arquivo(caminho: Path, bloco: int = 1024 * 1024) -> str:
+    """SHA-1 do conteúdo do arquivo, lido em blocos"""
+    h = hashlib.sha1()
+    with open(caminho, "rb") as f:
+        for parte in iter(lambda: f.read(bloco), b""):
+            h.update(parte)
+    return h.hexdigest()
+
+
 class SIHUnifier:
     """
-    Classe para unificar múltiplos arquivos parquet em um único arquivo
+    Classe para unificar os arquivos parquet de uma UF em um dataset particionado por ano/mês
     """
     
     def __init__(
         self,
         pasta_entrada: Optional[Path] = None,
-        arquivo_saida: Optional[Path] = None,
-        lote_size: int = 50
+        pasta_saida: Optional[Path] = None,
+        lote_size: int = 50,
+        uf: Optional[str] = None,
+        lote_bytes: Optional[int] = None,
+        catalogo: Optional[pl.DataFrame] = None
     ):
+        self.uf = (uf or Settings.UF_DEFAULT[0]).upper()
         self.pasta_entrada = pasta_entrada or Settings.RAW_DIR
-        self.arquivo_saida = arquivo_saida or Settings.INTERIM_DIR/ "sih_rs.parquet"
+        self.pasta_saida = pasta_saida or Settings.get_unificado_dir(self.uf)
+        self.arquivo_manifesto = self.pasta_saida / Settings.UNIFY_MANIFEST_FILENAME
         self.lote_size = lote_size
+        self.lote_bytes = lote_bytes or Settings.UNIFY_LOTE_BYTES
+        # Linhas do catálogo raw já atualizado pelo coordenador (senão, atualizado aqui)
+        self.catalogo_raw = catalogo
+        self.competencias = {}
+        self.fingerprints = {}
+        self.tamanhos = {}
+        self.linhas = {}
+        self.governador = None
         
         self.colunas_desejadas = [
             'ESPEC', 'N_AIH', 'IDENT', 'CEP', 'MUNIC_RES', 'NASC', 'SEXO', 'DT_INTER', 'DT_SAIDA',
@@ -44,108 +89,327 @@ class SIHUnifier:
             
          
         ]
+        self.harmonizador = HarmonizadorSchema(self.colunas_desejadas)
         
         Settings.criar_diretorios()
     
     def buscar_arquivos_parquet(self) -> List[Path]:
-        """Busca todos os arquivos .parquet na pasta de entrada"""
-        logger.info(f"Buscando arquivos parquet em: {self.pasta_entrada}")
-        
-        padroes = [
-            str(self.pasta_entrada / "**/*.parquet"),
-            str(self.pasta_entrada / "*.parquet")
-        ]
+        """Busca os arquivos .parquet da UF na pasta de entrada pelo catálogo raw"""
+        logger.info(f"Buscando arquivos parquet da UF {self.uf} em: {self.pasta_entrada}")
         
-        arquivos = []
-        for padrao in padroes:
-            arquivos.extend(glob(padrao, recursive=True))
+        if self.catalogo_raw is not None:
+            catalogo = self.catalogo_raw
+        else:
+            catalogo = CatalogoRaw(self.pasta_entrada).atualizar()
+            avisar_sem_competencia(catalogo)
         
-        arquivos_path = list(set(Path(arquivo) for arquivo in arquivos))
-        arquivos_path.sort()
+        self.catalogo = catalogo.filter(pl.col("uf") == self.uf)
+        ilegiveis = self.catalogo.filter(pl.col("ilegivel"))
+        if ilegiveis.height:
+            logger.warning(
+                f"{ilegiveis.height} arquivos com rodapé ilegível mantidos pela leitura anterior do catálogo: "
+                f"{', '.join(ilegiveis['caminho'].to_list())}"
+            )
+        self.competencias = {
+            self.pasta_entrada / linha["caminho"]: (linha["ano"], linha["mes"])
+            for linha in self.catalogo.iter_rows(named=True)
+        }
+        self.fingerprints = {
+            self.pasta_entrada / linha["caminho"]: linha["schema_hash"]
+            for linha in self.catalogo.iter_rows(named=True)
+        }
+        self.tamanhos = {
+            self.pasta_entrada / linha["caminho"]: linha["tamanho_bytes"]
+            for linha in self.catalogo.iter_rows(named=True)
+        }
+        self.linhas = {
+            self.pasta_entrada / linha["caminho"]: linha["linhas"] or 0
+            for linha in self.catalogo.iter_rows(named=True)
+        }
+        arquivos_path = sorted(self.competencias)
         
-        logger.info(f"Encontrados {len(arquivos_path)} arquivos parquet")
+        logger.info(
+            f"Encontrados {len(arquivos_path)} arquivos parquet "
+            f"({self.catalogo['linhas'].sum() or 0:,} registros segundo o catálogo)"
+        )
         return arquivos_path
     
-    def unificar_com_polars_relaxed(self) -> int:
-        """Unifica arquivos usando polars com vertical_relaxed"""
-        logger.info("Usando polars com vertical_relaxed")
+    # === MANIFESTO (UNIFICAÇÃO INCREMENTAL) ===
+
+    def carregar_manifesto(self) -> dict:
+        """Lê o manifesto da unificação (vazio se não existir ou estiver corrompido)"""
+        if not self.arquivo_manifesto.exists():
+            return {"schema": {}, "particoes": {}}
+        try:
+            with open(self.arquivo_manifesto, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (json.JSONDecodeError, OSError) as e:
+            logger.warning(f"Manifesto ilegível ({e}); a UF será unificada por completo")
+            return {"schema": {}, "particoes": {}}
+
+    def _salvar_manifesto(self, particoes: dict):
+        """Grava o manifesto (schema, partições, part files e totais) de forma atômica"""
+        manifesto = {
+            "schema": self.schema_serializado(),
+            "particoes": particoes,
+            "linhas": sum(p["linhas"] for p in particoes.values()),
+            "partes": sum(len(p.get("partes", [])) for p in particoes.values()),
+        }
+        self.arquivo_manifesto.parent.mkdir(parents=True, exist_ok=True)
+        temp = self.arquivo_manifesto.with_suffix(".json.tmp")
+        with open(temp, "w", encoding="utf-8") as f:
+            json.dump(manifesto, f, indent=2, sort_keys=True)
+        os.replace(temp, self.arquivo_manifesto)
+
+    def assinatura_fontes(self, arquivos: List[Path], anteriores: dict) -> Dict[str, dict]:
+        """
+        Tamanho, mtime e hash de conteúdo de cada arquivo fonte de uma partição.
+        O hash só é recalculado quando tamanho ou mtime diferem do manifesto.
+        """
+        assinaturas = {}
+        for arquivo in arquivos:
+            chave = arquivo.relative_to(self.pasta_entrada).as_posix()
+            stat = arquivo.stat()
+            anterior = anteriores.get(chave)
+            if anterior and anterior["tamanho"] == stat.st_size and anterior["mtime"] == stat.st_mtime:
+                sha1 = anterior["sha1"]
+            else:
+                sha1 = hash_arquivo(arquivo)
+            assinaturas[chave] = {"tamanho": stat.st_size, "mtime": stat.st_mtime, "sha1": sha1}
+        return assinaturas
+
+    # === ESCRITA DAS PARTIÇÕES ===
+
+    def schema_serializado(self) -> Dict[str, str]:
+        """Schema do dataset unificado: colunas canônicas + linhagem"""
+        schema = self.harmonizador.schema_serializado()
+        schema.update({col: str(tipo) for col, tipo in SCHEMA_LINHAGEM.items()})
+        return schema
+
+    def plano_arquivo(self, arquivo: Path) -> pl.LazyFrame:
+        """Projeção de um arquivo raw no schema canônico (plano cacheado pelo fingerprint) + linhagem"""
+        ano, mes = self.competencias[arquivo]
+        return self.harmonizador.projetar(arquivo, self.fingerprints.get(arquivo)).with_columns(
+            pl.lit(id_fonte(self.uf, ano, mes), dtype=SCHEMA_LINHAGEM["ID_FONTE"]).alias("ID_FONTE"),
+            pl.lit(date(ano, mes, 1), dtype=SCHEMA_LINHAGEM["COMPETENCIA"]).alias("COMPETENCIA"),
+        )
+
+    def pasta_particao(self, ano: int, mes: int) -> Path:
+        return self.pasta_saida / f"ano={ano}" / f"mes={mes:02d}"
+
+    def agrupar_lotes(self, arquivos: List[Path]) -> List[List[Path]]:
+        """
+        Divide os arquivos em lotes de `lote_size` arquivos ou, com `lote_bytes`,
+        em lotes cujo tamanho raw somado não passa do orçamento (mínimo de um arquivo).
+        Os lotes são formados dentro de uma competência (cada partição ano=/mes= tem os
+        seus part files): com um arquivo raw por competência, como no layout nativo,
+        cada partição é um lote único.
+        """
+        if not self.lote_bytes:
+            tamanho = max(1, self.lote_size)
+            return [arquivos[i:i + tamanho] for i in range(0, len(arquivos), tamanho)]
+
+        lotes, atual, bytes_atual = [], [], 0
+        for arquivo in arquivos:
+            tamanho = self.tamanhos.get(arquivo) or arquivo.stat().st_size
+            if atual and bytes_atual + tamanho > self.lote_bytes:
+                lotes.append(atual)
+                atual, bytes_atual = [], 0
+            atual.append(arquivo)
+            bytes_atual += tamanho
+        if atual:
+            lotes.append(atual)
+        return lotes
+
+    def criar_governador(self, arquivos: List[Path]):
+        """
+        Governador de memória do tamanho do lote: em arquivos (lote_size) ou, com
+        lote_bytes, em bytes raw. O custo por arquivo vem das linhas do catálogo.
+        """
+        if self.lote_bytes:
+            self.governador = GovernadorMemoria(
+                f"unificacao_{self.uf}", self.lote_bytes, minimo=1, maximo=self.lote_bytes * 4
+            )
+            return
+        linhas_por_arquivo = sum(self.linhas.get(a, 0) for a in arquivos) / max(len(arquivos), 1)
+        self.governador = GovernadorMemoria(
+            f"unificacao_{self.uf}", self.lote_size, minimo=1, maximo=self.lote_size * 4,
+            bytes_por_unidade=linhas_por_arquivo * Settings.BYTES_POR_REGISTRO or None
+        )
+        self.lote_size = self.governador.tamanho
+
+    def ajustar_lote(self):
+        """Aplica a decisão do governador ao tamanho do próximo lote"""
+        if self.governador is None:
+            return
+        if self.lote_bytes:
+            self.lote_bytes = self.governador.ajustar()
+        else:
+            self.lote_size = self.governador.ajustar()
+
+    def gravar_particao(self, ano: int, mes: int, arquivos: List[Path]) -> List[dict]:
+        """
+        Une os arquivos de uma competência e substitui a partição correspondente.
+        Cada lote vira um part file próprio, de modo que a memória de pico depende
+        do tamanho do lote e não do número de arquivos. Retorna a lista de partes.
+        """
+        # Grava fora do glob ano=*/mes=* e só então troca a partição antiga
+        destino = self.pasta_particao(ano, mes)
+        temp = self.pasta_saida / "_staging" / destino.relative_to(self.pasta_saida)
+        if temp.exists():
+            shutil.rmtree(temp)
+        temp.mkdir(parents=True)
+
+        partes = []
+        restantes = list(arquivos)
+        n = 0
+        while restantes:
+            # O lote é formado com o tamanho corrente (ajustado pelo governador após cada parte)
+            lote = self.agrupar_lotes(restantes)[0]
+            restantes = restantes[len(lote):]
+            # Todos os planos já produzem o schema canônico: concat estrito, sem resolução de supertipos
+            df_lote = pl.concat([self.plano_arquivo(a) for a in lote], how="vertical")
+
+            arquivo_parte = temp / f"part-{n:05d}.parquet"
+            df_lote.sink_parquet(
+                arquivo_parte,
+                compression="snappy",
+                row_group_size=Settings.PARQUET_ROW_GROUP_SIZE,
+                maintain_order=False
+            )
+
+            metadados = pq.read_metadata(arquivo_parte)
+            partes.append({
+                "arquivo": arquivo_parte.name,
+                "linhas": metadados.num_rows,
+                "row_groups": metadados.num_row_groups,
+                "bytes": arquivo_parte.stat().st_size,
+                "fontes": [a.relative_to(self.pasta_entrada).as_posix() for a in lote],
+            })
+            del df_lote
+            gc.collect()
+            n += 1
+            self.ajustar_lote()
+
+        if destino.exists():
+            shutil.rmtree(destino)
+        destino.parent.mkdir(parents=True, exist_ok=True)
+        temp.rename(destino)
+
+        return partes
+
+    def remover_particoes_orfas(self, chaves_validas: set):
+        """Remove partições gravadas cujas competências não têm mais arquivos raw"""
+        for pasta in sorted(self.pasta_saida.glob("ano=*/mes=*")):
+            chave = f"{pasta.parent.name.split('=')[1]}-{pasta.name.split('=')[1]}"
+            if chave not in chaves_validas:
+                shutil.rmtree(pasta)
+                logger.info(f"Partição {chave} removida (sem arquivos raw correspondentes)")
+
+    def unificar_com_polars_relaxed(self, incremental: bool = True) -> int:
+        """
+        Unifica os arquivos da UF em partições ano=/mes=. No modo incremental só são
+        regravadas as competências novas ou cujos arquivos raw mudaram de conteúdo.
+        """
+        logger.info("Usando polars com schema canônico harmonizado")
         
         arquivos = self.buscar_arquivos_parquet()
         
         if not arquivos:
             raise FileNotFoundError("Nenhum arquivo parquet encontrado!")
-        
-        logger.info(f"Processando {len(arquivos)} arquivos...")
-        
-        lazy_frames = []
 
-        arquivos_processados = 0
-
-        arquivos_com_erro = 0
-        
-        for i, arquivo in enumerate(arquivos):
-            
-            try:
-                df_lazy = pl.scan_parquet(arquivo)
-                schema = df_lazy.collect_schema()
+        manifesto = self.carregar_manifesto()
+        if manifesto.get("schema") != self.schema_serializado():
+            # Mudança nas colunas desejadas ou nos tipos canônicos invalida todas as partições
+            incremental = False
+        particoes_anteriores = manifesto.get("particoes", {}) if incremental else {}
 
-                colunas_presentes = list(schema.keys())
-                colunas_faltando = [col for col in self.colunas_desejadas if col not in colunas_presentes]
+        fontes = {}
+        for arquivo in arquivos:
+            ano, mes = self.competencias[arquivo]
+            fontes.setdefault(f"{ano}-{mes:02d}", []).append(arquivo)
 
-                for col in colunas_faltando:
-                    df_lazy = df_lazy.with_columns(pl.lit(None).alias(col))
+        particoes = {}
+        pendentes = []
+        for chave, arquivos_particao in sorted(fontes.items()):
+            anterior = particoes_anteriores.get(chave, {})
+            assinaturas = self.assinatura_fontes(arquivos_particao, anterior.get("fontes", {}))
+            # Só o conteúdo importa: um arquivo raw apenas "tocado" não regrava a partição
+            hashes_anteriores = {k: v["sha1"] for k, v in anterior.get("fontes", {}).items()}
+            hashes_atuais = {k: v["sha1"] for k, v in assinaturas.items()}
+            if hashes_anteriores == hashes_atuais and self.pasta_particao(*map(int, chave.split("-"))).exists():
+                particoes[chave] = dict(anterior, fontes=assinaturas)
+            else:
+                pendentes.append((chave, arquivos_particao, assinaturas))
 
-                df_lazy = df_lazy.select(self.colunas_desejadas)
-                lazy_frames.append(df_lazy)
-                arquivos_processados += 1
+        logger.info(
+            f"Partições: {len(fontes)} competências, {len(pendentes)} a (re)gravar, "
+            f"{len(fontes) - len(pendentes)} inalteradas"
+        )
 
+        # Os lotes só dividem partições com mais de um arquivo raw; sem elas, o governador não tem o que ajustar
+        if any(len(arquivos_particao) > 1 for _, arquivos_particao, _ in pendentes):
+            self.criar_governador(arquivos)
+        particoes_com_erro = 0
+        for i, (chave, arquivos_particao, assinaturas) in enumerate(pendentes, 1):
+            ano, mes = (int(v) for v in chave.split("-"))
+            try:
+                partes = self.gravar_particao(ano, mes, arquivos_particao)
             except Exception as e:
-                arquivos_com_erro += 1
+                # Fica fora do manifesto: será tentada de novo na próxima execução
+                particoes_com_erro += 1
+                logger.error(f"Erro na partição {chave}: {e}")
                 continue
-        
+            finally:
+                self.harmonizador.salvar_cache()
 
-        
-        logger.info(f"Resumo: {arquivos_processados}/{len(arquivos)} arquivos processados")
-        if arquivos_com_erro > 0:
-            logger.warning(f"Arquivos com erro: {arquivos_com_erro}")
-        
-        if not lazy_frames:
-            raise RuntimeError("Nenhum arquivo foi processado com sucesso!")
-        
-        logger.info(f"Concatenando {len(lazy_frames)} DataFrames com vertical_relaxed...")
-        df_unificado = pl.concat(lazy_frames, how="vertical_relaxed")
-        
-        self.arquivo_saida.parent.mkdir(parents=True, exist_ok=True)
-        
-        logger.info("Salvando arquivo unificado...")
-        df_unificado.sink_parquet(
-            self.arquivo_saida,
-            compression="snappy",
-            maintain_order=False
-        )
-        
-        registros_totais = pl.scan_parquet(self.arquivo_saida).select(pl.len()).collect().item()
-        
-        return registros_totais
+            linhas = sum(p["linhas"] for p in partes)
+            particoes[chave] = {
+                "fontes": assinaturas,
+                "partes": partes,
+                "linhas": linhas,
+                "unificado_em": datetime.now().isoformat(timespec="seconds"),
+            }
+            self._salvar_manifesto(particoes)
+            logger.info(
+                f"Partição {chave} gravada ({i}/{len(pendentes)}): {linhas:,} registros "
+                f"em {len(partes)} parte(s)"
+            )
+
+        self.remover_particoes_orfas(set(fontes))
+
+        self._salvar_manifesto(particoes)
+        staging = self.pasta_saida / "_staging"
+        if staging.exists():
+            shutil.rmtree(staging)
+
+        if particoes_com_erro > 0:
+            logger.warning(f"Partições com erro: {particoes_com_erro}")
+        if not particoes:
+            raise RuntimeError("Nenhuma partição foi gravada com sucesso!")
+
+        return sum(p["linhas"] for p in particoes.values())
     
-    def unificar(self, usar_lazy: bool = True) -> int:
-        """Método principal para unificar arquivos"""
+    def unificar(self, usar_lazy: bool = True, incremental: bool = True) -> int:
+        """Método principal para unificar arquivos (incremental=False regrava todas as partições)"""
         logger.info("=== UNIFICAÇÃO DE ARQUIVOS SIH/SUS ===")
+        logger.info(f"UF: {self.uf}")
         logger.info(f"Pasta entrada: {self.pasta_entrada}")
-        logger.info(f"Arquivo saída: {self.arquivo_saida}")
+        logger.info(f"Pasta saída: {self.pasta_saida}")
+        logger.info(f"Modo: {'incremental' if incremental else 'completo'}")
         
         inicio = time.time()
         
         try:
-            registros_totais = self.unificar_com_polars_relaxed()
+            registros_totais = self.unificar_com_polars_relaxed(incremental=incremental)
             
             tempo_total = time.time() - inicio
-            tamanho_mb = self.arquivo_saida.stat().st_size / (1024 * 1024)
+            tamanho_mb = sum(f.stat().st_size for f in arquivos_unificados(self.pasta_saida)) / (1024 * 1024)
             
             logger.info("="*50)
-            logger.info("UNIFICAÇÃO CONCLUÍDA!")
+            logger.info(f"UNIFICAÇÃO CONCLUÍDA! (UF {self.uf})")
             logger.info("="*50)
-            logger.info(f"Arquivo criado: {self.arquivo_saida.name}")
+            logger.info(f"Dataset criado: {self.pasta_saida}")
             logger.info(f"Total de registros: {registros_totais:,}")
             logger.info(f"Tamanho: {tamanho_mb:.1f} MB")
             logger.info(f"Tempo: {tempo_total:.1f}s ({tempo_total/60:.1f} min)")
@@ -156,21 +420,36 @@ class SIHUnifier:
             logger.error(f"Erro durante unificação: {e}")
             raise
         finally:
+            if self.governador is not None:
+                self.governador.exportar_metricas()
             gc.collect()
 
 
+def avisar_sem_competencia(catalogo: pl.DataFrame):
+    sem_competencia = catalogo.filter(pl.col("uf").is_null())
+    if sem_competencia.height:
+        logger.warning(f"{sem_competencia.height} arquivos sem UF/competência identificável serão ignorados")
+
+
+def unificar_uf(uf: str, catalogo: Optional[pl.DataFrame] = None) -> int:
+    """Unifica uma UF (executada em processo worker por executar_por_uf)"""
+    unifier = SIHUnifier(pasta_entrada=Settings.RAW_DIR, uf=uf, lote_size=50, catalogo=catalogo)
+    return unifier.unificar(usar_lazy=True)
+
+
 def main():
     """Função principal para execução standalone"""
     try:
-        unifier = SIHUnifier(
-            pasta_entrada=Settings.RAW_DIR,
-            arquivo_saida=Settings.INTERIM_DIR / "sih_rs.parquet",
-            lote_size=50
-        )
-        
-        registros = unifier.unificar(usar_lazy=True)
+        # O catálogo raw é atualizado uma única vez, aqui: cada worker recebe só as linhas da sua UF
+        # (vários processos relendo os rodapés e regravando o mesmo catálogo concorreriam pelo arquivo)
+        catalogo = CatalogoRaw(Settings.RAW_DIR).atualizar()
+        avisar_sem_competencia(catalogo)
+        ufs = [uf.upper() for uf in Settings.UF_DEFAULT]
+        argumentos = {uf: (catalogo.filter(pl.col("uf") == uf),) for uf in ufs}
+        resultados = executar_por_uf(unificar_uf, ufs, argumentos=argumentos)
+        registros = sum(resultados.values())
         
-        logger.info(f"\nSUCESSO! {registros:,} registros unificados com POLARS!")
+        logger.info(f"\nSUCESSO! {registros:,} registros unificados com POLARS ({len(resultados)} UFs)!")
         
     except Exception as e:
         logger.error(f"\nERRO: {e}")
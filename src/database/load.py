@@ -15,6 +15,8 @@ sys.path.insert(0, str(SRC_DIR))
 
 from config.settings import Settings
 from database.schema import TABLE_SCHEMAS
+from data.cid import SQL_FUNCOES_CID
+from data.memoria import GovernadorMemoria
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(message)s")
 logger = logging.getLogger(__name__)
@@ -90,6 +92,33 @@ class PostgreSQLLoader:
                     self.conn.rollback()
                     logger.error(f"Erro ao criar UNIQUE {uq_name}: {e}")
 
+    def criar_indices(self):
+        logger.info("\n--- Criando índices a partir do schema ---")
+        for table_name, info in TABLE_SCHEMAS.items():
+            for col_group in info.get("indices", []):
+                cols = col_group if isinstance(col_group, list) else [col_group]
+                idx_name = f"idx_{table_name}_{'_'.join(cols)}".lower()
+                try:
+                    cols_str = ", ".join([f'"{c}"' for c in cols])
+                    self.cursor.execute(
+                        f'CREATE INDEX IF NOT EXISTS {idx_name} ON "{table_name}" ({cols_str});'
+                    )
+                    self.conn.commit()
+                    logger.info(f"Índice criado: {idx_name}")
+                except Exception as e:
+                    self.conn.rollback()
+                    logger.error(f"Erro ao criar índice {idx_name}: {e}")
+
+    def criar_funcoes_cid(self):
+        """cid_codificar/cid_decodificar (data/cid.py) para consultas por faixa de CID em SQL"""
+        try:
+            self.cursor.execute(SQL_FUNCOES_CID)
+            self.conn.commit()
+            logger.info("Funções de CID criadas: cid_codificar, cid_decodificar")
+        except Exception as e:
+            self.conn.rollback()
+            logger.error(f"Erro ao criar funções de CID: {e}")
+
     def run(self):
         logger.info("=== INICIANDO CARGA NO POSTGRESQL ===")
         
@@ -98,6 +127,8 @@ class PostgreSQLLoader:
             self.process_table(table)
         self.criar_uniques()
         self.criar_constraints()
+        self.criar_indices()
+        self.criar_funcoes_cid()
         #self.conn.close()
         logger.info("=== CARGA CONCLUÍDA COM SUCESSO ===")
 
@@ -184,42 +215,94 @@ class PostgreSQLLoader:
                 self.conn.rollback()
                 logger.error(f"Erro ao criar tabela {nome}: {e}")
 
-    def process_table(self, table_name):
-        
+    def arquivos_tabela(self, table_name):
+        """Arquivo de apoio na raiz ou um arquivo por UF (processed/uf=XX/<tabela>.parquet)"""
         file_path = self.processed_dir / f"{table_name}.parquet"
+        if file_path.exists():
+            return [file_path]
+        return sorted(self.processed_dir.glob(f"uf=*/{table_name}.parquet"))
 
-        if not file_path.exists():
-            logger.warning(f"Arquivo {file_path} não encontrado. Pulando '{table_name}'.")
-            return
+    def process_table(self, table_name):
+        """
+        Carrega um arquivo por vez (um por UF): só o arquivo corrente fica em memória.
+        Ex.: um mesmo CNES pode aparecer em mais de uma UF; a PK não pode se repetir. Com mais
+        de um arquivo, cada um passa pela tabela temporária e a repetição é descartada pelo banco
+        (carregar_sem_duplicatas), mantendo a primeira ocorrência na ordem dos arquivos
+        """
+        arquivos = self.arquivos_tabela(table_name)
 
-        df = pl.read_parquet(file_path)
-        if df.is_empty():
-            logger.info(f"{table_name}: arquivo vazio. Pulando carga.")
+        if not arquivos:
+            logger.warning(f"Nenhum arquivo de '{table_name}' encontrado em {self.processed_dir}. Pulando.")
             return
 
+        schema = TABLE_SCHEMAS.get(table_name, {})
+        pk_cols = schema.get("primary_key", [])
+        colunas_db = self.get_colunas_db(table_name)
+
         # A criação da tabela já foi feita no início do 'run'
         self.truncar_tabela(table_name)
 
-        schema = TABLE_SCHEMAS.get(table_name, {})
-        logger.info(f"{table_name}: Iniciando carga de {len(df):,} linhas...")
+        for arquivo in arquivos:
+            df = pl.read_parquet(arquivo)
+            if df.is_empty():
+                logger.info(f"{table_name}: arquivo vazio ({arquivo.relative_to(self.processed_dir)}). Pulando carga.")
+                continue
 
-        colunas_db = self.get_colunas_db(table_name)
-        
-        # Filtra colunas do DataFrame para corresponder às colunas do DB
-        # Ignora colunas que são auto-incrementadas (como id_atendimento)
-        colunas_df_para_carregar = [c for c in df.columns if c in colunas_db]
+            logger.info(f"{table_name}: Iniciando carga de {len(df):,} linhas ({arquivo.relative_to(self.processed_dir)})...")
 
-        faltando = [c for c in colunas_df_para_carregar if c not in df.columns]
-        if faltando:
-            raise ValueError(f"Tabela {table_name}: colunas ausentes no arquivo: {faltando}")
-        
-        extras = [c for c in df.columns if c not in colunas_df_para_carregar]
-        if extras:
-            logger.info(f"{table_name}: colunas extras no arquivo (serão ignoradas): {extras}")
+            # Filtra colunas do DataFrame para corresponder às colunas do DB
+            # Ignora colunas que são auto-incrementadas (como id_atendimento)
+            colunas_df_para_carregar = [c for c in df.columns if c in colunas_db]
+
+            faltando = [c for c in colunas_df_para_carregar if c not in df.columns]
+            if faltando:
+                raise ValueError(f"Tabela {table_name}: colunas ausentes no arquivo: {faltando}")
+
+            extras = [c for c in df.columns if c not in colunas_df_para_carregar]
+            if extras:
+                logger.info(f"{table_name}: colunas extras no arquivo (serão ignoradas): {extras}")
+
+            df = self.converter_tipos(df, schema)
+
+            if len(arquivos) > 1 and pk_cols and all(c in colunas_df_para_carregar for c in pk_cols):
+                self.carregar_sem_duplicatas(df, table_name, colunas_df_para_carregar, pk_cols)
+            else:
+                self.carregar_em_chunks(df, table_name, colunas_df_para_carregar)
+            del df
 
-        df = self.converter_tipos(df, schema)
+    def carregar_sem_duplicatas(self, df, table_name, colunas_df, pk_cols):
+        """
+        COPY para uma tabela temporária e INSERT ... ON CONFLICT DO NOTHING na tabela final:
+        as linhas cuja PK já foi carregada (por um arquivo anterior ou no próprio arquivo) são descartadas
+        """
+        staging = f"_carga_{table_name}"
+        cols_str = ", ".join([f'"{c}"' for c in colunas_df])
+        pk_str = ", ".join([f'"{c}"' for c in pk_cols])
+        try:
+            self.cursor.execute(f'DROP TABLE IF EXISTS "{staging}";')
+            self.cursor.execute(f'CREATE TEMP TABLE "{staging}" AS SELECT {cols_str} FROM "{table_name}" WITH NO DATA;')
+            self.conn.commit()
+        except Exception as e:
+            self.conn.rollback()
+            logger.error(f"Erro ao criar tabela temporária de {table_name}: {e}")
+            raise
 
-        self.carregar_em_chunks(df, table_name, colunas_df_para_carregar)
+        self.carregar_em_chunks(df, staging, colunas_df, etapa=table_name)
+
+        try:
+            self.cursor.execute(
+                f'INSERT INTO "{table_name}" ({cols_str}) SELECT {cols_str} FROM "{staging}" '
+                f"ON CONFLICT ({pk_str}) DO NOTHING;"
+            )
+            inseridas = self.cursor.rowcount
+            self.cursor.execute(f'DROP TABLE "{staging}";')
+            self.conn.commit()
+        except Exception as e:
+            self.conn.rollback()
+            logger.error(f"Erro ao inserir {table_name} a partir da tabela temporária: {e}")
+            raise
+        if inseridas < len(df):
+            logger.info(f"{table_name}: {len(df) - inseridas:,} linhas com PK repetida descartadas.")
 
     def truncar_tabela(self, table_name):
         try:
@@ -249,13 +332,23 @@ class PostgreSQLLoader:
                 logger.warning(f"Falha ao converter coluna '{col}' para {tipo}: {e}")
         return df
 
-    def carregar_em_chunks(self, df, table_name, colunas_df):
+    def carregar_em_chunks(self, df, table_name, colunas_df, etapa=None):
         if not colunas_df:
             logger.warning(f"Tabela {table_name}: Nenhuma coluna para carregar. Pulando.")
             return
             
-        for i in range(0, len(df), self.chunk_size):
-            chunk = df.slice(i, self.chunk_size).select(colunas_df)
+        # Chunk inicial = self.chunk_size; o governador ajusta entre os COPYs conforme a memória.
+        # O CSV do chunk em memória custa ~3x o chunk no DataFrame (texto + bytes + buffer)
+        bytes_por_linha = 3 * df.estimated_size() / max(len(df), 1)
+        governador = GovernadorMemoria(
+            f"carga_{etapa or table_name}", self.chunk_size, minimo=1_000, maximo=self.chunk_size * 20,
+            bytes_por_unidade=bytes_por_linha
+        )
+        i, n = 0, 0
+        while i < len(df):
+            tamanho = governador.tamanho
+            n += 1
+            chunk = df.slice(i, tamanho).select(colunas_df)
             buffer = io.BytesIO()
             csv_str = chunk.write_csv(None, include_header=False)
             buffer.write(csv_str.encode("utf-8"))
@@ -264,11 +357,15 @@ class PostgreSQLLoader:
             try:
                 self.cursor.copy_from(buffer, table_name, sep=",", null="", columns=colunas_df)
                 self.conn.commit()
-                logger.info(f"{table_name}: Chunk {i // self.chunk_size + 1} carregado.")
+                logger.info(f"{table_name}: Chunk {n} carregado ({tamanho:,} linhas).")
             except Exception as e:
                 self.conn.rollback()
-                logger.error(f"Erro ao carregar chunk {i // self.chunk_size + 1} de {table_name}: {e}")
+                logger.error(f"Erro ao carregar chunk {n} de {table_name}: {e}")
                 raise
+            del chunk, csv_str, buffer
+            i += tamanho
+            governador.ajustar()
+        governador.exportar_metricas()
 
     def constraint_existe(self, nome):
         self.cursor.execute("""
@@ -21,6 +21,7 @@ TABLE_SCHEMAS: Dict[str, Dict[str, any]] = {
             "COMPLEX": pl.Int8,
             "MUNIC_MOV": pl.Int32,
             "DIAG_PRINC": pl.String,
+            "DIAG_PRINC_COD": pl.Int32,
             "NASC": pl.Date,
             "SEXO": pl.Int8,
             "IDADE": pl.Int16,
@@ -29,6 +30,8 @@ TABLE_SCHEMAS: Dict[str, Dict[str, any]] = {
             "RACA_COR": pl.Int8,
             "MUNIC_RES": pl.Int32,
             "CEP": pl.Int64,
+            "ID_FONTE": pl.Int32,       # Linhagem: arquivo DATASUS de origem (UF IBGE + AAAAMM)
+            "COMPETENCIA": pl.Date,
         },
         "primary_key": ["N_AIH"],
         "foreign_keys": [
@@ -36,7 +39,8 @@ TABLE_SCHEMAS: Dict[str, Dict[str, any]] = {
             {"column": "MUNIC_RES", "references_table": "municipios", "references_column": "codigo_6d"},
             {"column": "MUNIC_MOV", "references_table": "municipios", "references_column": "codigo_6d"},
             {"column": "DIAG_PRINC", "references_table": "cid10", "references_column": "CID"},
-        ]
+        ],
+        "indices": [["DIAG_PRINC_COD"]]
     },
     "atendimentos": {
         "table_name": "atendimentos",
@@ -44,6 +48,8 @@ TABLE_SCHEMAS: Dict[str, Dict[str, any]] = {
             "id_atendimento": pl.UInt64, 
             "N_AIH": pl.Int64,
             "PROC_REA": pl.Int64,
+            "ID_FONTE": pl.Int32,
+            "COMPETENCIA": pl.Date,
         },
         "primary_key": ["id_atendimento"],
         "foreign_keys": [
@@ -84,13 +90,15 @@ TABLE_SCHEMAS: Dict[str, Dict[str, any]] = {
         "columns": {
             "N_AIH": pl.Int64,
             "DIAG_SECUN": pl.String,
+            "DIAG_SECUN_COD": pl.Int32,
         },
         "primary_key": ["N_AIH"],
         "foreign_keys": [
             {"column": "N_AIH", "references_table": "internacoes", "references_column": "N_AIH"},
             {"column": "DIAG_SECUN", "references_table": "cid10", "references_column": "CID"}
 
-        ]
+        ],
+        "indices": [["DIAG_SECUN_COD"]]
     },
     "municipios": {
         "table_name": "municipios",
@@ -166,24 +174,28 @@ TABLE_SCHEMAS: Dict[str, Dict[str, any]] = {
         "table_name": "cid10",
         "columns": {
             "CID": pl.String,
-            "CD_DESCRICAO": pl.String
+            "CD_DESCRICAO": pl.String,
+            "CID_COD": pl.Int32     # Código inteiro do CID (data/cid.py)
         },
         "primary_key": ["CID"],
-        "foreign_keys": []
+        "foreign_keys": [],
+        "indices": [["CID_COD"]]
     },
 
     "mortes": {
             "table_name": "mortes",
             "columns": {
                 "N_AIH": pl.Int64,      # PK e FK para internacoes
-                "CID_MORTE": pl.String   # Código CID da causa da morte
+                "CID_MORTE": pl.String,  # Código CID da causa da morte
+                "CID_MORTE_COD": pl.Int32
             },
             "primary_key": ["N_AIH"],
             "foreign_keys": [
                 {"column": "N_AIH", "references_table": "internacoes", "references_column": "N_AIH"},
                 {"column": "CID_MORTE", "references_table": "cid10", "references_column": "CID"}
 
-            ]
+            ],
+            "indices": [["CID_MORTE_COD"]]
          },
     "infehosp": {
             "table_name": "infehosp",
@@ -256,12 +268,14 @@ TABLE_SCHEMAS: Dict[str, Dict[str, any]] = {
     "columns": {
         "N_AIH": pl.Int64,
         "CID_NOTIF": pl.String,
+        "CID_NOTIF_COD": pl.Int32,
     },
     "primary_key": ["N_AIH"],
     "foreign_keys": [
         {"column": "N_AIH", "references_table": "internacoes", "references_column": "N_AIH"},
         {"column": "CID_NOTIF", "references_table": "cid10", "references_column": "CID"}
-    ]
+    ],
+    "indices": [["CID_NOTIF_COD"]]
 },
 
 "pernoite": {
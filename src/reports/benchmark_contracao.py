@@ -0,0 +1,161 @@
+"""
+Benchmark da contração por N_AIH
+Localização: projeto_sih/src/reports/benchmark_contracao.py
+Função: Gera um dataset tratado sintético ordenado por N_AIH (com o metadado de ordenação)
+e uma cópia embaralhada, e compara tempo e pico de memória da contração em memória e por partições (hash de N_AIH)
+com a contração sequencial sobre a entrada ordenada. Os modos "+conflitos" medem o custo
+da máscara CONFLITOS na entrada não ordenada (CONTRACT_CONFLITOS_SEM_ORDEM), que exige
+ordená-la. Cada modo roda em um processo próprio, para que o pico de RSS seja só dele;
+os resultados são conferidos por totais.
+
+Uso: python src/reports/benchmark_contracao.py [--linhas 23800000] [--buckets 16] [--dir /tmp/bench_contracao]
+"""
+import sys
+import time
+import argparse
+import logging
+import resource
+import multiprocessing
+from pathlib import Path
+
+import numpy as np
+import polars as pl
+import pyarrow.parquet as pq
+
+SRC_DIR = Path(__file__).parent.parent
+sys.path.insert(0, str(SRC_DIR))
+from config.settings import Settings
+from data.aggregate import SIHContractor
+from data.chunks import metadados_ordenacao
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Média de linhas por AIH (AIHs que aparecem em mais de uma competência)
+LINHAS_POR_AIH = 1.2
+LINHAS_POR_BLOCO = 1_000_000
+
+
+def bloco_tratado(inicio_aih: int, linhas: int, rng: np.random.Generator) -> pl.DataFrame:
+    """Bloco com as colunas relevantes do dataset tratado, ordenado por N_AIH"""
+    n_aih = np.sort(inicio_aih + rng.integers(0, int(linhas / LINHAS_POR_AIH), linhas))
+    dt_inter = np.datetime64("2008-01-01") + rng.integers(0, 5000, linhas).astype("timedelta64[D]")
+    return pl.DataFrame({
+        "N_AIH": n_aih.astype(np.int64),
+        "CNES": rng.integers(2_000_000, 2_300_000, linhas),
+        "MUNIC_RES": rng.integers(430_000, 432_400, linhas).astype(np.int32),
+        "DIAG_PRINC": rng.choice(["I219", "J189", "O800", "A09"], linhas),
+        "PROC_REA": rng.integers(301_010_000, 417_000_000, linhas),
+        "NASC": dt_inter - rng.integers(0, 30_000, linhas).astype("timedelta64[D]"),
+        "DT_INTER": dt_inter,
+        "DT_SAIDA": dt_inter + rng.integers(0, 30, linhas).astype("timedelta64[D]"),
+        "VAL_SH": np.round(rng.random(linhas) * 5000, 2),
+        "VAL_SP": np.round(rng.random(linhas) * 1000, 2),
+        "VAL_UTI": np.round(rng.random(linhas) * 200, 2),
+        "UTI_MES_TO": rng.integers(0, 30, linhas).astype(np.int16),
+        "UTI_INT_TO": rng.integers(0, 30, linhas).astype(np.int16),
+        "DIAR_ACOM": rng.integers(0, 10, linhas).astype(np.int16),
+        "COMPETENCIA": rng.integers(200801, 202312, linhas).astype(np.int32),
+        "VAL_TOT": np.zeros(linhas),
+        "IDADE": np.zeros(linhas, dtype=np.int16),
+        "DIAS_PERM": np.zeros(linhas, dtype=np.int16),
+    })
+
+
+def gerar_entrada(arquivo: Path, linhas: int, ordenada: bool = True, semente: int = 42):
+    """
+    Grava o dataset sintético em blocos (memória de um bloco). Ordenada, declara a ordenação
+    por N_AIH; senão, as AIHs de cada bloco saem embaralhadas, sem o metadado
+    """
+    rng = np.random.default_rng(semente)
+    escritor = None
+    gravadas, inicio_aih = 0, 4_300_000_000_000
+    try:
+        while gravadas < linhas:
+            n = min(LINHAS_POR_BLOCO, linhas - gravadas)
+            bloco = bloco_tratado(inicio_aih, n, rng)
+            if not ordenada:
+                # AIHs em ordem aleatória, mantendo a ordem das linhas de cada AIH (o first() não muda)
+                bloco = bloco.sort(pl.col("N_AIH").hash(semente), maintain_order=True)
+            tabela = bloco.to_arrow()
+            if escritor is None:
+                esquema = tabela.schema.with_metadata(metadados_ordenacao("N_AIH")) if ordenada else tabela.schema
+                escritor = pq.ParquetWriter(arquivo, esquema, compression="snappy")
+            escritor.write_table(tabela.cast(escritor.schema), row_group_size=Settings.PARQUET_ROW_GROUP_SIZE)
+            gravadas += n
+            inicio_aih += int(n / LINHAS_POR_AIH) + 1
+    finally:
+        if escritor is not None:
+            escritor.close()
+
+
+def executar_modo(entrada: Path, saida: Path, modo: str, buckets: int) -> dict:
+    """Roda uma contração (processo worker) e devolve tempo e pico de RSS"""
+    logging.getLogger("data.aggregate").setLevel(logging.WARNING)
+    # Sem a contração incremental: cada modo contrai a entrada inteira
+    opcoes = {
+        "memoria": dict(ordenado=False, buckets=1, conflitos=False),
+        "memoria+conflitos": dict(ordenado=False, buckets=1, conflitos=True),
+        "particoes": dict(ordenado=False, buckets=buckets, conflitos=False),
+        "particoes+conflitos": dict(ordenado=False, buckets=buckets, conflitos=True),
+        "sequencial": dict(ordenado=True),
+    }[modo]
+    opcoes["incremental"] = False
+    inicio = time.perf_counter()
+    registros = SIHContractor(arquivo_entrada=entrada, arquivo_saida=saida, **opcoes).contrair()
+    return {
+        "modo": modo,
+        "tempo_s": time.perf_counter() - inicio,
+        "pico_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "registros": registros,
+    }
+
+
+def totais(arquivo: Path) -> tuple:
+    """Totais que não dependem da ordem das linhas (conferência entre os modos)"""
+    return pl.scan_parquet(arquivo).select(
+        pl.len(), pl.col("VAL_TOT").sum().round(2), pl.col("CNES").sum(), pl.col("IDADE").cast(pl.Int64).sum()
+    ).collect(engine="streaming").row(0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--linhas", type=int, default=23_800_000)
+    parser.add_argument("--buckets", type=int, default=16)
+    parser.add_argument("--dir", type=Path, default=Path("/tmp/bench_contracao"))
+    parser.add_argument("--modos", nargs="+", default=[
+        "memoria", "memoria+conflitos", "particoes", "particoes+conflitos", "sequencial"
+    ])
+    args = parser.parse_args()
+
+    args.dir.mkdir(parents=True, exist_ok=True)
+    # A contração sequencial lê a entrada ordenada; os modos por hash, as mesmas linhas fora de ordem
+    entradas = {}
+    for ordenada in (True, False):
+        entradas[ordenada] = args.dir / f"tratado_{args.linhas}{'' if ordenada else '_embaralhado'}.parquet"
+        if not entradas[ordenada].exists():
+            logger.info(f"Gerando {args.linhas:,} linhas {'ordenadas por N_AIH' if ordenada else 'embaralhadas'}: "
+                        f"{entradas[ordenada]}")
+            gerar_entrada(entradas[ordenada], args.linhas, ordenada)
+
+    resultados, conferencia = [], {}
+    contexto = multiprocessing.get_context("spawn")
+    for modo in args.modos:
+        saida = args.dir / f"contraido_{modo}.parquet"
+        with contexto.Pool(1) as pool:
+            entrada = entradas[modo == "sequencial"]
+            resultados.append(pool.apply(executar_modo, (entrada, saida, modo, args.buckets)))
+        conferencia[modo] = totais(saida)
+        logger.info(f"{modo}: {resultados[-1]['tempo_s']:.1f}s, pico {resultados[-1]['pico_rss_mb']:,.0f} MB")
+
+    iguais = len(set(conferencia.values())) == 1
+    logger.info("=" * 60)
+    logger.info(f"Entrada: {args.linhas:,} linhas | resultados {'idênticos' if iguais else 'DIVERGENTES'} entre os modos")
+    with pl.Config(tbl_rows=len(resultados), float_precision=1):
+        print(pl.DataFrame(resultados))
+    if not iguais:
+        raise SystemExit(f"Totais divergentes: {conferencia}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,359 @@
+"""
+Microbenchmark do tratamento de chunks do pré-processamento
+Localização: projeto_sih/src/reports/benchmark_preprocess.py
+Função: Compara linhas/s do plano fundido (tratar_chunk_completo) com a implementação
+sequencial anterior (tratar_chunk_sequencial, congelada aqui) sobre o mesmo chunk e confere que os resultados são iguais.
+Mede também a decodificação das datas: strptime (implementação anterior) x aritmética inteira (data/rules.decodificar_datas).
+Com --regras, mostra também o tempo e as linhas afetadas de cada regra do registro (data/rules.py)
+
+Uso: python src/reports/benchmark_preprocess.py [--uf RS] [--linhas 100000] [--repeticoes 5] [--regras]
+"""
+import sys
+import time
+import argparse
+import logging
+from pathlib import Path
+
+import numpy as np
+import polars as pl
+from polars.testing import assert_frame_equal
+
+SRC_DIR = Path(__file__).parent.parent
+sys.path.insert(0, str(SRC_DIR))
+from config.settings import Settings
+from data.chunks import iterar_chunks, resolver_entrada
+from data.preprocess import SIHPreprocessor
+from data.rules import (
+    CAMPOS_CID, CAMPOS_DATAS, CAMPOS_MUNICIPIO, CAMPOS_VALORES, COLS_INT8, COLS_INT16, COLS_INT32, COLS_INT64,
+    decodificar_datas, dicionario_cid10, perfilar,
+)
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+def chunk_sintetico(linhas: int, semente: int = 42) -> pl.DataFrame:
+    """Chunk com as colunas da unificação e valores no formato do DATASUS (inclui sujeira)"""
+    rng = np.random.default_rng(semente)
+
+    def codigos(n_digitos, vazios=0.05):
+        valores = rng.integers(0, 10 ** n_digitos, linhas).astype(str)
+        valores = np.char.zfill(valores, n_digitos)
+        valores[rng.random(linhas) < vazios] = ""
+        return valores
+
+    def datas(inicio, dias):
+        base = np.datetime64(inicio) + rng.integers(0, dias, linhas).astype("timedelta64[D]")
+        return np.char.replace(np.datetime_as_string(base, unit="D"), "-", "")
+
+    cids = np.array(["A09", "I219", "J189", "O800", "0000", "", "  z99 "])
+    dados = {
+        "N_AIH": (rng.integers(4300000000000, 4399999999999, linhas)).astype(str),
+        "CNES": codigos(7, 0),
+        "CEP": codigos(8),
+        "MUNIC_RES": np.where(rng.random(linhas) < 0.02, "530070", codigos(6)),
+        "MUNIC_MOV": codigos(6),
+        "NASC": datas("1930-01-01", 30000),
+        "DT_INTER": datas("2008-01-01", 5000),
+        "DT_SAIDA": datas("2008-01-15", 5000),
+        "PROC_REA": codigos(10, 0.01),
+        "VAL_SH": np.char.replace(np.round(rng.random(linhas) * 5000, 2).astype(str), ".", ","),
+        "VAL_SP": np.round(rng.random(linhas) * 1000, 2).astype(str),
+        "VAL_TOT": np.zeros(linhas).astype(str),
+        "VAL_UTI": np.round(rng.random(linhas) * 200, 2).astype(str),
+        "NACIONAL": rng.choice(["0", "10", "20", ""], linhas),
+        "RACA_COR": rng.choice(["01", "02", "03", "04", "05", "99"], linhas),
+        "ETNIA": rng.choice(["0000", "0001", "0150", ""], linhas),
+        "DIAG_PRINC": rng.choice(cids, linhas),
+        "DIAG_SECUN": rng.choice(cids, linhas),
+        "CID_NOTIF": rng.choice(cids, linhas),
+        "CID_ASSO": rng.choice(cids, linhas),
+        "CID_MORTE": rng.choice(cids, linhas),
+    }
+    df = pl.DataFrame(dados)
+
+    # Demais colunas da unificação com códigos curtos
+    for col in ["ESPEC", "IDENT", "SEXO", "UTI_MES_TO", "MARCA_UTI", "UTI_INT_TO", "DIAR_ACOM",
+                "NATUREZA", "NAT_JUR", "GESTAO", "IND_VDRL", "IDADE", "MORTE", "DIAS_PERM",
+                "NUM_FILHOS", "INSTRU", "CONTRACEP1", "CONTRACEP2", "GESTRICO", "INSC_PN",
+                "CBOR", "CNAER", "VINCPREV", "INFEHOSP", "COMPLEX"]:
+        if col not in df.columns:
+            df = df.with_columns(pl.Series(col, codigos(2, 0.1)))
+    return df
+
+
+def chunk_real(uf: str, linhas: int) -> pl.DataFrame:
+    """Primeiro chunk do dataset unificado da UF"""
+    arquivos = resolver_entrada(Settings.get_unificado_dir(uf))
+    if not arquivos:
+        raise FileNotFoundError(f"Dataset unificado da UF {uf} não encontrado")
+    chunk, _, _ = next(iterar_chunks(arquivos, linhas))
+    return chunk
+
+
+def tratar_chunk_sequencial(df: pl.DataFrame) -> pl.DataFrame:
+    """
+    Implementação anterior ao plano fundido (congelada), um with_columns por coluna e
+    etapa: referência para conferir a equivalência e medir o ganho de data/rules.aplicar.
+    """
+
+    # collect_schema funciona para DataFrame e LazyFrame sem materializar dados
+    colunas = set(df.collect_schema().names())
+
+    # Conversão dos grupos, respeitando a existência das colunas
+    for col in COLS_INT64:
+        if col in colunas:
+            df = df.with_columns(pl.col(col).cast(pl.Int64, strict=False).fill_null(0))
+
+    for col in COLS_INT32:
+        if col in colunas:
+            df = df.with_columns(pl.col(col).cast(pl.Int32, strict=False).fill_null(0))
+
+    for col in COLS_INT16:
+        if col in colunas:
+            df = df.with_columns(pl.col(col).cast(pl.Int16, strict=False).fill_null(0))
+
+    for col in COLS_INT8:
+        if col in colunas:
+            df = df.with_columns(pl.col(col).cast(pl.Int8, strict=False).fill_null(0))
+
+
+    # Converte campos de valor de texto para float, tratando vírgulas
+    for col in CAMPOS_VALORES:
+        if col in colunas:
+            df = df.with_columns(
+                pl.col(col)
+                .cast(pl.String, strict=False)
+                .str.replace_all(",", ".")
+                .str.replace_all(" ", "")
+                .str.replace_all("-", "")
+                .cast(pl.Float64, strict=False)
+                .fill_null(0.0)
+                .clip(lower_bound=0.0)
+                .alias(col)
+            )
+
+    if 'VAL_UTI' not in colunas:
+        df = df.with_columns(pl.lit(0.0).cast(pl.Float64).alias('VAL_UTI'))
+        colunas.add('VAL_UTI')
+
+    # ETAPA 2: Recalcula e substitui 'VAL_TOT' pela soma dos componentes.
+    # Esta é a nova "fonte da verdade" para o valor total.
+    df = df.with_columns(
+        (
+            pl.col("VAL_SH") + 
+            pl.col("VAL_SP") + 
+            pl.col("VAL_UTI")
+        ).alias("VAL_TOT")
+    )
+
+    # Trata campos de data
+    for col in CAMPOS_DATAS:
+        if col in colunas:
+            df = df.with_columns([
+                pl.col(col).cast(pl.String).str.strptime(pl.Date, format="%Y%m%d", strict=False).alias(col)
+            ])
+
+    # Calcula a idade de forma precisa
+    if 'DT_INTER' in colunas and 'NASC' in colunas:
+        df = df.with_columns([
+            (pl.col("DT_INTER").dt.year() - pl.col("NASC").dt.year() -
+             pl.when(
+                 (pl.col("DT_INTER").dt.month() < pl.col("NASC").dt.month()) |
+                 ((pl.col("DT_INTER").dt.month() == pl.col("NASC").dt.month()) &
+                  (pl.col("DT_INTER").dt.day() < pl.col("NASC").dt.day()))
+             )
+             .then(1)
+             .otherwise(0)
+            )
+            .clip(0, 150)
+            .cast(pl.Int16)
+            .alias("IDADE")
+        ])
+
+    # Calcula DIAS_PERM a partir das datas
+    if 'DT_INTER' in colunas and 'DT_SAIDA' in colunas:
+        df = df.with_columns(
+            (pl.col("DT_SAIDA") - pl.col("DT_INTER")).dt.total_days().alias("DIAS_PERM")
+        )
+        df = df.with_columns(
+            pl.col("DIAS_PERM").cast(pl.Int16, strict=False).fill_null(0)
+        )
+
+    # Padronização dos códigos de município para 6 dígitos/ Mapeamento de valores não encontrado
+    # === Tratamento dos códigos de município  ===
+    # Padronização dos códigos de município para 6 dígitos/ Mapeamento de valores não encontrado
+    for col in CAMPOS_MUNICIPIO:
+        if col in colunas:
+            df = df.with_columns(
+                pl.col(col)
+                .cast(pl.String, strict=False)
+                .str.strip_chars()
+                .fill_null("000000")
+
+                # --- LÓGICA DE GENERALIZAÇÃO PARA O DISTRITO FEDERAL ---
+                .pipe(lambda s:
+                    # SE o código começar com '53' (prefixo do DF)
+                    pl.when(s.str.starts_with("53"))
+                    .then(pl.lit("530010"))  # ENTÃO, substitui pelo código unificado de Brasília
+                    .otherwise(s)           # SENÃO, mantém o código original
+                )
+
+                # Continua com a padronização geral para 6 dígitos
+                .str.slice(0, 6)
+                .str.pad_start(length=6, fill_char='0')
+
+                .cast(pl.Int64, strict=False)  # Tenta converter o string limpo para inteiro de 64 bits
+                .fill_null(0)                  # Preenche 0 (código ignorado) caso o cast falhe
+                .clip(lower_bound=0)           # Garante que não há valores negativos (correção do clip)
+
+                .alias(col)
+            )
+
+
+    # Tratamento da coluna NACIONAL
+    if 'NACIONAL' in colunas:
+        df = df.with_columns(
+            # 1. Usa a lógica WHEN/THEN/OTHERWISE como a expressão principal
+            pl.when(pl.col("NACIONAL") == 0)
+            .then(pl.lit(10)) # Substitui 0 por 10
+            .otherwise(pl.col("NACIONAL"))
+
+            # 2. Aplica o limite no resultado da condição
+
+            .clip(lower_bound=0, upper_bound=350) 
+
+            .alias("NACIONAL") # Nomeia a coluna final
+        )
+
+    # === Tratamento de RACA_COR e ETNIA ===
+    if "RACA_COR" in colunas and "ETNIA" in colunas:
+        df = df.with_columns([
+            pl.col("RACA_COR")
+            .cast(pl.Int8, strict=False)
+            .fill_null(0)
+            .clip(lower_bound=0, upper_bound=99)
+            .alias("RACA_COR"),
+
+            pl.col("ETNIA")
+            .cast(pl.Int16, strict=False)  # precisa ser Int16 pois vai até 264
+            .fill_null(0)
+            .clip(lower_bound=0, upper_bound=264)
+            .alias("ETNIA")
+        ])
+
+        # Se RACA_COR != 5 e ETNIA for válida (≠ 0)
+        df = df.with_columns(
+            pl.when((pl.col("RACA_COR") != 5) & (pl.col("ETNIA") != 0))
+            .then(pl.lit(5))
+            .otherwise(pl.col("RACA_COR"))
+            .alias("RACA_COR")
+        )
+
+
+    # Padronização do código de procedimento (PROC_REA)
+    if "PROC_REA" in colunas:
+        df = df.with_columns(
+            pl.col("PROC_REA")
+            .cast(pl.Int64, strict=False)
+            .fill_null(0)
+            .clip(lower_bound=0)
+            .alias("PROC_REA")
+        )
+
+
+
+    # Tratamento de campos CID
+    for col in CAMPOS_CID:
+        if col in colunas:
+            df = df.with_columns(
+                pl.col(col)
+                .cast(pl.String, strict=False)  # Garante que é texto
+                .str.strip_chars()              # Remove espaços, transformando '  ' em ''
+                .str.to_uppercase()             # Converte para maiúsculas
+
+                # --- LÓGICA DE PADRONIZAÇÃO APRIMORADA ---
+                .pipe(lambda s: 
+                    # SE a string for vazia, nula, OU contiver apenas zeros (ex: '0', '00', '0000')
+                    pl.when(
+                        s.is_in([""]) | 
+                        s.is_null() | 
+                        s.str.contains(r"^0+$") # Regex: ^ (início), 0+ (um ou mais zeros), $ (fim)
+                    )
+                    .then(pl.lit("0"))  # ENTÃO, substitui por um único '0'
+                    .otherwise(s)       # SENÃO, mantém o valor original
+                )
+                .cast(dicionario_cid10(), strict=False)  # Enum do CID-10 (fora do dicionário → nulo)
+                .alias(col)
+            )
+
+    # Garante que N_AIH não seja nulo para evitar problemas posteriores
+    df = df.filter(pl.col("N_AIH").is_not_null())
+
+    return df
+
+
+def datas_strptime(chunk: pl.DataFrame) -> pl.DataFrame:
+    colunas = [c for c in CAMPOS_DATAS if c in chunk.columns]
+    return chunk.lazy().select(
+        pl.col(c).cast(pl.String).str.strptime(pl.Date, format="%Y%m%d", strict=False) for c in colunas
+    ).collect()
+
+
+def datas_inteiro(chunk: pl.DataFrame) -> pl.DataFrame:
+    colunas = [c for c in CAMPOS_DATAS if c in chunk.columns]
+    return decodificar_datas(chunk.lazy().select(colunas), colunas).collect()
+
+
+def medir(funcao, chunk: pl.DataFrame, repeticoes: int) -> float:
+    """Melhor tempo (s) entre as repetições"""
+    tempos = []
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        funcao(chunk)
+        tempos.append(time.perf_counter() - inicio)
+    return min(tempos)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--uf", help="Usa o dataset unificado da UF em vez de dados sintéticos")
+    parser.add_argument("--linhas", type=int, default=100_000)
+    parser.add_argument("--repeticoes", type=int, default=5)
+    parser.add_argument("--regras", action="store_true", help="Custo e linhas afetadas por regra de limpeza")
+    args = parser.parse_args()
+
+    chunk = chunk_real(args.uf, args.linhas) if args.uf else chunk_sintetico(args.linhas)
+    preprocessor = SIHPreprocessor()
+    sequencial = tratar_chunk_sequencial(chunk)
+    fundido = preprocessor.tratar_chunk_completo(chunk)
+    assert_frame_equal(fundido, sequencial)
+
+    t_seq = medir(tratar_chunk_sequencial, chunk, args.repeticoes)
+    t_fun = medir(preprocessor.tratar_chunk_completo, chunk, args.repeticoes)
+
+    por_texto, por_inteiro = datas_strptime(chunk), datas_inteiro(chunk)
+    divergentes = sum(por_texto[c].ne_missing(por_inteiro[c]).sum() for c in por_texto.columns)
+    t_strptime = medir(datas_strptime, chunk, args.repeticoes)
+    t_inteiro = medir(datas_inteiro, chunk, args.repeticoes)
+
+    if args.regras:
+        por_regra, relatorio = perfilar(chunk, preprocessor.regras)
+        assert_frame_equal(por_regra, fundido)
+
+    logger.info("=" * 60)
+    logger.info(f"Chunk: {chunk.height:,} linhas x {chunk.width} colunas ({'UF ' + args.uf if args.uf else 'sintético'})")
+    logger.info(f"Sequencial: {t_seq * 1000:8.1f} ms  ({chunk.height / t_seq:12,.0f} linhas/s)")
+    logger.info(f"Fundido:    {t_fun * 1000:8.1f} ms  ({chunk.height / t_fun:12,.0f} linhas/s)")
+    logger.info(f"Ganho: {t_seq / t_fun:.2f}x (resultados idênticos)")
+    logger.info(f"Datas strptime: {t_strptime * 1000:8.1f} ms | inteiro: {t_inteiro * 1000:8.1f} ms "
+                f"({t_strptime / t_inteiro:.2f}x, {divergentes} valores divergentes)")
+    logger.info("=" * 60)
+
+    if args.regras:
+        with pl.Config(tbl_rows=relatorio.height, tbl_width_chars=160, float_precision=2):
+            print(relatorio.sort("tempo_ms", descending=True))
+
+
+if __name__ == "__main__":
+    main()
@@ -13,16 +13,17 @@ logger = logging.getLogger(__name__)
 def verificar_etnia():
     """Verifica a contagem de registros de etnia válidos e inválidos."""
     try:
-        caminho_arquivo = Settings.INTERIM_DIR / Settings.PARQUET_TREATED_FILENAME
+        caminhos = [Settings.get_linhas_tratadas_path(uf) for uf in Settings.UF_DEFAULT]
+        caminhos = [c for c in caminhos if c.exists()]
         
-        if not caminho_arquivo.exists():
-            logger.error(f"Arquivo de entrada não encontrado: {caminho_arquivo}")
+        if not caminhos:
+            logger.error(f"Nenhum arquivo tratado encontrado para as UFs: {Settings.UF_DEFAULT}")
             return
 
-        logger.info("Analisando dados de ETNIA...")
+        logger.info(f"Analisando dados de ETNIA ({len(caminhos)} UFs)...")
 
-        # Lê o arquivo
-        df = pl.read_parquet(caminho_arquivo)
+        # Lê apenas a coluna necessária de todas as UFs
+        df = pl.read_parquet(caminhos, columns=["ETNIA"])
         
         # Define os valores inválidos
         valores_invalidos = ["0", "00", "000"]
@@ -0,0 +1,61 @@
+"""
+Relatório da quarentena do pré-processamento
+Localização: projeto_sih/src/reports/quarentena_report.py
+Função: Lê a quarentena de cada UF (tratado/uf=XX/sih_quarentena.parquet) e exporta as
+linhas alteradas ou descartadas por regra de limpeza (máscara REGRAS decodificada)
+
+Uso: python src/reports/quarentena_report.py [--ufs RS SC] [--saida reports/quarentena]
+"""
+import sys
+import argparse
+import logging
+from pathlib import Path
+
+import polars as pl
+
+SRC_DIR = Path(__file__).parent.parent
+sys.path.insert(0, str(SRC_DIR))
+from config.settings import Settings
+from data.rules import REGRAS, resumo_quarentena
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+def resumo_uf(uf: str) -> pl.DataFrame:
+    """Linhas em quarentena por regra de uma UF, com o percentual sobre o dataset tratado"""
+    arquivo = Settings.get_quarentena_path(uf)
+    registros = pl.scan_parquet(Settings.get_linhas_tratadas_path(uf)).select(pl.len()).collect().item()
+    # Linhas descartadas pelos filtros só existem na quarentena
+    return resumo_quarentena(pl.scan_parquet(arquivo), REGRAS).with_columns(
+        pl.lit(uf).alias("uf"),
+        (100.0 * pl.col("linhas") / registros if registros else pl.lit(0.0)).alias("pct_registros"),
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--ufs", nargs="+", default=Settings.UF_DEFAULT)
+    parser.add_argument("--saida", type=Path, default=Path("reports/quarentena"))
+    args = parser.parse_args()
+
+    resumos = []
+    for uf in args.ufs:
+        if not Settings.get_quarentena_path(uf).exists():
+            logger.warning(f"Quarentena da UF {uf} não encontrada (PREPROCESS_QUARENTENA desativada?): {Settings.get_quarentena_path(uf)}")
+            continue
+        resumos.append(resumo_uf(uf))
+    if not resumos:
+        return
+
+    resumo = pl.concat(resumos).select("uf", "regra", "bit", "linhas", "pct_quarentena", "pct_registros")
+    args.saida.mkdir(parents=True, exist_ok=True)
+    arquivo = args.saida / "resumo.csv"
+    resumo.write_csv(arquivo)
+    with pl.Config(tbl_rows=resumo.height, float_precision=2):
+        print(resumo.sort(["uf", "linhas"], descending=[False, True]))
+    logger.info(f"Resumo da quarentena exportado para {arquivo}")
+
+
+if __name__ == "__main__":
+    main()